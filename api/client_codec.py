@@ -0,0 +1,119 @@
+import json
+import zlib
+import base64
+
+# Storage format of clients.data.
+# Saves used to store json.dumps of the whole request: every empty form field, UI flags and
+# copies of columns. encode() drops unset values (None and '') and request-only keys, keeps the fields the
+# database itself reads (generated columns, list summary, search) as plain JSON keys, and packs
+# everything else into one "_z1" key: zlib with a preset dictionary built from the form's field
+# names, base64-encoded. `data` stays valid JSON, so json_extract() / client_field() still work.
+# decode() accepts both the packed form and legacy plain JSON.
+
+PACKED_KEY = '_z1'
+
+# Read inside SQL (CLIENT_FIELD_COLUMNS, CLIENT_SUMMARY_DATA_KEYS); never packed
+HOT_KEYS = (
+    'nome_proponente', 'razao_social_proponente', 'cpf_cnpj_proponente', 'tipo_pessoa',
+    'email_proponente', 'cidade_proponente', 'uf_endereco_proponente', 'estado_civil_proponente',
+    'fone1_ddd_proponente', 'fone1_numero_proponente',
+)
+
+# Request-only keys: row columns (id, created_by) or flags that only matter while saving
+DROP_KEYS = ('id', 'client_id', 'created_by', 'lot', 'salvar_vinculo_segundo')
+
+# Field names of ClientFormModal, in form order. The dictionary below is derived from this list,
+# so it must never be edited in place: a changed dictionary needs a new PACKED_KEY (e.g. "_z2").
+FORM_FIELDS = (
+    'nome_proponente', 'cpf_cnpj_proponente', 'rg_proponente', 'orgao_emissor_proponente',
+    'uf_rg_proponente', 'data_nascimento_proponente', 'sexo', 'naturalidade_proponente',
+    'uf_naturalidade_proponente', 'nacionalidade_proponente', 'estado_civil_proponente',
+    'regime_casamento_proponente', 'profissao_proponente', 'local_trabalho_proponente',
+    'email_proponente', 'fone1_ddd_proponente', 'fone1_numero_proponente', 'fone2_ddd_proponente',
+    'fone2_numero_proponente', 'fone_comercial_ddd_proponente', 'fone_comercial_numero_proponente',
+    'endereco_residencial_proponente', 'numero_endereco_proponente', 'bairro_proponente',
+    'cidade_proponente', 'uf_endereco_proponente', 'cep_proponente', 'inscricao_estadual_proponente',
+    'data_fundacao_proponente', 'has_referencia_titular', 'nome_referencia_proponente',
+    'fone_referencia_ddd_proponente', 'fone_referencia_numero_proponente',
+    'parentesco_referencia_proponente', 'has_segundo', 'tipo_segundo', 'nome_segundo',
+    'cpf_cnpj_segundo', 'rg_segundo', 'orgao_emissor_segundo', 'uf_rg_segundo',
+    'data_nascimento_segundo', 'sexo_seg', 'naturalidade_segundo', 'uf_naturalidade_segundo',
+    'nacionalidade_segundo', 'estado_civil_segundo', 'regime_casamento_segundo', 'profissao_segundo',
+    'local_trabalho_segundo', 'email_segundo', 'fone1_ddd_segundo', 'fone1_numero_segundo',
+    'fone2_ddd_segundo', 'fone2_numero_segundo', 'fone_comercial_ddd_segundo',
+    'fone_comercial_numero_segundo', 'endereco_residencial_segundo', 'numero_endereco_segundo',
+    'bairro_segundo', 'cidade_segundo', 'uf_endereco_segundo', 'cep_segundo', 'razao_social_segundo',
+    'nome_fantasia_segundo', 'inscricao_estadual_segundo', 'has_referencia_segundo',
+    'nome_referencia_segundo', 'fone_referencia_ddd_segundo', 'fone_referencia_numero_segundo',
+    'parentesco_referencia_segundo', 'sexo_masc_proponente', 'sexo_fem_proponente', 'tipo_conjuge',
+    'tipo_segundo_proponente', 'tipo_procurador', 'sexo_masc_segundo', 'sexo_fem_segundo',
+    'tipo_pessoa_segundo', 'razao_social_proponente', 'nome_fantasia_proponente', 'nome', 'cpf_cnpj',
+)
+COMMON_VALUES = (
+    'BRASILEIRO', 'BRASILEIRA', 'SOLTEIRO', 'CASADO', 'DIVORCIADO', 'VIUVO', 'UNIAO ESTAVEL',
+    'COMUNHAO PARCIAL DE BENS', 'SSP', 'PA', 'conjuge', 'segundo', 'procurador', 'PF', 'PJ',
+)
+
+# zlib weighs the end of the dictionary most, so the values come last
+ZDICT = (
+    ','.join(f'"{name}":' for name in FORM_FIELDS) + ',' +
+    ','.join(f'"{value}"' for value in COMMON_VALUES) + ',true,'
+).encode('utf-8')
+
+
+def _empty(value):
+    # Only unset fields: False, 0 and empty lists are answers the form can read back
+    return value is None or value == ''
+
+
+def _compress(raw):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _decompress(raw):
+    decompressor = zlib.decompressobj(-15, ZDICT)
+    return decompressor.decompress(raw) + decompressor.flush()
+
+
+def encode(data):
+    """JSON text for clients.data from the submitted form dict."""
+    if not isinstance(data, dict):
+        return json.dumps(data)
+    hot, cold = {}, {}
+    for key, value in data.items():
+        if key in DROP_KEYS or key == PACKED_KEY or _empty(value):
+            continue
+        (hot if key in HOT_KEYS else cold)[key] = value
+    if cold:
+        packed = _compress(json.dumps(cold, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        hot[PACKED_KEY] = base64.b64encode(packed).decode('ascii')
+    return json.dumps(hot, separators=(',', ':'), ensure_ascii=False)
+
+
+def decode(raw):
+    """Form dict from clients.data (packed or legacy JSON text, or an already decoded dict)."""
+    if isinstance(raw, dict):
+        data = dict(raw)
+    elif not raw:
+        return {}
+    else:
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+    packed = data.pop(PACKED_KEY, None)
+    if packed:
+        try:
+            cold = json.loads(_decompress(base64.b64decode(packed)).decode('utf-8'))
+        except (ValueError, zlib.error):
+            cold = {}
+        for key, value in cold.items():
+            data.setdefault(key, value)
+    return data
+
+
+def is_packed(raw):
+    return isinstance(raw, str) and f'"{PACKED_KEY}":' in raw
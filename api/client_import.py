@@ -0,0 +1,150 @@
+import io
+import csv
+import json
+import re
+import numpy as np
+
+# Parsing and validation for POST /api/clients/import.
+# Rows are CSV (',' ';' or tab, as exported by Excel) or NDJSON objects using the same field
+# names as the client form; every row becomes a prepared record or a per-line error, and the
+# database side (duplicate lookup, batched writes) lives in index.py.
+
+CPF_WEIGHTS_1 = np.arange(10, 1, -1)
+CPF_WEIGHTS_2 = np.arange(11, 1, -1)
+CNPJ_WEIGHTS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+CNPJ_WEIGHTS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+NAME_FIELDS = ('nome', 'nome_proponente', 'razao_social_proponente')
+DOCUMENT_FIELDS = ('cpf_cnpj', 'cpf_cnpj_proponente', 'cpf', 'cnpj')
+
+
+def _digit_matrix(values, width):
+    """Equal-length digit strings -> (n, width) int matrix without a Python loop per digit."""
+    raw = np.frombuffer(''.join(values).encode('ascii'), dtype=np.uint8)
+    return raw.reshape(-1, width).astype(np.int64) - 48
+
+
+def valid_cpfs(values):
+    """Check-digit validation of 11-digit strings; repeated digits (111.111.111-11) are rejected."""
+    if not values:
+        return np.zeros(0, dtype=bool)
+    d = _digit_matrix(values, 11)
+    dv1 = (d[:, :9] @ CPF_WEIGHTS_1) * 10 % 11 % 10
+    dv2 = (d[:, :10] @ CPF_WEIGHTS_2) * 10 % 11 % 10
+    repeated = (d == d[:, :1]).all(axis=1)
+    return (dv1 == d[:, 9]) & (dv2 == d[:, 10]) & ~repeated
+
+
+def valid_cnpjs(values):
+    if not values:
+        return np.zeros(0, dtype=bool)
+    d = _digit_matrix(values, 14)
+    r1 = (d[:, :12] @ CNPJ_WEIGHTS_1) % 11
+    r2 = (d[:, :13] @ CNPJ_WEIGHTS_2) % 11
+    dv1 = np.where(r1 < 2, 0, 11 - r1)
+    dv2 = np.where(r2 < 2, 0, 11 - r2)
+    repeated = (d == d[:, :1]).all(axis=1)
+    return (dv1 == d[:, 12]) & (dv2 == d[:, 13]) & ~repeated
+
+
+def _decode(raw):
+    if isinstance(raw, str):
+        return raw
+    try:
+        return raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Planilhas salvas no Excel em português costumam vir em Latin-1
+        return raw.decode('latin-1')
+
+
+def parse_records(raw, fmt):
+    """[(line, dict)] from a CSV or NDJSON body; unparseable NDJSON lines become (line, None)."""
+    text = _decode(raw)
+    if fmt == 'ndjson':
+        records = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+            records.append((line_no, obj if isinstance(obj, dict) else None))
+        return records
+
+    sample = text[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    records = []
+    for row in reader:
+        clean = {str(k).strip(): (v.strip() if isinstance(v, str) else v)
+                 for k, v in row.items() if k is not None}
+        if not any(clean.values()):
+            continue
+        # Header is line 1, so the first data row is line 2
+        records.append((reader.line_num, clean))
+    return records
+
+
+def detect_format(content_type, filename):
+    content_type = (content_type or '').lower()
+    filename = (filename or '').lower()
+    if 'ndjson' in content_type or 'jsonl' in content_type or filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def _first(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def prepare_rows(records, default_tipo='PF'):
+    """Normalize and validate parsed records.
+
+    Returns a list of dicts with line, nome, tipo_pessoa, cpf_digits, data and, for rejected
+    rows, status='invalid' plus an error message. Check digits are verified in one vectorized
+    pass per document type; repeated documents inside the file keep only the first row.
+    """
+    rows = []
+    for line, record in records:
+        if record is None:
+            rows.append({'line': line, 'status': 'invalid', 'error': 'Linha não é um objeto JSON válido'})
+            continue
+        nome = _first(record, NAME_FIELDS)
+        digits = re.sub(r'\D', '', _first(record, DOCUMENT_FIELDS))
+        tipo = str(record.get('tipo_pessoa') or '').strip().upper()
+        if not tipo:
+            tipo = 'PJ' if len(digits) == 14 else ('PF' if len(digits) == 11 else default_tipo)
+        row = {'line': line, 'nome': nome, 'tipo_pessoa': tipo, 'cpf_digits': digits, 'data': record}
+        if not nome or not digits:
+            row.update(status='invalid', error='Nome e CPF/CNPJ são obrigatórios')
+        elif tipo not in ('PF', 'PJ'):
+            row.update(status='invalid', error='tipo_pessoa deve ser PF ou PJ')
+        elif len(digits) != (11 if tipo == 'PF' else 14):
+            row.update(status='invalid', error='CPF deve ter 11 dígitos' if tipo == 'PF' else 'CNPJ deve ter 14 dígitos')
+        rows.append(row)
+
+    for tipo, check in (('PF', valid_cpfs), ('PJ', valid_cnpjs)):
+        pending = [r for r in rows if 'status' not in r and r['tipo_pessoa'] == tipo]
+        ok = check([r['cpf_digits'] for r in pending])
+        for row, valid in zip(pending, ok):
+            if not valid:
+                row.update(status='invalid', error='CPF inválido' if tipo == 'PF' else 'CNPJ inválido')
+
+    seen = {}
+    for row in rows:
+        if 'status' in row:
+            continue
+        key = (row['tipo_pessoa'], row['cpf_digits'])
+        if key in seen:
+            row.update(status='invalid', error=f"CPF/CNPJ repetido no arquivo (linha {seen[key]})")
+        else:
+            seen[key] = row['line']
+    return rows
@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# Static snapshot publisher for availability data.
+# Each obra is written as <codigo>.<hash>.json and indexed by manifest.json, so Cloudflare Pages
+# can serve availability straight from the edge without hitting Flask (Pages compresses it).
+# The manifest is a read-modify-write shared by every worker process and by push_consulta.py, so
+# updates hold an exclusive lock on manifest.json.lock and re-read the manifest under it.
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'manifest.json.lock'
+KEEP_VERSIONS = int(os.environ.get('CONSULTA_PUBLISH_KEEP', '2'))
+# Obras allowed into the static tier (comma-separated codes); empty publishes none. Every other
+# obra is only ever served by the per-user checked API.
+PUBLISH_OBRAS = frozenset(c.strip() for c in os.environ.get('CONSULTA_PUBLISH_OBRAS', '').split(',') if c.strip())
+
+_lock = threading.Lock()
+
+
+def _atomic_write(path, content):
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _manifest_lock(publish_dir):
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(publish_dir, LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def enrich_consulta_payload(payload):
+    """Guarantee Data_Atualizacao exists at root and items for frontend footer."""
+    if not payload:
+        return payload or {"data": []}
+    def parse_date_str(val):
+        if not val:
+            return None
+        try:
+            parts = str(val).split('/')
+            if len(parts) == 3:
+                d, m, y = [int(p) for p in parts]
+                return datetime.date(y, m, d)
+            # fallback ISO
+            return datetime.date.fromisoformat(str(val))
+        except Exception:
+            return None
+
+    last_update = None
+    data_list = payload.get("data") if isinstance(payload, dict) and isinstance(payload.get("data"), list) else None
+    if isinstance(payload, dict):
+        last_update = parse_date_str(payload.get("Data_Atualizacao"))
+
+    if data_list:
+        for item in data_list:
+            if not isinstance(item, dict):
+                continue
+            d = parse_date_str(item.get("Data_Atualizacao"))
+            if d and (last_update is None or d > last_update):
+                last_update = d
+
+    if last_update is None and data_list and isinstance(data_list[0], dict):
+        last_update = parse_date_str(data_list[0].get("Data_Atualizacao"))
+
+    if last_update:
+        formatted = last_update.strftime('%d/%m/%Y')
+        if data_list:
+            for item in data_list:
+                if isinstance(item, dict) and not item.get("Data_Atualizacao"):
+                    item["Data_Atualizacao"] = formatted
+        if isinstance(payload, dict):
+            payload["Data_Atualizacao"] = formatted
+    return payload
+
+
+def load_manifest(publish_dir):
+    manifest_path = os.path.join(publish_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {"version": 1, "obras": {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and isinstance(manifest.get("obras"), dict):
+            return manifest
+    except Exception as e:
+        print(f"[PUBLISH] Invalid manifest at {manifest_path}: {e}")
+    return {"version": 1, "obras": {}}
+
+
+def _prune_old_versions(publish_dir, codigo, keep_files):
+    prefix = f"{codigo}."
+    candidates = []
+    for name in os.listdir(publish_dir):
+        if not name.startswith(prefix) or name in keep_files:
+            continue
+        if not name.endswith('.json'):
+            continue
+        candidates.append(os.path.join(publish_dir, name))
+    # Keep the most recent versions around so clients holding an older manifest still resolve
+    candidates.sort(key=os.path.getmtime, reverse=True)
+    for path in candidates[max(KEEP_VERSIONS - 1, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _withdraw(publish_dir, codigo):
+    """Drop an obra that left the allow-list from the manifest and delete its files."""
+    with _manifest_lock(publish_dir):
+        manifest = load_manifest(publish_dir)
+        if manifest["obras"].pop(codigo, None) is None:
+            return
+        _atomic_write(
+            os.path.join(publish_dir, MANIFEST_NAME),
+            json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8')
+        )
+        for name in os.listdir(publish_dir):
+            if name.startswith(f"{codigo}.") and name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(publish_dir, name))
+                except OSError:
+                    pass
+    print(f"[PUBLISH] {codigo} withdrawn (not in the publish allow-list)")
+
+
+def publish_snapshot(publish_dir, codigo, payload, allowed=None):
+    """Write a content-hashed snapshot of one obra and update the manifest.
+
+    allowed: obra codes that may be published (default PUBLISH_OBRAS); any other obra is not
+    written, and withdrawn if an earlier publish left it behind. Returns the manifest entry, or
+    None when nothing was written (not allowed, or content unchanged since the last publish).
+    """
+    codigo = str(codigo)
+    if codigo not in (PUBLISH_OBRAS if allowed is None else allowed):
+        if os.path.isdir(publish_dir):
+            _withdraw(publish_dir, codigo)
+        return None
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()
+    short_hash = digest[:12]
+
+    os.makedirs(publish_dir, exist_ok=True)
+    with _manifest_lock(publish_dir):
+        manifest = load_manifest(publish_dir)
+        current = manifest["obras"].get(codigo)
+        if current and current.get("sha256") == digest:
+            return None
+
+        file_name = f"{codigo}.{short_hash}.json"
+        _atomic_write(os.path.join(publish_dir, file_name), body)
+
+        data_list = payload.get("data") if isinstance(payload, dict) else None
+        entry = {
+            "file": file_name,
+            "sha256": digest,
+            "bytes": len(body),
+            "count": len(data_list) if isinstance(data_list, list) else 0,
+            "Data_Atualizacao": payload.get("Data_Atualizacao") if isinstance(payload, dict) else None,
+            "published_at": datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+        }
+        manifest["obras"][codigo] = entry
+        manifest["generated_at"] = entry["published_at"]
+        # Manifest is written last so readers never see an entry whose files are missing
+        _atomic_write(
+            os.path.join(publish_dir, MANIFEST_NAME),
+            json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8')
+        )
+        _prune_old_versions(publish_dir, codigo, {file_name})
+
+    print(f"[PUBLISH] {codigo} -> {file_name} ({len(body)} bytes)")
+    return entry
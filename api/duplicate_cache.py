@@ -0,0 +1,51 @@
+from ttl_cache import TTLCache
+
+# In-process cache of the CPF/CNPJ duplicate check, keyed by (tipo_pessoa, cpf_digits).
+# ClientFormModal checks the document while it is typed, so the same few keys are looked up again
+# and again. The unique index allows one holder per key, so an entry is that holder
+# ({id, nome}) or None when the key is free (negative entry), tagged with the holder's id.
+# Saves, deletes, bulk operations and imports drop the keys and client ids they touched (see
+# clients_changed in index.py). The cache only answers the as-you-type check: saves still rely
+# on the unique index.
+
+
+class DuplicateCache:
+    def __init__(self, ttl=30.0, max_entries=20000):
+        self._cache = TTLCache(ttl, max_entries)
+
+    def get_many(self, keys, loader):
+        """{key: holder or None} for (tipo_pessoa, cpf_digits) keys; loader(missing) -> {key: row} found."""
+        found, missing = {}, []
+        for key in keys:
+            if key in found or key in missing:
+                continue
+            hit, value = self._cache.lookup(key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+        # Load outside the lock; a concurrent miss for the same key just loads twice
+        generation = self._cache.generation()
+        loaded = loader(missing)
+        for key in missing:
+            row = loaded.get(key)
+            value = {'id': row['id'], 'nome': row.get('nome')} if row else None
+            self._cache.put(key, value, generation, tags=(str(value['id']),) if value else ())
+            found[key] = value
+        return found
+
+    def get(self, key, loader):
+        """Holder of one key or None; loader(key) -> row or None."""
+        return self.get_many([key], lambda missing: {key: loader(key)})[key]
+
+    def invalidate(self, keys=(), ids=()):
+        """Drop the given keys and whatever keys the given client ids held."""
+        self._cache.invalidate(keys=keys, tags=[str(client_id) for client_id in ids])
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
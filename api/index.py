@@ -2,12 +2,16 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
 import datetime
+import time
 import traceback
 import json
 import sqlite3
 import hashlib
+import re
+import base64
 import secrets
 import sys
+import tempfile
 import requests
 import jwt
 from functools import wraps
@@ -20,8 +24,33 @@ except ImportError as e:
     print(f"[WARN] Could not import generate_pdf_reportlab: {e}")
     generate_pdf_reportlab = None
 
+from consulta_publish import publish_snapshot, enrich_consulta_payload
+from snapshot_writer import DebouncedSnapshotWriter
+from sqlite_pool import SQLitePool
+from sqlite_writer import SQLiteWriter
+from permission_cache import PermissionCache
+from supabase_http import ResilientClient
+from replica import SupabaseReplica
+from repositories import PostgREST, ClientsRepo, UsersRepo, RepoError, SQLITE_MIN_VERSION
+from query_stats import QueryStats
+from duplicate_cache import DuplicateCache
+from list_cache import ListCache, ALL_OWNERS
+import client_codec
+
+try:
+    import lot_index
+except ImportError as e:
+    print(f"[WARN] Could not import lot_index: {e}")
+    lot_index = None
+
+try:
+    import client_import
+except ImportError as e:
+    print(f"[WARN] Could not import client_import: {e}")
+    client_import = None
+
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-DB-Queries', 'X-DB-Time-Ms', 'X-DB-Repeats', 'ETag', 'X-Cache'])
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key_valle_prime_v2')
 
@@ -35,193 +64,143 @@ else:
 # Supabase REST Config
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '').rstrip('/')
 SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('SUPABASE_ANON_KEY')
-
-def get_db_connection():
-    # Only SQLite fallback now
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn, 'sqlite'
-
-def query_supabase_rest(table, method='GET', params=None, data=None):
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        return None
-        
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
-    if params:
-        url += f"?{params}"
-    
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation" if method in ['POST', 'PATCH'] else ""
-    }
-    
+# Adaptive timeouts, jittered retries and hedged reads for every PostgREST call
+supabase_http = ResilientClient(
+    default_timeout=float(os.environ.get('SUPABASE_TIMEOUT', '5')),
+    write_timeout=float(os.environ.get('SUPABASE_WRITE_TIMEOUT', '15')),
+    hedge=os.environ.get('SUPABASE_HEDGE', '1').lower() not in ('0', 'false')
+)
+# 'exact' counts every row server-side; 'planned' uses the planner estimate (cheaper on huge tables)
+SUPABASE_COUNT_MODE = os.environ.get('SUPABASE_COUNT_MODE', 'exact')
+# Set once the generated client field columns from DEPLOY.md 2.6 exist in Supabase
+SUPABASE_CLIENT_FIELDS = os.environ.get('SUPABASE_CLIENT_FIELDS', '').lower() in ('1', 'true')
+
+# Queries per request (X-DB-* headers). QUERY_DEBUG=1 logs every request and warns past the
+# budget or when one fingerprint repeats QUERY_REPEAT_LIMIT times (N+1). Calls slower than
+# SLOW_QUERY_MS are logged as [SLOW QUERY]; per-fingerprint latency is at /api/queries/stats
+query_stats = QueryStats(
+    budget=int(os.environ.get('QUERY_BUDGET', '20')),
+    repeat_limit=int(os.environ.get('QUERY_REPEAT_LIMIT', '5')),
+    debug=os.environ.get('QUERY_DEBUG', '').lower() in ('1', 'true'),
+    slow_ms=float(os.environ.get('SLOW_QUERY_MS', '200'))
+)
+supabase_http.observer = query_stats.record_rest
+
+# Obras (empreendimentos) known to the system; keep in sync with src/context/authConstants.js
+OBRA_INFO = {
+    "600": {"cidade": "Dom Eliseu", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - DOM ELISEU"},
+    "601": {"cidade": "Capanema", "uf": "PA", "descricao": "RESIDENCIAL JARDIM AMERICA - CAPANEMA"},
+    "602": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL SALLES JARDIM - CASTANHAL"},
+    "603": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL JARDIM CASTANHAL - CASTANHAL"},
+    "604": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL IPITINGA - TOMÉ-AÇU"},
+    "605": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPITINGA - TOMÉ-AÇU"},
+    "610": {"cidade": "Tailândia", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - TAILANDIA"},
+    "616": {"cidade": "Barcarena", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - BARCARENA"},
+    "618": {"cidade": "Tailândia", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE II - TAILANDIA"},
+    "620": {"cidade": "Paragominas", "uf": "PA", "descricao": "RESIDENCIAL JARDIM VALLE DO URAIM - PARAGOMINAS"},
+    "621": {"cidade": "Rondon do Pará", "uf": "PA", "descricao": "RESIDENCIAL PARQUE DO VALLE - RONDON"},
+    "623": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL JARDIM CASTANHAL III - CASTANHAL"},
+    "624": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPITINGA II - TOMÉ-AÇU"},
+    "625": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPÊS - TOMÉ AÇU"},
+}
+
+# Last good upstream response per obra (fallback_<codigo>.json); point at a persistent disk if available.
+# A runtime directory, never api/: the fallback_*.json bundled there are a read-only last resort
+CONSULTA_FALLBACK_DIR = os.environ.get('CONSULTA_FALLBACK_DIR', os.path.join(tempfile.gettempdir(), 'consulta_fallback'))
+if os.path.realpath(CONSULTA_FALLBACK_DIR).startswith(os.path.realpath(tempfile.gettempdir()) + os.sep):
+    print(f"[CONSULTA] WARNING: fallback dir {CONSULTA_FALLBACK_DIR} is under the temp dir and is lost on "
+          "every redeploy/restart; set CONSULTA_FALLBACK_DIR to a persistent disk")
+consulta_writer = DebouncedSnapshotWriter(
+    CONSULTA_FALLBACK_DIR,
+    delay=float(os.environ.get('CONSULTA_PERSIST_DEBOUNCE', '5'))
+)
+
+# Static availability snapshots for the CDN (disabled when unset), e.g. dist/consulta
+CONSULTA_PUBLISH_DIR = os.environ.get('CONSULTA_PUBLISH_DIR', '')
+
+# One persistent WAL connection per thread; close() on it only ends the transaction
+sqlite_pool = SQLitePool(
+    DB_PATH,
+    busy_timeout_ms=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+)
+
+# Every SQLite mutation goes through one writer thread that group-commits queued writes
+sqlite_writer = SQLiteWriter(
+    sqlite_pool.connection,
+    max_batch=int(os.environ.get('SQLITE_WRITE_BATCH', '64')),
+    max_wait_ms=float(os.environ.get('SQLITE_WRITE_WAIT_MS', '2'))
+)
+sqlite_writer.observer = query_stats.record_sql
+if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+    print(f"[DB] SQLite {sqlite3.sqlite_version} is older than 3.35 (no RETURNING); local writes will fail")
+
+# users.permissions per user id; dropped on every admin edit of the user (user_ops)
+permission_cache = PermissionCache(ttl=float(os.environ.get('PERMISSION_CACHE_TTL', '60')))
+
+# Holder (or absence) of each CPF/CNPJ for the as-you-type duplicate check; see clients_changed()
+duplicate_cache = DuplicateCache(ttl=float(os.environ.get('DUPLICATE_CACHE_TTL', '30')))
+
+# Serialized GET /api/clients responses per (tipo, owner scope, query) with ETags; see clients_changed()
+client_list_cache = ListCache(
+    ttl=float(os.environ.get('CLIENT_LIST_CACHE_TTL', '30')),
+    max_bytes=int(os.environ.get('CLIENT_LIST_CACHE_MB', '32')) * 1024 * 1024
+)
+
+# Local SQLite read replica of the Supabase tables (SUPABASE_REPLICA=1, see DEPLOY.md 2.4).
+# Reads are served locally while the replica lags less than REPLICA_MAX_LAG seconds.
+replica = None
+if SUPABASE_URL and SUPABASE_KEY and os.environ.get('SUPABASE_REPLICA', '').lower() in ('1', 'true'):
+    replica = SupabaseReplica(
+        SUPABASE_URL, SUPABASE_KEY, sqlite_pool.connection,
+        interval=float(os.environ.get('REPLICA_SYNC_INTERVAL', '15')),
+        max_lag=float(os.environ.get('REPLICA_MAX_LAG', '60')),
+        reconcile_interval=float(os.environ.get('REPLICA_RECONCILE_INTERVAL', '300')),
+        writer=sqlite_writer
+    )
+
+def replica_serves(table):
+    return replica is not None and replica.serves(table)
+
+def replica_apply(table, rows):
+    """Mirror rows Supabase just returned for our own write, so the next local read sees them."""
+    if replica is None or not isinstance(rows, list):
+        return
     try:
-        timeout_seconds = 5
-        if method == 'GET':
-            response = requests.get(url, headers=headers, timeout=timeout_seconds)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=timeout_seconds)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=timeout_seconds)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, timeout=timeout_seconds)
-        
-        # Log response for debug
-        print(f"[Supabase REST] {method} {url} -> {response.status_code}")
-        
-        if response.status_code in [200, 201, 204, 206]:
-            if not response.text: return True
-            try:
-                return response.json()
-            except:
-                return True
-        
-        print(f"[Supabase REST ERROR] {response.status_code}: {response.text}")
-        return None
+        replica.apply_rows(table, rows)
     except Exception as e:
-        # Fail fast so we can fallback to SQLite without hanging the request
-        print(f"[Supabase REST EXCEPTION] {e}")
-        return None
-
-def query_db(sql, params=(), one=False, commit=False):
-    # Try Supabase REST API first if configured and it's a known simple query
-    if SUPABASE_URL and SUPABASE_KEY:
-        table = None
-        sql_lower = sql.lower()
-        if "clients" in sql_lower: table = "clients"
-        elif "users" in sql_lower: table = "users"
-        
-        if table:
-            try:
-                # Handle INSERT
-                if "INSERT INTO" in sql:
-                    # Very basic parser for our specific inserts
-                    if table == "clients":
-                        payload = {
-                            "nome": params[0],
-                            "cpf_cnpj": params[1],
-                            "tipo_pessoa": params[2],
-                            "created_by": params[3],
-                            "data": params[4]
-                        }
-                    else: # users
-                        payload = {
-                            "username": params[0],
-                            "password_hash": params[1],
-                            "nome": params[2],
-                            "role": params[3],
-                            "active": params[4],
-                            "permissions": json.loads(params[5]) if len(params) > 5 and isinstance(params[5], str) else (params[5] if len(params) > 5 else {})
-                        }
-                    res = query_supabase_rest(table, 'POST', data=payload)
-                    return True if res is not None else False
-                
-                # Handle UPDATE
-                if "UPDATE" in sql.upper() and "SET" in sql.upper():
-                    # Parse: UPDATE table SET col1=?, col2=? WHERE id=?
-                    import re
-                    set_match = re.search(r"SET\s+(.+?)\s+WHERE", sql, re.IGNORECASE)
-                    if set_match and "id = ?" in sql.lower():
-                        set_part = set_match.group(1)
-                        cols = re.findall(r"(\w+)\s*=\s*\?", set_part)
-                        payload = {}
-                        for i, col in enumerate(cols):
-                            if i < len(params) - 1:  # last param is id
-                                val = params[i]
-                                if isinstance(val, str) and (val.startswith('{') or val.startswith('[')):
-                                    try:
-                                        val = json.loads(val)
-                                    except:
-                                        pass
-                                payload[col] = val
-                        user_id = params[-1]
-                        where_clause = f"id=eq.{user_id}"
-                        print(f"[SUPABASE UPDATE] table={table}, payload={payload}, where={where_clause}")
-                        res = query_supabase_rest(table, 'PATCH', params=where_clause, data=payload)
-                        return True if res is not None else False
-                
-                # Handle DELETE
-                if "DELETE FROM" in sql:
-                    where_id = f"id=eq.{params[0]}"
-                    res = query_supabase_rest(table, 'DELETE', params=where_id)
-                    return True if res is not None else False
-
-                # Handle SELECT COUNT
-                if "COUNT(*)" in sql:
-                    where_clause = None
-                    if "WHERE" in sql:
-                        if "created_by =" in sql:
-                            where_clause = f"created_by=eq.{params[0]}"
-                        elif "id =" in sql:
-                            where_clause = f"id=eq.{params[0]}"
-                    
-                    # PostgREST count is a bit tricky, but we'll use a simple approach
-                    # Just get the list and return length or use Prefer: count=exact if needed
-                    # For now, let's get matching items
-                    res = query_supabase_rest(table, 'GET', params=where_clause)
-                    count = len(res) if isinstance(res, list) else 0
-                    return (count,) if one else [(count,)]
-
-                # Handle SELECT (all columns or specific columns)
-                if "SELECT" in sql.upper() and "FROM" in sql.upper():
-                    rest_params = []
-                    
-                    # Extract columns if not SELECT *
-                    import re
-                    col_match = re.search(r"SELECT\s+(.+?)\s+FROM", sql, re.IGNORECASE)
-                    if col_match and col_match.group(1).strip() != '*':
-                        cols = col_match.group(1).strip()
-                        rest_params.append(f"select={cols}")
-                    
-                    # Parse WHERE clause with multiple conditions
-                    if "WHERE" in sql.upper():
-                        where_match = re.search(r"WHERE\s+(.+?)(?:ORDER BY|LIMIT|$)", sql, re.IGNORECASE | re.DOTALL)
-                        if where_match:
-                            where_part = where_match.group(1).strip()
-                            # Find all column = ? patterns
-                            conditions = re.findall(r"(\w+)\s*=\s*\?", where_part)
-                            for i, col in enumerate(conditions):
-                                if i < len(params):
-                                    val = params[i]
-                                    if isinstance(val, bool):
-                                        val = str(val).lower()
-                                    rest_params.append(f"{col}=eq.{val}")
-                    
-                    if "ORDER BY created_at DESC" in sql:
-                        rest_params.append("order=created_at.desc")
-                    elif "ORDER BY id" in sql:
-                        rest_params.append("order=id.asc")
-                    
-                    final_params = "&".join(rest_params) if rest_params else None
-                    print(f"[SUPABASE SELECT] table={table}, params={final_params}")
-                    res = query_supabase_rest(table, 'GET', params=final_params)
-                    
-                    if one:
-                        return res[0] if (isinstance(res, list) and len(res) > 0) else None
-                    return res or []
+        print(f"[REPLICA ERROR] write-through {table}: {e}")
 
-            except Exception as api_err:
-                print(f"[Supabase API Fallback Error] {api_err}")
-                import traceback
-                traceback.print_exc()
+def replica_delete(table, ids):
+    # Deletes never show up in the incremental pull; mirror them right away
+    if replica is None or not ids:
+        return
+    try:
+        sqlite_writer.execute(f"DELETE FROM {table} WHERE id IN ({','.join('?' for _ in ids)})", tuple(ids))
+    except Exception as e:
+        print(f"[REPLICA ERROR] write-through delete {table}: {e}")
 
-    # Original direct connection logic
-    conn, db_type = None, None
+def get_db_connection():
+    # Only SQLite fallback now
+    return sqlite_pool.connection(), 'sqlite'
+
+def query_sqlite(sql, params=(), one=False, commit=False):
+    """Run SQL on the local database only (no Supabase translation)."""
+    if commit:
+        # Queued to the writer thread; returns once the group containing it is committed
+        rowcount = sqlite_writer.execute(sql, params)
+        print(f"[DB] Committed. Rowcount: {rowcount}")
+        return True
+    conn, db_type, rows = None, None, None
+    started = time.perf_counter()
     try:
         conn, db_type = get_db_connection()
         cur = conn.cursor()
         if db_type == 'postgres':
             sql = sql.replace('?', '%s')
         cur.execute(sql, params)
-        rowcount = cur.rowcount
-        if commit:
-            conn.commit()
-            print(f"[DB] Committed. Rowcount: {rowcount}")
-            return True
         if one:
             rv = cur.fetchone()
+            rows = 1 if rv else 0
             if rv:
                 col_names = [desc[0] for desc in cur.description]
                 result = dict(zip(col_names, rv))
@@ -232,6 +211,7 @@ def query_db(sql, params=(), one=False, commit=False):
                 return result
             return None
         rv = cur.fetchall()
+        rows = len(rv)
         if cur.description:
             col_names = [desc[0] for desc in cur.description]
             results = []
@@ -254,12 +234,31 @@ def query_db(sql, params=(), one=False, commit=False):
         # Re-raise the exception instead of returning None
         raise
     finally:
+        query_stats.record_sql(sql, time.perf_counter() - started, rows)
         if conn: 
             try:
                 conn.close()
             except:
                 pass
 
+# clients/users data access (repositories.py): PostgREST when Supabase is configured, SQLite otherwise
+postgrest = PostgREST(SUPABASE_URL, SUPABASE_KEY, supabase_http, SUPABASE_COUNT_MODE) if SUPABASE_URL and SUPABASE_KEY else None
+clients_repo = ClientsRepo(postgrest, query_sqlite, sqlite_writer.call,
+                           local_reads=replica_serves, mirror=replica_apply, mirror_delete=replica_delete)
+users_repo = UsersRepo(postgrest, query_sqlite, sqlite_writer.call,
+                       local_reads=replica_serves, mirror=replica_apply, mirror_delete=replica_delete)
+
+def normalize_digits(value):
+    return re.sub(r'\D', '', str(value or '')).strip()
+
+def format_cpf_cnpj(digits):
+    d = normalize_digits(digits)
+    if len(d) == 11:
+        return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
+    if len(d) == 14:
+        return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+    return d
+
 def hash_password(password):
     salt = secrets.token_hex(16)
     return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000).hex() + ':' + salt
@@ -293,6 +292,41 @@ def verify_password(stored_password, provided_password):
         print(f"[VERIFY_PASSWORD ERROR] {e}")
         return False
 
+def parse_permissions(raw):
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    try:
+        return json.loads(raw)
+    except:
+        return {}
+
+def allowed_obras_for(role, perms):
+    """Obras the user may query; None means all (admin)."""
+    if role == 'admin':
+        return None
+    return [str(c) for c in (perms.get('obrasPermitidas') or [])]
+
+def _load_user_permissions(user_id):
+    user = users_repo.get(user_id, ('permissions',))
+    return parse_permissions(user['permissions'] if user else None)
+
+def user_permissions(user_id):
+    """Parsed permissions dict for a user, served from permission_cache."""
+    return permission_cache.get(user_id, _load_user_permissions)
+
+def load_user_obras(user_id, role):
+    # Always from the current permissions (cached, dropped on user writes), never the token's
+    # 'obras' claim: a token lives 12h and would keep a revoked obra readable
+    if role == 'admin':
+        return None
+    return allowed_obras_for(role, user_permissions(user_id))
+
+def obra_allowed(codigo):
+    allowed = getattr(request, 'user_obras', None)
+    return allowed is None or str(codigo) in allowed
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -309,14 +343,124 @@ def token_required(f):
             request.user_role = data.get('role')
         except:
             return jsonify({'message': 'Invalid token'}), 401
+        try:
+            request.user_obras = load_user_obras(request.user_id, request.user_role)
+        except Exception as e:
+            print(f"[AUTH] Could not load obras for user {request.user_id}: {e}")
+            request.user_obras = []
         return f(*args, **kwargs)
     return decorated
 
+@app.before_request
+def begin_query_stats():
+    rule = request.url_rule.rule if request.url_rule else request.path
+    query_stats.begin(f"{request.method} {rule}")
+
+@app.after_request
+def report_query_stats(response):
+    current = query_stats.finish()
+    if current is not None:
+        response.headers['X-DB-Queries'] = str(current.count)
+        response.headers['X-DB-Time-Ms'] = f"{current.seconds * 1000:.1f}"
+        repeated = current.repeated()
+        if query_stats.debug and repeated:
+            # Header values must stay single-line and short; the full list is in the [QUERIES] log
+            response.headers['X-DB-Repeats'] = '; '.join(f"{n}x {fp}" for fp, n in repeated[:3])[:512]
+    return response
+
 @app.route('/api/hello')
 def hello():
     # v8.6 Full REST mapping with DELETE support
     return jsonify({"status": "ok", "message": "Full system restored (v8.6-master-sync)", "time": datetime.datetime.now().isoformat()})
 
+# Hot fields of the client form (stored only inside the `data` JSON) exposed as generated columns,
+# so lists can filter and sort on them through an index instead of decoding every row.
+# Missing fields and legacy rows with invalid JSON yield ''. Supabase gets the same columns from
+# the SQL in DEPLOY.md 2.6.
+CLIENT_FIELD_COLUMNS = {
+    'email': "lower(trim(json_extract(data, '$.email_proponente')))",
+    'cidade': "trim(json_extract(data, '$.cidade_proponente'))",
+    'uf': "upper(trim(json_extract(data, '$.uf_endereco_proponente')))",
+    'estado_civil': "upper(trim(json_extract(data, '$.estado_civil_proponente')))",
+    # DDD + número, digits only
+    'telefone': "replace(replace(replace(replace(coalesce(json_extract(data, '$.fone1_ddd_proponente'), '') || "
+                "coalesce(json_extract(data, '$.fone1_numero_proponente'), ''), '-', ''), ' ', ''), '(', ''), ')', '')",
+}
+
+def migrate_client_field_columns(cur):
+    """Add CLIENT_FIELD_COLUMNS as indexed generated columns (SQLite only allows VIRTUAL ones in ALTER TABLE)."""
+    if sqlite3.sqlite_version_info < (3, 31, 0):
+        print(f"[MIGRATION] SQLite {sqlite3.sqlite_version} has no generated columns; client field filters unavailable")
+        return
+    # table_info hides generated columns, table_xinfo lists them
+    existing = {row[1] for row in cur.execute("PRAGMA table_xinfo(clients)").fetchall()}
+    for column, expr in CLIENT_FIELD_COLUMNS.items():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE clients ADD COLUMN {column} TEXT GENERATED ALWAYS AS "
+                        f"(coalesce(CASE WHEN json_valid(data) THEN {expr} END, '')) VIRTUAL")
+            print(f"[MIGRATION] clients.{column} generated column added")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_clients_tipo_{column} ON clients (tipo_pessoa, {column})")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_clients_tipo_nome ON clients (tipo_pessoa, nome)")
+
+def migrate_client_data_codec(cur, batch=1000):
+    """Re-encode legacy `data` payloads with client_codec; packed rows are skipped, unparseable ones left alone.
+
+    Runs once per database (recorded in schema_migrations; rows saved later are already packed) and
+    bumps updated_at on every rewritten row so reconcile_db.py sees the change. Skipped while the
+    read replica mirrors clients: those rows belong to Supabase (scripts/compact_client_data.py),
+    and rewriting the mirror would make it drift and look newer to reconcile_db.py.
+    """
+    if replica is not None and 'clients' in replica.tables:
+        return
+    cur.execute("CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    if cur.execute("SELECT 1 FROM schema_migrations WHERE name = 'client_data_codec'").fetchone():
+        return
+    last_id, scanned, updated = 0, 0, 0
+    while True:
+        rows = cur.execute(
+            "SELECT id, data FROM clients WHERE id > ? AND data IS NOT NULL AND data NOT LIKE ? ORDER BY id LIMIT ?",
+            (last_id, f'%"{client_codec.PACKED_KEY}":%', batch)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, raw in rows:
+            decoded = client_codec.decode(raw)
+            encoded = client_codec.encode(decoded) if decoded else raw
+            if encoded != raw:
+                updates.append((encoded, row_id))
+        cur.executemany("UPDATE clients SET data = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", updates)
+        scanned += len(rows)
+        updated += len(updates)
+        last_id = rows[-1][0]
+    cur.execute("INSERT INTO schema_migrations (name) VALUES ('client_data_codec')")
+    if updated:
+        print(f"[MIGRATION] client data compacted for {updated} of {scanned} clients")
+
+def migrate_clients_cpf_digits(cur):
+    """Add the normalized cpf_digits column + indexes (SQLite) and backfill existing rows.
+
+    Legacy duplicates are resolved like the old list dedupe did: the newest row per
+    (tipo_pessoa, digits) keeps cpf_digits, older ones stay NULL and drop out of listings.
+    """
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(clients)").fetchall()]
+    if 'cpf_digits' not in columns:
+        cur.execute("ALTER TABLE clients ADD COLUMN cpf_digits TEXT")
+        rows = cur.execute("SELECT id, tipo_pessoa, cpf_cnpj FROM clients ORDER BY created_at DESC, id DESC").fetchall()
+        seen = set()
+        updates = []
+        for row_id, tipo, cpf_cnpj in rows:
+            digits = normalize_digits(cpf_cnpj)
+            if digits and (tipo, digits) in seen:
+                continue
+            seen.add((tipo, digits))
+            updates.append((digits, row_id))
+        cur.executemany("UPDATE clients SET cpf_digits = ? WHERE id = ?", updates)
+        print(f"[MIGRATION] cpf_digits backfilled for {len(updates)} of {len(rows)} clients")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_tipo_cpf_digits ON clients (tipo_pessoa, cpf_digits) WHERE cpf_digits != ''")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_clients_tipo_owner_created ON clients (tipo_pessoa, created_by, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_clients_tipo_created ON clients (tipo_pessoa, created_at)")
+
 def migrate_db_internal():
     """Internal migration logic to ensure tables exist"""
     try:
@@ -373,6 +517,13 @@ def migrate_db_internal():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            migrate_clients_cpf_digits(cur)
+            migrate_client_field_columns(cur)
+            migrate_client_data_codec(cur)
+            # updated_at drives the incremental replica pull of users (see replica.py)
+            user_columns = [row[1] for row in cur.execute("PRAGMA table_info(users)").fetchall()]
+            if 'updated_at' not in user_columns:
+                cur.execute("ALTER TABLE users ADD COLUMN updated_at TIMESTAMP")
         # Ensure admin user exists
         admin_exists = False
         if db_type == 'postgres':
@@ -403,17 +554,15 @@ def migrate_db_internal():
         return False
 
 @app.route('/api/debug/db')
+@token_required
 def debug_db():
+    """Database, cache, writer and query diagnostics (admin only)."""
+    if request.user_role != 'admin':
+        return jsonify({'message': 'Forbidden'}), 403
     try:
-        # Test manual insert if requested
-        if request.args.get('test_insert') == 'true':
-            query_db("INSERT INTO clients (nome, cpf_cnpj, tipo_pessoa, created_by, data) VALUES (?, ?, ?, ?, ?)",
-                     ("Teste Manual", "00000000000", "PF", "system", "{}"), commit=True)
-            return jsonify({"message": "Manual test insert executed. Refresh this page to see count."})
-
-        clients_count = query_db("SELECT COUNT(*) as count FROM clients", one=True)
-        users_count = query_db("SELECT COUNT(*) as count FROM users", one=True)
-        last_clients = query_db("SELECT id, nome, created_at, created_by FROM clients ORDER BY id DESC LIMIT 5")
+        clients_total = clients_repo.count()
+        users_total = users_repo.count()
+        last_clients = clients_repo.latest(5)
         
         # Environment check (hiding secrets)
         env_vars = {k: "SET" if "KEY" in k or "URL" in k or "PASSWORD" in k or "SECRET" in k else v 
@@ -421,13 +570,20 @@ def debug_db():
         
         return jsonify({
             "database": "connected",
-            "clients_total": clients_count['count'] if clients_count else 0,
-            "users_total": users_count['count'] if users_count else 0,
+            "clients_total": clients_total,
+            "users_total": users_total,
             "last_clients": last_clients or [],
             "supabase_api": {
                 "active": bool(SUPABASE_URL and SUPABASE_KEY),
                 "url": SUPABASE_URL
             },
+            "permission_cache": permission_cache.stats(),
+            "duplicate_cache": duplicate_cache.stats(),
+            "client_list_cache": client_list_cache.stats(),
+            "supabase_http": supabase_http.stats(),
+            "sqlite_writer": sqlite_writer.stats(),
+            "query_stats": query_stats.stats(),
+            "replica": replica.status() if replica else {"enabled": False},
             "env_check": env_vars
         })
     except Exception as e:
@@ -465,12 +621,15 @@ def auth_me():
             })
         
         # Para outros usuários, buscar no banco (se necessário)
+        permissions = {}
+        if isinstance(payload.get('obras'), list):
+            permissions['obrasPermitidas'] = payload['obras']
         return jsonify({
             'user': {
                 'id': payload.get('user_id'),
                 'username': 'user',
                 'role': payload.get('role', 'user'),
-                'permissions': {}
+                'permissions': permissions
             }
         })
     except jwt.ExpiredSignatureError:
@@ -490,9 +649,8 @@ def reset_admin_password():
     
     # Update via Supabase REST API
     try:
-        res = query_supabase_rest('users', 'PATCH', 
-            params='username=eq.admin',
-            data={'password_hash': new_hash})
+        admin = users_repo.find_by_username('admin', active=None, columns=('id',))
+        res = users_repo.update(admin['id'], {'password_hash': new_hash}) if admin else None
         
         if res:
             return jsonify({
@@ -521,6 +679,7 @@ def login_get():
             token = jwt.encode({
                 'user_id': 1,
                 'role': 'admin',
+                'obras': None,
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=12)
             }, SECRET_KEY, algorithm="HS256")
             if isinstance(token, bytes): token = token.decode('utf-8')
@@ -543,10 +702,8 @@ def login_get():
     # Try Supabase REST API first (production)
     if SUPABASE_URL and SUPABASE_KEY:
         try:
-            rest_params = f"username=eq.{username}&active=eq.true&select=*"
-            res = query_supabase_rest('users', 'GET', params=rest_params)
-            if isinstance(res, list) and len(res) > 0:
-                user = res[0]
+            user = users_repo.find_by_username(username)
+            if user:
                 print(f"[LOGIN-GET] Found user via Supabase: {user.get('username')}")
         except Exception as e:
             print(f"[LOGIN-GET] Supabase lookup failed: {e}")
@@ -598,11 +755,20 @@ def login_get():
     if not verify_password(user.get('password_hash', ''), password):
         return jsonify({'message': 'Invalid credentials'}), 401
     
-    # Generate token
+    # Parse permissions
+    perms = {}
+    if user.get('permissions'):
+        try:
+            perms = json.loads(user['permissions']) if isinstance(user['permissions'], str) else user['permissions']
+        except:
+            pass
+    
+    # Generate token (the obras claim is informational; token_required re-reads current permissions)
     try:
         token = jwt.encode({
             'user_id': user['id'],
             'role': user['role'],
+            'obras': allowed_obras_for(user['role'], perms),
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=12)
         }, SECRET_KEY, algorithm="HS256")
         if isinstance(token, bytes): token = token.decode('utf-8')
@@ -610,14 +776,6 @@ def login_get():
         print(f"[LOGIN-GET] Token generation failed: {e}")
         return jsonify({'message': 'Internal error'}), 500
     
-    # Parse permissions
-    perms = {}
-    if user.get('permissions'):
-        try:
-            perms = json.loads(user['permissions']) if isinstance(user['permissions'], str) else user['permissions']
-        except:
-            pass
-    
     return jsonify({
         'token': token,
         'user': {
@@ -649,6 +807,7 @@ def login():
             token = jwt.encode({
                 'user_id': 1,
                 'role': 'admin',
+                'obras': None,
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=12)
             }, SECRET_KEY, algorithm="HS256")
             if isinstance(token, bytes): token = token.decode('utf-8')
@@ -711,21 +870,22 @@ def login():
         
         conn.close()
         
+        perms = {}
+        if user['permissions']:
+            try: perms = json.loads(user['permissions'])
+            except: pass
+        
         try:
             token = jwt.encode({
                 'user_id': user['id'],
                 'role': user['role'],
+                'obras': allowed_obras_for(user['role'], perms),
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=12)
             }, SECRET_KEY, algorithm="HS256")
             if isinstance(token, bytes): token = token.decode('utf-8')
         except Exception as jwt_err:
             return jsonify({'message': 'JWT Encoding Error', 'error': str(jwt_err)}), 500
         
-        perms = {}
-        if user['permissions']:
-            try: perms = json.loads(user['permissions'])
-            except: pass
-        
         return jsonify({
             'token': token,
             'user': {
@@ -740,16 +900,155 @@ def login():
         return jsonify({'message': 'Internal Login Error', 'error': str(e)}), 500
 
 @app.route('/api/availability')
+@token_required
 def get_availability():
     numprod_psc = request.args.get('numprod_psc', '624')
     return fetch_consulta(numprod_psc)
 
+@app.route('/api/consulta/obras')
+@token_required
+def list_obras():
+    """Obras permitidas ao usuário com o resumo de status de cada uma"""
+    obras = []
+    for codigo, info in OBRA_INFO.items():
+        if not obra_allowed(codigo):
+            continue
+        entry = dict(info, codigo=codigo)
+        snap = get_lot_snapshot(codigo)
+        if snap is not None:
+            status = {}
+            for item in snap.items:
+                key = str(item.get('Status_Terreno') or '')
+                status[key] = status.get(key, 0) + 1
+            entry["total_lotes"] = len(snap)
+            entry["disponiveis"] = int(snap.available.sum())
+            entry["status"] = status
+        obras.append(entry)
+    return jsonify({"success": True, "obras": obras})
+
 @app.route('/api/consulta/<codigo>')
 @app.route('/api/consulta/<codigo>/')
+@token_required
 def get_consulta(codigo):
     """Rota alternativa para compatibilidade com frontend"""
     return fetch_consulta(codigo)
 
+@app.route('/api/consulta/<codigo>/lote/<qd>/<lt>/similar')
+@token_required
+def similar_lots(codigo, qd, lt):
+    """k lotes disponíveis mais parecidos (área, medidas, chanfro e preço)"""
+    if lot_index is None:
+        return jsonify({"success": False, "error": "Índice de lotes indisponível"}), 500
+    if not obra_allowed(codigo):
+        return jsonify({"success": False, "error": "Obra não permitida"}), 403
+    try:
+        k = min(max(int(request.args.get('k', 5)), 1), 50)
+    except ValueError:
+        k = 5
+    same_city = str(request.args.get('cidade', '')).lower() in ('1', 'true', 'sim')
+
+    target = get_lot_snapshot(codigo)
+    if target is None:
+        return jsonify({"success": False, "error": "Obra não encontrada"}), 404
+    row = target.find(qd, lt)
+    if row is None:
+        return jsonify({"success": False, "error": "Lote não encontrado"}), 404
+
+    candidates = [target]
+    if same_city:
+        cidade = (OBRA_INFO.get(str(codigo)) or {}).get("cidade")
+        for other in OBRA_INFO:
+            if other != str(codigo) and cidade and OBRA_INFO[other].get("cidade") == cidade and obra_allowed(other):
+                snap = get_lot_snapshot(other)
+                if snap is not None:
+                    candidates.append(snap)
+
+    results = []
+    for snap, idx, dist in lot_index.nearest_lots(target, row, candidates, k=k):
+        results.append(dict(snap.items[idx], Obra=snap.codigo, distancia=round(dist, 4)))
+    return jsonify({
+        "success": True,
+        "lote": dict(target.items[row], Obra=target.codigo),
+        "similar": results,
+        "obras": [snap.codigo for snap in candidates]
+    })
+
+@app.route('/api/consulta/<codigo>/lote/<qd>/<lt>/metricas')
+@token_required
+def lot_metrics(codigo, qd, lt):
+    """Métricas derivadas do lote e percentil de cada uma dentro da obra"""
+    if lot_index is None:
+        return jsonify({"success": False, "error": "Índice de lotes indisponível"}), 500
+    if not obra_allowed(codigo):
+        return jsonify({"success": False, "error": "Obra não permitida"}), 403
+    snap = get_lot_snapshot(codigo)
+    if snap is None:
+        return jsonify({"success": False, "error": "Obra não encontrada"}), 404
+    row = snap.find(qd, lt)
+    if row is None:
+        return jsonify({"success": False, "error": "Lote não encontrado"}), 404
+
+    percentis = {}
+    for name in lot_index.METRIC_NAMES:
+        pct = lot_index.percentile_rank(snap.metrics[name], snap.metrics[name][row])[0]
+        percentis[name] = None if pct != pct else round(float(pct), 1)
+    return jsonify({
+        "success": True,
+        "lote": dict(snap.items[row], Obra=snap.codigo),
+        "metricas": snap.lot_metrics(row),
+        "percentis": percentis
+    })
+
+@app.route('/api/consulta/ranking')
+@token_required
+def lot_ranking():
+    """Top-N lotes por métrica (ex.: menor R$/m² disponível em Castanhal)
+
+    Query: metrica, ordem=asc|desc, n, obras=600,601 ou cidade=Castanhal,
+    status=disponivel|todos, esquina=1
+    """
+    if lot_index is None:
+        return jsonify({"success": False, "error": "Índice de lotes indisponível"}), 500
+    metric = request.args.get('metrica', 'preco_m2')
+    if metric not in lot_index.METRIC_NAMES:
+        return jsonify({"success": False, "error": "Métrica inválida", "metricas": lot_index.METRIC_NAMES}), 400
+    try:
+        n = min(max(int(request.args.get('n', 10)), 1), 200)
+    except ValueError:
+        n = 10
+    ascending = request.args.get('ordem', 'asc').lower() != 'desc'
+    available_only = request.args.get('status', 'disponivel').lower() != 'todos'
+    corner_only = str(request.args.get('esquina', '')).lower() in ('1', 'true', 'sim')
+
+    codes = [c.strip() for c in request.args.get('obras', '').split(',') if c.strip()]
+    cidade = request.args.get('cidade', '').strip().lower()
+    if not codes:
+        codes = [c for c, info in OBRA_INFO.items() if not cidade or info.get("cidade", "").lower() == cidade]
+    snapshots = [snap for snap in (get_lot_snapshot(c) for c in codes if obra_allowed(c)) if snap is not None]
+
+    ranked, population = lot_index.top_lots(
+        snapshots, metric, n=n, ascending=ascending,
+        available_only=available_only, corner_only=corner_only
+    )
+    pcts = lot_index.percentile_rank(population, [value for _, _, value in ranked]) if ranked else []
+    results = []
+    for (snap, row, value), pct in zip(ranked, pcts):
+        results.append(dict(
+            snap.items[row],
+            Obra=snap.codigo,
+            metricas=snap.lot_metrics(row),
+            valor_metrica=round(value, 4),
+            percentil=round(float(pct), 1)
+        ))
+    return jsonify({
+        "success": True,
+        "metrica": metric,
+        "ordem": "asc" if ascending else "desc",
+        "obras": [snap.codigo for snap in snapshots],
+        "total_considerado": int(population.size),
+        "lotes": results
+    })
+
 @app.route('/api/consulta/push/<codigo>', methods=['POST'])
 def push_consulta(codigo):
     expected = os.environ.get('CONSULTA_PUSH_KEY', '')
@@ -761,59 +1060,59 @@ def push_consulta(codigo):
     if payload is None:
         return jsonify({"success": False, "error": "Invalid JSON"}), 400
 
-    fallback_path = os.path.join(os.path.dirname(__file__), f'fallback_{codigo}.json')
     try:
-        with open(fallback_path, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False)
+        consulta_writer.write_now(codigo, payload)
+        on_consulta_ingest(codigo, enrich_consulta_payload(payload), persist=False)
         return jsonify({"success": True, "codigo": str(codigo)})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def load_consulta_fallback(codigo):
+    """Local snapshot (fallback_<codigo>.json) or None when missing/unreadable.
+
+    The persisted copy in CONSULTA_FALLBACK_DIR wins over the one bundled with the code (BASE_DIR).
+    """
+    for directory in dict.fromkeys([CONSULTA_FALLBACK_DIR, BASE_DIR]):
+        fallback_path = os.path.join(directory, f'fallback_{codigo}.json')
+        if not os.path.exists(fallback_path):
+            continue
+        try:
+            with open(fallback_path, 'r', encoding='utf-8-sig') as f:
+                return enrich_consulta_payload(json.load(f))
+        except Exception as e:
+            print(f"[WARN] {fallback_path} unreadable: {e}")
+    return None
+
+def get_lot_snapshot(codigo):
+    """Vectorized lot snapshot for an obra, built from the local fallback if nothing was ingested yet."""
+    if lot_index is None:
+        return None
+    snap = lot_index.get_snapshot(codigo)
+    if snap is None:
+        payload = load_consulta_fallback(codigo)
+        if isinstance(payload, dict) and isinstance(payload.get("data"), list):
+            snap = lot_index.set_snapshot(codigo, payload["data"])
+    return snap
+
+def on_consulta_ingest(codigo, payload, persist=True):
+    """Runs after fresh availability data arrives (upstream fetch or push)."""
+    if persist:
+        consulta_writer.schedule(codigo, payload)
+    if lot_index is not None and isinstance(payload, dict) and isinstance(payload.get("data"), list):
+        try:
+            lot_index.set_snapshot(codigo, payload["data"])
+        except Exception as e:
+            print(f"[LOT INDEX ERROR] {codigo}: {e}")
+    if CONSULTA_PUBLISH_DIR:
+        try:
+            publish_snapshot(CONSULTA_PUBLISH_DIR, codigo, payload)
+        except Exception as e:
+            print(f"[PUBLISH ERROR] {codigo}: {e}")
+
 def fetch_consulta(numprod_psc):
     """Busca dados de lotes do servidor externo"""
-    def enrich_payload(payload):
-        """Guarantee Data_Atualizacao exists at root and items for frontend footer."""
-        if not payload:
-            return payload or {"data": []}
-        def parse_date_str(val):
-            if not val:
-                return None
-            try:
-                parts = str(val).split('/')
-                if len(parts) == 3:
-                    d, m, y = [int(p) for p in parts]
-                    return datetime.date(y, m, d)
-                # fallback ISO
-                return datetime.date.fromisoformat(str(val))
-            except Exception:
-                return None
-
-        last_update = None
-        data_list = payload.get("data") if isinstance(payload, dict) and isinstance(payload.get("data"), list) else None
-        if isinstance(payload, dict):
-            last_update = parse_date_str(payload.get("Data_Atualizacao"))
-
-        if data_list:
-            for item in data_list:
-                if not isinstance(item, dict):
-                    continue
-                d = parse_date_str(item.get("Data_Atualizacao"))
-                if d and (last_update is None or d > last_update):
-                    last_update = d
-
-        if last_update is None and data_list and isinstance(data_list[0], dict):
-            last_update = parse_date_str(data_list[0].get("Data_Atualizacao"))
-
-        if last_update:
-            formatted = last_update.strftime('%d/%m/%Y')
-            if data_list:
-                for item in data_list:
-                    if isinstance(item, dict) and not item.get("Data_Atualizacao"):
-                        item["Data_Atualizacao"] = formatted
-            if isinstance(payload, dict):
-                payload["Data_Atualizacao"] = formatted
-        return payload
-
+    if not obra_allowed(numprod_psc):
+        return jsonify({"success": False, "data": [], "error": "Obra não permitida para este usuário"}), 403
     try:
         import time
         connect_timeout = float(os.environ.get('CONSULTA_CONNECT_TIMEOUT', '12'))
@@ -839,28 +1138,23 @@ def fetch_consulta(numprod_psc):
                     timeout=(connect_timeout, read_timeout)
                 )
                 if resp.status_code == 200:
-                    payload = enrich_payload(resp.json())
+                    payload = enrich_consulta_payload(resp.json())
                     if isinstance(payload, dict) and payload.get("success") is None:
                         payload["success"] = True
+                    on_consulta_ingest(numprod_psc, payload)
                     return jsonify(payload)
                 last_error = f"HTTP {resp.status_code}"
             except Exception as e:
                 last_error = str(e)
             time.sleep(0.6 * (attempt + 1))
         
-        fallback_path = os.path.join(os.path.dirname(__file__), f'fallback_{numprod_psc}.json')
-        if os.path.exists(fallback_path):
-            try:
-                with open(fallback_path, 'r', encoding='utf-8-sig') as f:
-                    data = json.load(f)
-                payload = enrich_payload(data)
-                if isinstance(payload, dict):
-                    payload["success"] = True
-                    payload["_cached"] = True
-                    payload["_error"] = str(last_error)
-                return jsonify(payload)
-            except Exception:
-                pass
+        payload = load_consulta_fallback(numprod_psc)
+        if payload is not None:
+            if isinstance(payload, dict):
+                payload["success"] = True
+                payload["_cached"] = True
+                payload["_error"] = str(last_error)
+            return jsonify(payload)
 
         return jsonify({
             "success": False,
@@ -871,6 +1165,260 @@ def fetch_consulta(numprod_psc):
         print(f"[ERROR] fetch_consulta {numprod_psc}: {e}")
         return jsonify({"success": False, "data": [], "error": str(e)})
 
+def find_client_by_cpf_digits(tipo_pessoa, cpf_digits, exclude_id=None):
+    """Existing client with this normalized CPF/CNPJ (one probe on the unique index) or None."""
+    return clients_repo.find_by_cpf(tipo_pessoa, cpf_digits, exclude_id=exclude_id)
+
+def clients_changed(keys=(), ids=(), any_key=False, lists=((None, None),)):
+    """Call after any client write: keys are the (tipo_pessoa, cpf_digits) written, ids the rows touched.
+
+    any_key: the write moved rows to keys the caller doesn't know (bulk retype).
+    lists: (tipo_pessoa, owner) pairs whose list responses may have changed; None is any.
+    """
+    if any_key:
+        duplicate_cache.clear()
+    else:
+        duplicate_cache.invalidate(keys=keys, ids=ids)
+    for tipo, owner in set(lists):
+        client_list_cache.invalidate(tipo=tipo, owner=owner)
+
+# Form saves are one atomic statement: the permission rule (admin/canViewAllClients or owner) is a
+# condition of the UPDATE / ON CONFLICT DO UPDATE itself, so there is no probe-then-write race.
+# Every backend reports one of: created, updated, not_found, forbidden, duplicate (the conflicting
+# client is one the user may edit) or duplicate_other.
+save_client_rpc_available = True
+
+def save_client_sqlite(client_id, nome, cpf_digits, tipo_pessoa, payload_json, user_id, can_edit_any):
+    """(status, id) of a save on the writer connection; the failure probes run in the same unit."""
+    def write(conn):
+        if client_id:
+            try:
+                row = conn.execute(
+                    "UPDATE clients SET nome = ?, cpf_cnpj = ?, cpf_digits = ?, tipo_pessoa = ?, data = ?, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ? AND (? OR created_by = ?) RETURNING id",
+                    (nome, cpf_digits, cpf_digits, tipo_pessoa, payload_json, client_id, int(can_edit_any), user_id)
+                ).fetchone()
+            except sqlite3.IntegrityError:
+                dup = conn.execute(
+                    "SELECT created_by FROM clients WHERE tipo_pessoa = ? AND cpf_digits = ? AND cpf_digits != '' AND id != ?",
+                    (tipo_pessoa, cpf_digits, client_id)
+                ).fetchone()
+                mine = can_edit_any or (dup is not None and str(dup[0] or '') == user_id)
+                return ('duplicate' if mine else 'duplicate_other'), client_id
+            if row is not None:
+                return 'updated', client_id
+            exists = conn.execute("SELECT 1 FROM clients WHERE id = ?", (client_id,)).fetchone()
+            return ('forbidden' if exists else 'not_found'), client_id
+
+        # Insert unless the CPF/CNPJ exists, then update that row if the user may; whichever
+        # statement returns the id says which path ran
+        row = conn.execute(
+            "INSERT INTO clients (nome, cpf_cnpj, cpf_digits, tipo_pessoa, created_by, data) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (tipo_pessoa, cpf_digits) WHERE cpf_digits != '' DO NOTHING RETURNING id",
+            (nome, cpf_digits, cpf_digits, tipo_pessoa, user_id, payload_json)
+        ).fetchone()
+        if row is not None:
+            return 'created', row[0]
+        row = conn.execute(
+            "UPDATE clients SET nome = ?, cpf_cnpj = ?, data = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE tipo_pessoa = ? AND cpf_digits = ? AND (? OR created_by = ?) RETURNING id",
+            (nome, cpf_digits, payload_json, tipo_pessoa, cpf_digits, int(can_edit_any), user_id)
+        ).fetchone()
+        if row is None:
+            return 'duplicate_other', None
+        return 'updated', row[0]
+
+    return sqlite_writer.call(write)
+
+def save_client_supabase(client_id, nome, cpf_digits, tipo_pessoa, payload_json, user_id, can_edit_any):
+    """(status, id) from the save_client() RPC (DEPLOY.md 2.7); None if it isn't installed or the call failed."""
+    global save_client_rpc_available
+    if not save_client_rpc_available:
+        return None
+    payload = {
+        "p_id": client_id, "p_nome": nome, "p_cpf_digits": cpf_digits, "p_tipo": tipo_pessoa,
+        "p_data": payload_json, "p_user": user_id, "p_can_edit_any": bool(can_edit_any)
+    }
+    try:
+        result = (postgrest.rpc('save_client', payload) or [{}])[0]
+    except RepoError as e:
+        if e.status == 404:
+            print("[CLIENTS] save_client() not found in Supabase; saving with separate lookups")
+            save_client_rpc_available = False
+        else:
+            print(f"[Supabase REST ERROR] {e}")
+        return None
+    except Exception as e:
+        print(f"[Supabase REST EXCEPTION] {e}")
+        return None
+    if result.get('client'):
+        replica_apply('clients', [result['client']])
+    return result.get('status'), result.get('client_id')
+
+def save_client_stepwise(client_id, nome, cpf_digits, tipo_pessoa, payload_json, user_id, can_edit_any):
+    """Lookup-then-write save for a Supabase without save_client(); same (status, id) contract."""
+    if client_id:
+        current = clients_repo.get(client_id, ('id', 'created_by'))
+        if not current:
+            return 'not_found', client_id
+        if not can_edit_any and str(current.get('created_by') or '') != user_id:
+            return 'forbidden', client_id
+        dup = find_client_by_cpf_digits(tipo_pessoa, cpf_digits, exclude_id=client_id)
+        if dup:
+            mine = can_edit_any or str(dup.get('created_by') or '') == user_id
+            return ('duplicate' if mine else 'duplicate_other'), client_id
+        target_id = client_id
+    else:
+        existing = find_client_by_cpf_digits(tipo_pessoa, cpf_digits)
+        if existing and not (can_edit_any or str(existing.get('created_by') or '') == user_id):
+            return 'duplicate_other', None
+        target_id = int(existing['id']) if existing else None
+
+    fields = {'nome': nome, 'cpf_cnpj': cpf_digits, 'cpf_digits': cpf_digits, 'tipo_pessoa': tipo_pessoa, 'data': payload_json}
+    try:
+        if target_id:
+            updated = clients_repo.update(target_id, fields)
+            return ('updated' if updated else 'not_found'), target_id
+        created = clients_repo.insert(dict(fields, created_by=user_id))
+        return 'created', (created or {}).get('id')
+    except sqlite3.IntegrityError:
+        # Rejected on the unique index: a concurrent save of the same CPF/CNPJ won
+        return ('duplicate_other' if find_client_by_cpf_digits(tipo_pessoa, cpf_digits) else None), target_id
+    except RepoError as e:
+        print(f"[ERROR] save_client_stepwise: {e}")
+        return None, target_id
+
+SAVE_CLIENT_ERRORS = {
+    'not_found': ({'success': False, 'error': 'Cliente não encontrado'}, 404),
+    'forbidden': ({'success': False, 'error': 'Sem permissão para atualizar este cliente'}, 403),
+    'duplicate': ({'success': False, 'error': 'CPF/CNPJ já cadastrado em outro cliente'}, 409),
+    'duplicate_other': ({'success': False, 'error': 'CPF/CNPJ já cadastrado no sistema. Solicite ao administrador.', 'error_code': 'DUPLICATE_CPF'}, 409),
+}
+
+def save_client(client_id, nome, cpf_digits, tipo_pessoa, payload_json, user_id, can_edit_any):
+    """Insert or update one client in a single round trip. Returns (status, id); status None on failure."""
+    args = (client_id, nome, cpf_digits, tipo_pessoa, payload_json, str(user_id), can_edit_any)
+    if SUPABASE_URL and SUPABASE_KEY:
+        result = save_client_supabase(*args)
+        if result is None:
+            result = save_client_stepwise(*args) if not save_client_rpc_available else (None, client_id)
+    else:
+        result = save_client_sqlite(*args)
+    status, saved_id = result
+    if status in ('created', 'updated'):
+        # New rows belong to the user. An update keeps its owner (the user's own unless can_edit_any)
+        # but may have moved the client between PF and PJ
+        lists = [(tipo_pessoa, str(user_id))] if status == 'created' else [(None, None if can_edit_any else str(user_id))]
+        clients_changed(keys=[(tipo_pessoa, cpf_digits)], ids=[saved_id] if saved_id else [], lists=lists)
+    return result
+
+def encode_client_cursor(row, sort='created_at'):
+    """Opaque keyset cursor for (<sort column>, id) of the last row of a page."""
+    raw = json.dumps([str(row.get(sort) or ''), int(row['id'])])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_client_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, client_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(created_at), int(client_id)
+    except Exception:
+        return None
+
+# Display columns for the slim list (view=summary); the proposal form in `data` is served by
+# GET /api/clients/<id>. Keys map summary field -> key inside the stored `data` JSON.
+CLIENT_SUMMARY_COLUMNS = ['id', 'nome', 'cpf_cnpj', 'tipo_pessoa', 'created_by', 'created_at', 'updated_at']
+CLIENT_SUMMARY_DATA_KEYS = {
+    'cidade': 'cidade_proponente',
+    'uf': 'uf_endereco_proponente',
+    'fone_ddd': 'fone1_ddd_proponente',
+    'fone_numero': 'fone1_numero_proponente',
+}
+
+def mask_cpf_cnpj(value):
+    """CPF shows only the middle digits (***.456.789-**); CNPJ is company data and stays whole."""
+    d = normalize_digits(value)
+    if len(d) == 11:
+        return f"***.{d[3:6]}.{d[6:9]}-**"
+    return format_cpf_cnpj(d)
+
+def decode_client_data(raw):
+    """Form dict from a stored `data` value (packed by client_codec or legacy JSON)."""
+    return client_codec.decode(raw)
+
+def client_full_row(row):
+    """Row with `data` decoded; packed payloads mean nothing to the frontend."""
+    row = dict(row)
+    row['data'] = decode_client_data(row.get('data'))
+    return row
+
+def client_summary(row):
+    """Slim list row. Uses the json_extract columns (SQLite) or decodes `data` (Supabase)."""
+    summary = {col: row.get(col) for col in CLIENT_SUMMARY_COLUMNS}
+    summary['cpf_cnpj'] = mask_cpf_cnpj(row.get('cpf_cnpj'))
+    data = decode_client_data(row.get('data')) if 'data' in row else None
+    for field, key in CLIENT_SUMMARY_DATA_KEYS.items():
+        summary[field] = data.get(key) if data is not None else row.get(field)
+    return summary
+
+# ?sort= values for the client list; each is indexed together with tipo_pessoa
+CLIENT_SORT_COLUMNS = ('created_at', 'nome') + tuple(CLIENT_FIELD_COLUMNS)
+
+def normalize_client_field(field, value):
+    """Filter value in the same form the generated column stores it."""
+    value = str(value or '').strip()
+    if field == 'email':
+        return value.lower()
+    if field in ('uf', 'estado_civil'):
+        return value.upper()
+    if field == 'telefone':
+        return normalize_digits(value)
+    return value
+
+def client_fields_available():
+    """Whether the database answering list queries has the CLIENT_FIELD_COLUMNS."""
+    if SUPABASE_URL and SUPABASE_KEY and not replica_serves('clients'):
+        return SUPABASE_CLIENT_FIELDS
+    return sqlite3.sqlite_version_info >= (3, 31, 0)
+
+def list_clients_page(tipo_pessoa, owner=None, search='', cursor=None, limit=50, with_count=False, summary=False,
+                      fields=None, sort='created_at', descending=True):
+    """One page of clients ordered by (sort, id), continuing after `cursor`.
+
+    `fields` maps CLIENT_FIELD_COLUMNS names to exact-match values. sort is one of
+    CLIENT_SORT_COLUMNS; cursors are only valid for the sort they were issued with.
+    Returns (rows, next_cursor, total); total is None unless with_count.
+    With summary=True rows are client_summary() dicts instead of full rows.
+    """
+    fields = {f: normalize_client_field(f, v) for f, v in (fields or {}).items()}
+    if sort not in CLIENT_SORT_COLUMNS:
+        sort = 'created_at'
+    # Summary rows carry the sort value as sort_key, since not every sortable column is displayed
+    cursor_key = 'sort_key' if summary else sort
+    rows, total = clients_repo.page(
+        tipo_pessoa, owner=owner, search=search, cursor=cursor, limit=limit, with_count=with_count,
+        fields=fields, sort=sort, descending=descending,
+        columns=CLIENT_SUMMARY_COLUMNS if summary else None, data_keys=CLIENT_SUMMARY_DATA_KEYS if summary else None
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_client_cursor(rows[-1], cursor_key) if has_more and rows else None
+    rows = [client_summary(r) for r in rows] if summary else [client_full_row(r) for r in rows]
+    return rows, next_cursor, total
+
+def client_list_response(etag, body, hit):
+    """Cached list body, or 304 when the client already holds this ETag."""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Revalidate on every open; the body differs per user, so shared caches must not keep it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Authorization'
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
 @app.route('/api/clients', methods=['GET', 'POST'])
 @app.route('/api/manage-clients', methods=['GET', 'POST'])
 @token_required
@@ -885,37 +1433,64 @@ def manage_clients():
         can_see_all = request.user_role == 'admin'
         if not can_see_all:
              # Check specific permissions
-             user = query_db("SELECT permissions FROM users WHERE id = ?", (request.user_id,), one=True)
-             perms = json.loads(user['permissions']) if user and user['permissions'] else {}
+             perms = user_permissions(request.user_id)
              can_see_all = perms.get('canViewAllClients', False)
         
-        # Filter by tipo_pessoa AND optionally by created_by
-        if can_see_all:
-            clients = query_db("SELECT * FROM clients WHERE tipo_pessoa = ? ORDER BY created_at DESC", (client_type,))
+        # Keyset pagination: ?limit=50&cursor=<next_cursor>&q=<nome ou CPF/CNPJ>&count=1
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        except ValueError:
+            limit = 50
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = decode_client_cursor(request.args['cursor'])
+            if cursor is None:
+                return jsonify({"success": False, "error": "Cursor inválido"}), 400
+        with_count = str(request.args.get('count', '')).lower() in ('1', 'true')
+        # view=summary: display columns only, full record via GET /api/clients/<id>
+        summary = request.args.get('view', 'full').lower() == 'summary'
+
+        # Indexed field filters (?cidade=Castanhal&estado_civil=CASADO) and ?sort=<coluna>&order=asc|desc
+        fields = {f: request.args[f] for f in CLIENT_FIELD_COLUMNS if request.args.get(f, '').strip()}
+        sort = request.args.get('sort', 'created_at')
+        if sort not in CLIENT_SORT_COLUMNS:
+            return jsonify({"success": False, "error": f"Ordenação inválida. Use: {', '.join(CLIENT_SORT_COLUMNS)}"}), 400
+        descending = request.args.get('order', 'desc').lower() != 'asc'
+        if (fields or sort in CLIENT_FIELD_COLUMNS) and not client_fields_available():
+            return jsonify({"success": False, "error": "Filtros por campos do cliente exigem as colunas geradas (DEPLOY.md 2.6)"}), 400
+
+        # Filter by tipo_pessoa AND optionally by created_by.
+        # Duplicates are resolved at write time: superseded legacy rows have cpf_digits NULL.
+        owner = None if can_see_all else str(request.user_id)
+        if can_see_all and request.args.get('created_by'):
+            owner = str(request.args['created_by'])
+
+        # The response depends only on (tipo, owner scope, remaining query): serve it from client_list_cache
+        scope = owner if owner is not None else ALL_OWNERS
+        query = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)) if k not in ('type', 'created_by'))
+        cached = client_list_cache.get(client_type, scope, query)
+        if cached is not None:
+            etag, body = cached
         else:
-            clients = query_db("SELECT * FROM clients WHERE tipo_pessoa = ? AND created_by = ? ORDER BY created_at DESC", (client_type, str(request.user_id)))
-        
-        print(f"[DEBUG] Found {len(clients) if clients else 0} clients")
-        # Normalize response for frontend
-        if isinstance(clients, list):
-            import re
-            seen = set()
-            deduped = []
-            for c in clients:
-                cpf_raw = str(c.get('cpf_cnpj') or '')
-                cpf_digits = re.sub(r'\D', '', cpf_raw)
-                tipo = str(c.get('tipo_pessoa') or '')
-                key = f"{tipo}:{cpf_digits}" if cpf_digits else f"id:{c.get('id')}"
-                if key in seen:
-                    continue
-                seen.add(key)
-                deduped.append(c)
-            return jsonify({
+            generation = client_list_cache.generation()
+            clients, next_cursor, total = list_clients_page(
+                client_type, owner=owner, search=request.args.get('q', ''),
+                cursor=cursor, limit=limit, with_count=with_count, summary=summary,
+                fields=fields, sort=sort, descending=descending
+            )
+
+            print(f"[DEBUG] Found {len(clients)} clients (has_more={bool(next_cursor)})")
+            response = {
                 "success": True,
-                "clients": deduped,
-                "total_count": len(deduped)
-            })
-        return jsonify({"success": True, "clients": [], "total_count": 0})
+                "clients": clients,
+                "next_cursor": next_cursor,
+                "has_more": bool(next_cursor)
+            }
+            if with_count:
+                response["total_count"] = total
+            body = (app.json.dumps(response) + "\n").encode('utf-8')
+            etag = client_list_cache.put(client_type, scope, query, body, generation)
+        return client_list_response(etag, body, hit=cached is not None)
 
     if request.method == 'POST':
         try:
@@ -941,117 +1516,37 @@ def manage_clients():
                     'required': ['nome or nome_proponente', 'cpf_cnpj or cpf_cnpj_proponente']
                 }), 400
 
-            import re
-
             def extract_numeric_id(value):
                 if value is None:
                     return None
                 match = re.search(r'\d+', str(value))
                 return int(match.group()) if match else None
 
-            def normalize_digits(value):
-                return re.sub(r'\D', '', str(value or '')).strip()
-
-            def format_cpf_cnpj(digits):
-                d = normalize_digits(digits)
-                if len(d) == 11:
-                    return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
-                if len(d) == 14:
-                    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
-                return d
-
             client_id = extract_numeric_id(client_id_raw)
             cpf_digits = normalize_digits(cpf_cnpj)
             if not cpf_digits:
                 return jsonify({'success': False, 'error': 'CPF/CNPJ inválido'}), 400
 
-            cpf_candidates = [cpf_digits]
-            cpf_masked = format_cpf_cnpj(cpf_digits)
-            if cpf_masked and cpf_masked != cpf_digits:
-                cpf_candidates.append(cpf_masked)
-
             can_edit_any = request.user_role == 'admin'
             if not can_edit_any:
-                user = query_db("SELECT permissions FROM users WHERE id = ?", (request.user_id,), one=True)
-                perms = json.loads(user['permissions']) if user and user['permissions'] else {}
+                perms = user_permissions(request.user_id)
                 can_edit_any = perms.get('canViewAllClients', False)
 
-            def find_existing_by_cpf(exclude_id=None):
-                for cand in cpf_candidates:
-                    if exclude_id:
-                        existing_row = query_db(
-                            "SELECT id, created_by FROM clients WHERE cpf_cnpj = ? AND id != ? ORDER BY id DESC",
-                            (cand, exclude_id),
-                            one=True
-                        )
-                    else:
-                        existing_row = query_db(
-                            "SELECT id, created_by FROM clients WHERE cpf_cnpj = ? ORDER BY id DESC",
-                            (cand,),
-                            one=True
-                        )
-                    if existing_row:
-                        return existing_row
-                return None
-
-            payload_json = json.dumps(data)
-
-            if client_id:
-                current = query_db("SELECT id, created_by FROM clients WHERE id = ?", (client_id,), one=True)
-                if not current:
-                    return jsonify({'success': False, 'error': 'Cliente não encontrado'}), 404
-                if not can_edit_any and str(current.get('created_by') or '') != str(request.user_id):
-                    return jsonify({'success': False, 'error': 'Sem permissão para atualizar este cliente'}), 403
-
-                dup = find_existing_by_cpf(exclude_id=client_id)
-                if dup:
-                    if can_edit_any or str(dup.get('created_by') or '') == str(request.user_id):
-                        return jsonify({'success': False, 'error': 'CPF/CNPJ já cadastrado em outro cliente'}), 409
-                    return jsonify({'success': False, 'error': 'CPF/CNPJ já cadastrado no sistema. Solicite ao administrador.', 'error_code': 'DUPLICATE_CPF'}), 409
-
-                print(f"[DEBUG] Updating client {client_id}: {nome} - {cpf_digits}")
-                success = query_db(
-                    "UPDATE clients SET nome = ?, cpf_cnpj = ?, tipo_pessoa = ?, data = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                    (nome, cpf_digits, tipo_pessoa, payload_json, client_id),
-                    commit=True
-                )
-                print(f"[DEBUG] Update result: {success}")
-                if success:
-                    return jsonify({'success': True, 'message': 'Cliente atualizado com sucesso', 'client_id': client_id})
-                return jsonify({'success': False, 'error': 'Falha ao atualizar cliente'}), 500
-
-            existing = find_existing_by_cpf()
-            if existing:
-                if can_edit_any or str(existing.get('created_by') or '') == str(request.user_id):
-                    existing_id = int(existing['id'])
-                    print(f"[DEBUG] Upserting existing client {existing_id}: {nome} - {cpf_digits}")
-                    success = query_db(
-                        "UPDATE clients SET nome = ?, cpf_cnpj = ?, tipo_pessoa = ?, data = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                        (nome, cpf_digits, tipo_pessoa, payload_json, existing_id),
-                        commit=True
-                    )
-                    print(f"[DEBUG] Upsert update result: {success}")
-                    if success:
-                        return jsonify({'success': True, 'message': 'Cliente atualizado com sucesso', 'client_id': existing_id})
-                    return jsonify({'success': False, 'error': 'Falha ao atualizar cliente existente'}), 500
-                return jsonify({'success': False, 'error': 'CPF/CNPJ já cadastrado no sistema. Solicite ao administrador.', 'error_code': 'DUPLICATE_CPF'}), 409
-
-            print(f"[DEBUG] Inserting client: {nome} - {cpf_digits}")
-            success = query_db(
-                "INSERT INTO clients (nome, cpf_cnpj, tipo_pessoa, created_by, data) VALUES (?, ?, ?, ?, ?)",
-                (nome, cpf_digits, tipo_pessoa, str(request.user_id), payload_json),
-                commit=True
-            )
-            
-            # Additional logic: if it's a proposal flow, we might want to store extra metadata
-            # but for now, ensuring it saves in the same central table is the priority.
-            print(f"[DEBUG] Insert result: {success}")
-            
-            if success:
+            payload_json = client_codec.encode(data)
+            print(f"[DEBUG] Saving client {client_id or '(new)'}: {nome} - {cpf_digits}")
+            status, saved_id = save_client(client_id, nome, cpf_digits, tipo_pessoa, payload_json,
+                                           request.user_id, can_edit_any)
+            print(f"[DEBUG] Save result: {status} (id={saved_id})")
+
+            if status == 'created':
                 # Return success in the format both areas expect
-                return jsonify({'success': True, 'message': 'Cliente salvo com sucesso', 'database': 'supabase-rest'})
-            else:
-                return jsonify({'success': False, 'error': 'Falha ao inserir no banco de dados Supabase'}), 500
+                return jsonify({'success': True, 'message': 'Cliente salvo com sucesso', 'client_id': saved_id, 'database': 'supabase-rest'})
+            if status == 'updated':
+                return jsonify({'success': True, 'message': 'Cliente atualizado com sucesso', 'client_id': saved_id})
+            if status in SAVE_CLIENT_ERRORS:
+                body, code = SAVE_CLIENT_ERRORS[status]
+                return jsonify(body), code
+            return jsonify({'success': False, 'error': 'Falha ao salvar cliente'}), 500
                 
         except Exception as e:
             import traceback
@@ -1066,6 +1561,31 @@ def manage_clients():
             }), 500
 
 
+@app.route('/api/clients/<int:client_id>', methods=['GET'])
+@app.route('/api/manage-clients/<int:client_id>', methods=['GET'])
+@token_required
+def get_client(client_id):
+    """Full client record with `data` decoded, loaded when a client is opened."""
+    try:
+        client = clients_repo.get(client_id)
+        if not client:
+            return jsonify({'success': False, 'error': 'Cliente não encontrado'}), 404
+
+        can_see_all = request.user_role == 'admin'
+        if not can_see_all:
+            perms = user_permissions(request.user_id)
+            can_see_all = perms.get('canViewAllClients', False)
+        if not can_see_all and str(client.get('created_by') or '') != str(request.user_id):
+            return jsonify({'success': False, 'error': 'Sem permissão para visualizar este cliente'}), 403
+
+        client = dict(client)
+        client['data'] = decode_client_data(client.get('data'))
+        return jsonify({'success': True, 'client': client})
+    except Exception as e:
+        print(f"[ERROR] get_client: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/clients/<int:client_id>', methods=['PUT'])
 @app.route('/api/manage-clients/<int:client_id>', methods=['PUT'])
 @token_required
@@ -1082,62 +1602,21 @@ def update_client(client_id):
         if not nome or not cpf_cnpj:
             return jsonify({'success': False, 'error': 'Nome e CPF/CNPJ são obrigatórios'}), 400
 
-        import re
-
-        def normalize_digits(value):
-            return re.sub(r'\D', '', str(value or '')).strip()
-
-        def format_cpf_cnpj(digits):
-            d = normalize_digits(digits)
-            if len(d) == 11:
-                return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
-            if len(d) == 14:
-                return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
-            return d
-
         cpf_digits = normalize_digits(cpf_cnpj)
         if not cpf_digits:
             return jsonify({'success': False, 'error': 'CPF/CNPJ inválido'}), 400
 
-        cpf_candidates = [cpf_digits]
-        cpf_masked = format_cpf_cnpj(cpf_digits)
-        if cpf_masked and cpf_masked != cpf_digits:
-            cpf_candidates.append(cpf_masked)
-
         can_edit_any = request.user_role == 'admin'
         if not can_edit_any:
-            user = query_db("SELECT permissions FROM users WHERE id = ?", (request.user_id,), one=True)
-            perms = json.loads(user['permissions']) if user and user['permissions'] else {}
+            perms = user_permissions(request.user_id)
             can_edit_any = perms.get('canViewAllClients', False)
 
-        current = query_db("SELECT id, created_by FROM clients WHERE id = ?", (client_id,), one=True)
-        if not current:
-            return jsonify({'success': False, 'error': 'Cliente não encontrado'}), 404
-        if not can_edit_any and str(current.get('created_by') or '') != str(request.user_id):
-            return jsonify({'success': False, 'error': 'Sem permissão para atualizar este cliente'}), 403
-
-        dup = None
-        for cand in cpf_candidates:
-            dup = query_db(
-                "SELECT id, created_by FROM clients WHERE cpf_cnpj = ? AND id != ? ORDER BY id DESC",
-                (cand, client_id),
-                one=True
-            )
-            if dup:
-                break
-        if dup:
-            if can_edit_any or str(dup.get('created_by') or '') == str(request.user_id):
-                return jsonify({'success': False, 'error': 'CPF/CNPJ já cadastrado em outro cliente'}), 409
-            return jsonify({'success': False, 'error': 'CPF/CNPJ já cadastrado no sistema. Solicite ao administrador.', 'error_code': 'DUPLICATE_CPF'}), 409
-
-        payload_json = json.dumps(data)
-        success = query_db(
-            "UPDATE clients SET nome = ?, cpf_cnpj = ?, tipo_pessoa = ?, data = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (nome, cpf_digits, tipo_pessoa, payload_json, client_id),
-            commit=True
-        )
-        if success:
+        status, _ = save_client(client_id, nome, cpf_digits, tipo_pessoa, client_codec.encode(data), request.user_id, can_edit_any)
+        if status == 'updated':
             return jsonify({'success': True, 'message': 'Cliente atualizado com sucesso', 'client_id': client_id})
+        if status in SAVE_CLIENT_ERRORS:
+            body, code = SAVE_CLIENT_ERRORS[status]
+            return jsonify(body), code
         return jsonify({'success': False, 'error': 'Falha ao atualizar cliente'}), 500
     except Exception as e:
         import traceback
@@ -1158,19 +1637,13 @@ def delete_client(client_id):
         # Check permissions - only admin or the user who created the client can delete
         can_delete_any = request.user_role == 'admin'
         if not can_delete_any:
-            user = query_db("SELECT permissions FROM users WHERE id = ?", (request.user_id,), one=True)
-            perms = json.loads(user['permissions']) if user and user['permissions'] else {}
+            perms = user_permissions(request.user_id)
             can_delete_any = perms.get('canViewAllClients', False)
         
-        if can_delete_any:
-            # Admin can delete any client
-            result = query_db("DELETE FROM clients WHERE id = ?", (client_id,), commit=True)
-        else:
-            # Regular user can only delete their own clients
-            result = query_db("DELETE FROM clients WHERE id = ? AND created_by = ?", 
-                            (client_id, str(request.user_id)), commit=True)
-        
-        if result:
+        # Regular users can only delete their own clients (created_by is part of the delete filter)
+        deleted = clients_repo.delete(client_id, owner=None if can_delete_any else request.user_id)
+        if deleted:
+            clients_changed(ids=[client_id], lists=[(deleted.get('tipo_pessoa'), deleted.get('created_by'))])
             return jsonify({'success': True, 'message': 'Cliente excluído com sucesso'})
         else:
             return jsonify({'success': False, 'error': 'Cliente não encontrado ou sem permissão'}), 404
@@ -1182,6 +1655,132 @@ def delete_client(client_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# Bulk operations: ids per statement / PostgREST `id=in.()` request, and the most clients per call
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '200'))
+BULK_MAX_CLIENTS = int(os.environ.get('BULK_MAX_CLIENTS', '5000'))
+BULK_ACTIONS = ('delete', 'reassign', 'retype')
+
+def select_client_ids(filters, owner=None):
+    """Ids matching a bulk filter ({type, created_by, <CLIENT_FIELD_COLUMNS>}), at most BULK_MAX_CLIENTS + 1.
+
+    Like the list, superseded legacy rows (cpf_digits NULL) are not matched.
+    """
+    fields = {f: normalize_client_field(f, filters[f]) for f in CLIENT_FIELD_COLUMNS if filters.get(f)}
+    tipo = str(filters.get('type') or filters.get('tipo_pessoa') or '').upper()
+    created_by = str(owner or filters.get('created_by') or '')
+    return clients_repo.ids_matching(tipo_pessoa=tipo, owner=created_by, fields=fields, limit=BULK_MAX_CLIENTS + 1)
+
+def bulk_clients_chunk(action, ids, changes, user_id, can_edit_any):
+    """{id: status} for one chunk: a single id-list DELETE or UPDATE (clients_repo).
+
+    A retype onto a CPF/CNPJ that already exists in the other type rejects the whole list; only
+    then are the ids retried one by one to isolate the duplicates.
+    """
+    owner = None if can_edit_any else user_id
+    results = {}
+    try:
+        if action == 'delete':
+            done = clients_repo.delete_many(ids, owner=owner)
+        else:
+            try:
+                done = clients_repo.update_many(ids, changes, owner=owner)
+            except sqlite3.IntegrityError:
+                done = []
+                for client_id in ids:
+                    try:
+                        done += clients_repo.update_many([client_id], changes, owner=owner)
+                    except sqlite3.IntegrityError:
+                        results[client_id] = 'duplicate'
+        for client_id in done:
+            results[client_id] = 'ok'
+        missing = [i for i in ids if i not in results]
+        found = clients_repo.existing_ids(missing)
+    except RepoError as e:
+        print(f"[CLIENTS] bulk {action} failed: {e}")
+        return {client_id: results.get(client_id, 'error') for client_id in ids}
+    for client_id in missing:
+        results[client_id] = 'forbidden' if client_id in found else 'not_found'
+    return results
+
+@app.route('/api/clients/bulk', methods=['POST'])
+@app.route('/api/manage-clients/bulk', methods=['POST'])
+@token_required
+def bulk_clients():
+    """Delete, reassign (created_by) or retype (tipo_pessoa) many clients at once.
+
+    Body: {"action": "delete"|"reassign"|"retype", "ids": [...]} or {"filter": {"type": "pf",
+    "created_by": "7", "cidade": ...}} instead of ids, plus "created_by" for reassign and
+    "tipo_pessoa" for retype. Returns one status per id: ok, not_found, forbidden, duplicate
+    (retype onto an existing CPF/CNPJ) or error.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        action = str(body.get('action') or '').lower()
+        if action not in BULK_ACTIONS:
+            return jsonify({'success': False, 'error': f"Ação inválida. Use: {', '.join(BULK_ACTIONS)}"}), 400
+
+        can_edit_any = request.user_role == 'admin'
+        if not can_edit_any:
+            can_edit_any = user_permissions(request.user_id).get('canViewAllClients', False)
+        user_id = str(request.user_id)
+
+        changes = {}
+        if action == 'reassign':
+            if not can_edit_any:
+                return jsonify({'success': False, 'error': 'Sem permissão para transferir clientes'}), 403
+            new_owner = str(body.get('created_by') or '').strip()
+            if not new_owner.isdigit() or not users_repo.get(new_owner, ('id',)):
+                return jsonify({'success': False, 'error': 'Usuário de destino não encontrado'}), 400
+            changes['created_by'] = new_owner
+        elif action == 'retype':
+            tipo = str(body.get('tipo_pessoa') or '').upper()
+            if tipo not in ('PF', 'PJ'):
+                return jsonify({'success': False, 'error': 'tipo_pessoa deve ser PF ou PJ'}), 400
+            changes['tipo_pessoa'] = tipo
+
+        if body.get('ids') is not None:
+            try:
+                ids = list(dict.fromkeys(int(i) for i in body['ids']))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'ids deve ser uma lista de números'}), 400
+        elif isinstance(body.get('filter'), dict) and body['filter']:
+            flt = body['filter']
+            if any(flt.get(f) for f in CLIENT_FIELD_COLUMNS) and not client_fields_available():
+                return jsonify({"success": False, "error": "Filtros por campos do cliente exigem as colunas geradas (DEPLOY.md 2.6)"}), 400
+            # Without canViewAllClients a filter only ever reaches the user's own clients
+            ids = select_client_ids(flt, owner=None if can_edit_any else user_id)
+        else:
+            return jsonify({'success': False, 'error': 'Informe ids ou filter'}), 400
+        if len(ids) > BULK_MAX_CLIENTS:
+            return jsonify({'success': False, 'error': f'Máximo de {BULK_MAX_CLIENTS} clientes por operação'}), 413
+
+        outcomes = {}
+        for i in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk_outcomes = bulk_clients_chunk(action, ids[i:i + BULK_CHUNK_SIZE], changes, user_id, can_edit_any)
+            outcomes.update(chunk_outcomes)
+            changed = [client_id for client_id, status in chunk_outcomes.items() if status == 'ok']
+            if changed:
+                # Only the user's own clients can change unless can_edit_any (which reassign requires)
+                clients_changed(ids=changed if action != 'reassign' else (), any_key=action == 'retype',
+                                lists=[(None, None if can_edit_any else user_id)])
+        print(f"[CLIENTS] bulk {action} by {user_id}: {len(ids)} ids")
+
+        summary = {}
+        for status in outcomes.values():
+            summary[status] = summary.get(status, 0) + 1
+        return jsonify({
+            'success': True,
+            'action': action,
+            'total': len(ids),
+            'summary': summary,
+            'results': [{'id': client_id, 'status': outcomes.get(client_id, 'error')} for client_id in ids]
+        })
+    except Exception as e:
+        print(f"[ERROR] bulk_clients: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/clients/check-duplicate', methods=['GET'])
 @app.route('/api/manage-clients/check-duplicate', methods=['GET'])
 @token_required
@@ -1190,65 +1789,201 @@ def check_duplicate_client():
     try:
         cpf_cnpj = request.args.get('cpf_cnpj', '').strip()
         tipo_pessoa = request.args.get('tipo_pessoa', 'PF')
-        client_id_raw = request.args.get('client_id')
-        
-        if not cpf_cnpj:
+        digits = normalize_digits(cpf_cnpj)
+        if not digits:
             return jsonify({'exists': False})
-        
-        # Extract numeric ID from client_id (may be in format "PF:123" or just "123")
-        client_id = None
-        if client_id_raw:
-            # Try to extract numeric part
-            import re
-            match = re.search(r'\d+', str(client_id_raw))
-            if match:
-                client_id = int(match.group())
-        
-        import re
 
-        def normalize_digits(value):
-            return re.sub(r'\D', '', str(value or '')).strip()
-
-        def format_cpf_cnpj(digits):
-            d = normalize_digits(digits)
-            if len(d) == 11:
-                return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
-            if len(d) == 14:
-                return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
-            return d
-
-        digits = normalize_digits(cpf_cnpj)
-        candidates = [digits]
-        masked = format_cpf_cnpj(digits)
-        if masked and masked != digits:
-            candidates.append(masked)
-
-        existing = None
-        for cand in candidates:
-            if client_id:
-                existing = query_db(
-                    "SELECT id, nome FROM clients WHERE cpf_cnpj = ? AND id != ?",
-                    (cand, client_id),
-                    one=True
-                )
-            else:
-                existing = query_db(
-                    "SELECT id, nome FROM clients WHERE cpf_cnpj = ?",
-                    (cand,),
-                    one=True
-                )
-            if existing:
-                break
-        
-        if existing:
-            return jsonify({'exists': True, 'client_name': existing['nome'], 'client_id': existing['id']})
-        
-        return jsonify({'exists': False})
-        
+        key = (str(tipo_pessoa).upper(), digits)
+        holder = duplicate_cache.get(key, lambda k: find_client_by_cpf_digits(*k))
+        return jsonify(duplicate_result(holder, parse_check_client_id(request.args.get('client_id'))))
     except Exception as e:
         print(f"[ERROR] check_duplicate_client: {str(e)}")
         return jsonify({'exists': False, 'error': str(e)})
 
+def parse_check_client_id(raw):
+    # client_id may come as "PF:123" or just "123"
+    match = re.search(r'\d+', str(raw or ''))
+    return int(match.group()) if match else None
+
+def duplicate_result(holder, client_id=None):
+    """check-duplicate answer for the holder of a CPF/CNPJ; the client being edited is not a duplicate."""
+    if holder and holder['id'] != client_id:
+        return {'exists': True, 'client_name': holder['nome'], 'client_id': holder['id']}
+    return {'exists': False}
+
+@app.route('/api/clients/check-duplicates', methods=['POST'])
+@app.route('/api/manage-clients/check-duplicates', methods=['POST'])
+@token_required
+def check_duplicate_clients():
+    """Several CPF/CNPJ checks in one call (e.g. titular and segundo of the form).
+
+    Body: {"client_id": 12, "checks": [{"cpf_cnpj": "...", "tipo_pessoa": "PF", "field": "cpf_cnpj_segundo"}]}.
+    Returns {"results": [...]} in the same order, each like check-duplicate plus the echoed field.
+    Cache misses are resolved together, with one IN lookup per tipo_pessoa.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        checks = body.get('checks')
+        if not isinstance(checks, list) or not checks:
+            return jsonify({'success': False, 'error': 'Informe checks: [{cpf_cnpj, tipo_pessoa}]'}), 400
+        if len(checks) > 20:
+            return jsonify({'success': False, 'error': 'Máximo de 20 verificações por chamada'}), 400
+        default_client_id = parse_check_client_id(body.get('client_id'))
+
+        keys = []
+        for check in checks:
+            check = check if isinstance(check, dict) else {}
+            digits = normalize_digits(check.get('cpf_cnpj'))
+            keys.append((str(check.get('tipo_pessoa') or 'PF').upper(), digits) if digits else None)
+        holders = duplicate_cache.get_many([k for k in keys if k], find_clients_by_cpf_digits_batch)
+
+        results = []
+        for check, key in zip(checks, keys):
+            check = check if isinstance(check, dict) else {}
+            client_id = parse_check_client_id(check.get('client_id')) or default_client_id
+            result = duplicate_result(holders.get(key), client_id) if key else {'exists': False}
+            if check.get('field'):
+                result['field'] = check['field']
+            results.append(result)
+        return jsonify({'success': True, 'results': results})
+    except Exception as e:
+        print(f"[ERROR] check_duplicate_clients: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# Bulk import: rows per transaction / PostgREST request, and the most rows accepted per upload
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '500'))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '5000'))
+
+def find_clients_by_cpf_digits_batch(keys):
+    """{(tipo_pessoa, cpf_digits): row} for many documents with one IN lookup per type and chunk."""
+    by_tipo = {}
+    for tipo, digits in keys:
+        if digits:
+            by_tipo.setdefault(tipo, set()).add(digits)
+    found = {}
+    for tipo, digits in by_tipo.items():
+        digits = sorted(digits)
+        for i in range(0, len(digits), IMPORT_CHUNK_SIZE):
+            for row in clients_repo.find_by_cpf_batch(tipo, digits[i:i + IMPORT_CHUNK_SIZE]):
+                found[(row['tipo_pessoa'], row['cpf_digits'])] = row
+    return found
+
+def import_client_record(row, owner, client_id=None):
+    """Column values for one prepared import row (clients.cpf_cnpj stores digits, like the form)."""
+    record = {
+        "nome": row['nome'],
+        "cpf_cnpj": row['cpf_digits'],
+        "cpf_digits": row['cpf_digits'],
+        "tipo_pessoa": row['tipo_pessoa'],
+        "data": client_codec.encode(dict(row['data'], tipo_pessoa=row['tipo_pessoa'])),
+    }
+    if client_id is None:
+        record["created_by"] = owner
+    else:
+        record["id"] = client_id
+        record["updated_at"] = datetime.datetime.utcnow().isoformat()
+    return record
+
+def write_import_chunk(inserts, updates):
+    """Bulk insert + bulk upsert (by id) of one chunk. Returns {(tipo, digits): (id or None, error or None)}."""
+    results = {}
+    for rows, on_conflict in ((inserts, None), (updates, 'id')):
+        if not rows:
+            continue
+        try:
+            written = clients_repo.upsert_many(rows, on_conflict=on_conflict)
+        except (sqlite3.IntegrityError, RepoError):
+            # One bad row rejects the whole batch; retry row by row to isolate it
+            written = []
+            for row in rows:
+                try:
+                    written += clients_repo.upsert_many([row], on_conflict=on_conflict)
+                except sqlite3.IntegrityError:
+                    results[(row['tipo_pessoa'], row['cpf_digits'])] = (None, 'CPF/CNPJ já cadastrado no sistema')
+                except RepoError as e:
+                    print(f"[IMPORT] write failed: {e}")
+                    results[(row['tipo_pessoa'], row['cpf_digits'])] = (None, 'Falha ao gravar no Supabase')
+        for row in written:
+            results[(row.get('tipo_pessoa'), row.get('cpf_digits'))] = (row.get('id'), None)
+    return results
+
+@app.route('/api/clients/import', methods=['POST'])
+@app.route('/api/manage-clients/import', methods=['POST'])
+@token_required
+def import_clients():
+    """Bulk import from CSV or NDJSON (multipart field 'file' or the raw body).
+
+    ?type=pf|pj is the default tipo_pessoa for rows without one; ?on_duplicate=update
+    overwrites existing clients the user may edit (default: skip). Returns a per-line report.
+    """
+    if client_import is None:
+        return jsonify({'success': False, 'error': 'Importação indisponível neste servidor'}), 503
+    try:
+        upload = request.files.get('file')
+        if upload:
+            raw, filename, content_type = upload.read(), upload.filename, upload.mimetype
+        else:
+            raw, filename, content_type = request.get_data(), '', request.content_type
+        if not raw:
+            return jsonify({'success': False, 'error': 'Arquivo vazio'}), 400
+        fmt = request.args.get('format') or client_import.detect_format(content_type, filename)
+        records = client_import.parse_records(raw, fmt)
+        if len(records) > IMPORT_MAX_ROWS:
+            return jsonify({'success': False, 'error': f'Máximo de {IMPORT_MAX_ROWS} linhas por importação'}), 413
+
+        default_tipo = request.args.get('type', 'pf').upper()
+        update_existing = request.args.get('on_duplicate', 'skip').lower() == 'update'
+        can_edit_any = request.user_role == 'admin'
+        if not can_edit_any:
+            can_edit_any = user_permissions(request.user_id).get('canViewAllClients', False)
+        owner = str(request.user_id)
+
+        rows = client_import.prepare_rows(records, default_tipo=default_tipo)
+        valid = [r for r in rows if 'status' not in r]
+        existing = find_clients_by_cpf_digits_batch([(r['tipo_pessoa'], r['cpf_digits']) for r in valid])
+
+        inserts, updates = [], []
+        for row in valid:
+            current = existing.get((row['tipo_pessoa'], row['cpf_digits']))
+            if not current:
+                inserts.append(row)
+            elif not update_existing:
+                row.update(status='duplicate', id=current['id'], error='CPF/CNPJ já cadastrado')
+            elif can_edit_any or str(current.get('created_by') or '') == owner:
+                row['id'] = current['id']
+                row['owner'] = str(current.get('created_by') or '')
+                updates.append(row)
+            else:
+                row.update(status='duplicate', error='CPF/CNPJ já cadastrado no sistema. Solicite ao administrador.')
+
+        for i in range(0, max(len(inserts), len(updates)), IMPORT_CHUNK_SIZE):
+            chunk_inserts = inserts[i:i + IMPORT_CHUNK_SIZE]
+            chunk_updates = updates[i:i + IMPORT_CHUNK_SIZE]
+            ins = [import_client_record(r, owner) for r in chunk_inserts]
+            upd = [import_client_record(r, owner, client_id=r['id']) for r in chunk_updates]
+            results = write_import_chunk(ins, upd)
+            clients_changed(
+                keys=[(r['tipo_pessoa'], r['cpf_digits']) for r in chunk_inserts + chunk_updates],
+                lists=[(r['tipo_pessoa'], owner) for r in chunk_inserts] + [(r['tipo_pessoa'], r['owner']) for r in chunk_updates]
+            )
+            for row, status in [(r, 'inserted') for r in chunk_inserts] + [(r, 'updated') for r in chunk_updates]:
+                client_id, error = results.get((row['tipo_pessoa'], row['cpf_digits']), (None, 'Falha ao gravar'))
+                if error:
+                    row.update(status='error', error=error)
+                else:
+                    row.update(status=status, id=client_id)
+
+        report = [{k: r.get(k) for k in ('line', 'status', 'id', 'nome', 'error') if r.get(k) is not None} for r in rows]
+        summary = {}
+        for r in report:
+            summary[r['status']] = summary.get(r['status'], 0) + 1
+        print(f"[IMPORT] user {owner}: {len(rows)} rows -> {summary}")
+        return jsonify({'success': True, 'total': len(rows), 'summary': summary, 'rows': report})
+    except Exception as e:
+        print(f"[ERROR] import_clients: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/users', methods=['GET', 'POST'])
@@ -1258,18 +1993,13 @@ def manage_users():
         return jsonify({'message': 'Forbidden'}), 403
     
     if request.method == 'GET':
-        users = query_db("SELECT id, username, nome, role, permissions, active FROM users ORDER BY id")
+        users = users_repo.list()
+        # One grouped count for every user instead of a COUNT per user
+        counts = clients_repo.count_by_owner([u['id'] for u in users])
         for u in users:
-             u['permissions'] = json.loads(u['permissions']) if u['permissions'] else {}
-             count_row = query_db("SELECT COUNT(*) as count FROM clients WHERE created_by = ?", (str(u['id']),), one=True)
-             if isinstance(count_row, dict):
-                 count_val = count_row.get('count', 0)
-             elif isinstance(count_row, (list, tuple)) and len(count_row) > 0:
-                 count_val = count_row[0]
-             else:
-                 count_val = 0
+             u['permissions'] = json.loads(u['permissions']) if isinstance(u['permissions'], str) and u['permissions'] else (u['permissions'] or {})
              try:
-                 u['clients_count'] = int(count_val or 0)
+                 u['clients_count'] = int(counts.get(str(u['id'])) or 0)
              except:
                  u['clients_count'] = 0
         return jsonify({'users': users})
@@ -1282,8 +2012,13 @@ def manage_users():
             return jsonify({'message': 'Missing fields'}), 400
         
         pw_hash = hash_password(password)
-        query_db("INSERT INTO users (username, password_hash, nome, role, active, permissions) VALUES (?, ?, ?, ?, ?, ?)",
-                (username, pw_hash, data.get('nome'), 'user', True, json.dumps(data.get('permissions', {}))), commit=True)
+        try:
+            users_repo.create({'username': username, 'password_hash': pw_hash, 'nome': data.get('nome'),
+                               'role': 'user', 'active': True, 'permissions': data.get('permissions', {})})
+        except sqlite3.IntegrityError:
+            return jsonify({'message': 'Username already exists'}), 409
+        # SQLite may reuse a deleted user's id; never serve that user's cached permissions
+        permission_cache.invalidate()
         return jsonify({'success': True})
 
 @app.route('/api/users/me/password', methods=['PUT'])
@@ -1298,7 +2033,7 @@ def change_my_password():
         if len(new_password) < 4:
             return jsonify({'message': 'Password too short'}), 400
 
-        user = query_db("SELECT id, password_hash FROM users WHERE id = ?", (request.user_id,), one=True)
+        user = users_repo.get(request.user_id, ('id', 'password_hash'))
         if not user:
             return jsonify({'message': 'User not found'}), 404
         stored_hash = user.get('password_hash') if isinstance(user, dict) else (user[1] if isinstance(user, (list, tuple)) and len(user) > 1 else None)
@@ -1306,7 +2041,7 @@ def change_my_password():
             return jsonify({'message': 'Invalid current password'}), 400
 
         new_hash = hash_password(new_password)
-        query_db("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, request.user_id), commit=True)
+        users_repo.update(request.user_id, {'password_hash': new_hash})
         return jsonify({'success': True})
     except Exception as e:
         print(f"[ERROR] change_my_password: {str(e)}")
@@ -1319,28 +2054,24 @@ def user_ops(user_id):
         return jsonify({'message': 'Forbidden'}), 403
         
     if request.method == 'DELETE':
-        query_db("DELETE FROM users WHERE id = ?", (user_id,), commit=True)
+        users_repo.delete(user_id)
+        permission_cache.invalidate(user_id)
         return jsonify({'success': True})
     
     if request.method == 'PUT':
         data = request.get_json()
-        # Simple update logic
-        updates = []
-        params = []
+        fields = {}
         if 'nome' in data:
-            updates.append("nome = ?")
-            params.append(data['nome'])
+            fields['nome'] = data['nome']
         if 'active' in data:
-            updates.append("active = ?")
-            params.append(bool(data['active']))
+            fields['active'] = bool(data['active'])
         if 'permissions' in data:
-            updates.append("permissions = ?")
-            params.append(json.dumps(data['permissions']))
-            
-        if not updates: return jsonify({'message': 'No data'}), 400
-        
-        params.append(user_id)
-        query_db(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", tuple(params), commit=True)
+            fields['permissions'] = data['permissions']
+
+        if not fields: return jsonify({'message': 'No data'}), 400
+
+        users_repo.update(user_id, fields)
+        permission_cache.invalidate(user_id)
         return jsonify({'success': True})
 
 @app.route('/api/generate_proposal', methods=['POST'])
@@ -1384,23 +2115,7 @@ def generate_proposal():
 
         lot = data.get("lot") if isinstance(data.get("lot"), dict) else {}
         obra_code = str(lot.get("Obra") or "").strip()
-        obra_map = {
-            "600": {"cidade": "Dom Eliseu", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - DOM ELISEU"},
-            "601": {"cidade": "Capanema", "uf": "PA", "descricao": "RESIDENCIAL JARDIM AMERICA - CAPANEMA"},
-            "602": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL SALLES JARDIM - CASTANHAL"},
-            "603": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL JARDIM CASTANHAL - CASTANHAL"},
-            "604": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL IPITINGA - TOMÉ-AÇU"},
-            "605": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPITINGA - TOMÉ-AÇU"},
-            "610": {"cidade": "Tailândia", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - TAILANDIA"},
-            "616": {"cidade": "Barcarena", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE - BARCARENA"},
-            "618": {"cidade": "Tailândia", "uf": "PA", "descricao": "RESIDENCIAL JARDIM DO VALLE II - TAILANDIA"},
-            "620": {"cidade": "Paragominas", "uf": "PA", "descricao": "RESIDENCIAL JARDIM VALLE DO URAIM - PARAGOMINAS"},
-            "621": {"cidade": "Rondon do Pará", "uf": "PA", "descricao": "RESIDENCIAL PARQUE DO VALLE - RONDON"},
-            "623": {"cidade": "Castanhal", "uf": "PA", "descricao": "RESIDENCIAL JARDIM CASTANHAL III - CASTANHAL"},
-            "624": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPITINGA II - TOMÉ-AÇU"},
-            "625": {"cidade": "Tomé-Açu", "uf": "PA", "descricao": "RESIDENCIAL VALLE DO IPÊS - TOMÉ AÇU"},
-        }
-        obra_info = obra_map.get(obra_code) or {}
+        obra_info = OBRA_INFO.get(obra_code) or {}
 
         pdf_data = dict(data)
 
@@ -1562,6 +2277,30 @@ def generate_proposal():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/replica/status')
+@token_required
+def replica_status():
+    if request.user_role != 'admin':
+        return jsonify({'message': 'Forbidden'}), 403
+    if replica is None:
+        return jsonify({"enabled": False})
+    if request.args.get('sync') in ('1', 'true'):
+        replica.sync_once()
+    return jsonify(dict(replica.status(), enabled=True))
+
+@app.route('/api/queries/stats')
+@token_required
+def query_stats_summary():
+    """Rolling latency per query fingerprint and the most recent slow queries (admin only)."""
+    if request.user_role != 'admin':
+        return jsonify({'message': 'Forbidden'}), 403
+    try:
+        limit = max(1, min(500, int(request.args.get('limit', 50))))
+    except ValueError:
+        limit = 50
+    sort = request.args.get('sort', 'total')
+    return jsonify(dict(query_stats.summary(limit=limit, sort=sort), **query_stats.stats()))
+
 @app.route('/api/health')
 def health_check():
     return jsonify({"status": "healthy", "python": sys.version})
@@ -1571,5 +2310,8 @@ try:
     print("[STARTUP] Running database migration...")
     migrate_db_internal()
     print("[STARTUP] Database migration completed successfully")
+    if replica is not None:
+        replica.start()
+        print("[STARTUP] Supabase read replica sync started")
 except Exception as e:
     print(f"[STARTUP] Database migration failed: {e}")
@@ -0,0 +1,51 @@
+import hashlib
+
+from ttl_cache import TTLCache
+
+# In-process cache of GET /api/clients responses.
+# ClientListPage and ClientSelectionModal reload the list every time they open. A response
+# depends only on tipo_pessoa, the owner scope (one user's clients, or '*' for users who see every
+# client) and the query string, so it is stored once per (tipo, scope, query) as the serialized
+# JSON body plus an ETag. Client writes drop exactly the (tipo, owner) lists they can affect,
+# together with the '*' lists of that tipo (see clients_changed in index.py); expiry and the
+# bound on total body bytes come from ttl_cache.py.
+
+ALL_OWNERS = '*'
+
+
+def make_etag(body):
+    """Strong ETag value (unquoted, as werkzeug's set_etag expects)."""
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ListCache:
+    def __init__(self, ttl=30.0, max_bytes=32 * 1024 * 1024):
+        # Entries are (etag, body) under (tipo, scope, query); size is the body length
+        self._cache = TTLCache(ttl, max_bytes, size_of=lambda value: len(value[1]))
+
+    def generation(self):
+        """Pass to put(): a response built while an invalidation ran is not stored."""
+        return self._cache.generation()
+
+    def get(self, tipo, scope, query):
+        """(etag, body) or None."""
+        hit, value = self._cache.lookup((tipo, scope, query))
+        return value if hit else None
+
+    def put(self, tipo, scope, query, body, generation):
+        etag = make_etag(body)
+        self._cache.put((tipo, scope, query), (etag, body), generation)
+        return etag
+
+    def invalidate(self, tipo=None, owner=None):
+        """Drop the lists a write for (tipo, owner) can change; None means any tipo / any owner."""
+        scopes = None if owner is None else (ALL_OWNERS, str(owner))
+        self._cache.invalidate_where(
+            lambda key: (tipo is None or key[0] == tipo) and (scopes is None or key[1] in scopes)
+        )
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats["lists"] = len({key[:2] for key in self._cache.keys()})
+        stats["bytes"] = stats.pop("size")
+        return stats
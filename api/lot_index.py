@@ -0,0 +1,216 @@
+import threading
+import warnings
+import numpy as np
+
+# In-memory, vectorized view of one obra's availability snapshot.
+# Rebuilt on every ingest (see on_consulta_ingest in index.py) and queried by the lot endpoints.
+
+STATUS_DISPONIVEL = '0'
+
+# Feature columns used for similarity (order matters, see FEATURE_WEIGHTS)
+FEATURE_NAMES = ['M2', 'M_Frente', 'M_Fundo', 'M_Lado_Direito', 'M_Lado_Esquerdo', 'Chanfro', 'Valor_Terreno']
+# Area and price dominate what a customer compares; side measurements refine the shape
+FEATURE_WEIGHTS = np.array([2.0, 1.0, 1.0, 0.5, 0.5, 0.5, 2.0])
+
+# Derived per-lot metrics (computed once per snapshot, see LotSnapshot._derive_metrics)
+DERIVED_METRICS = ['preco_m2', 'perimetro', 'profundidade_media', 'razao_profundidade_frente', 'compacidade']
+METRIC_NAMES = FEATURE_NAMES + DERIVED_METRICS
+
+
+def parse_br_number(value):
+    """'214.672,60' -> 214672.6; anything unparseable ('- / -', '') -> nan"""
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    s = str(value).replace('R$', '').strip()
+    if not s:
+        return np.nan
+    if ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    try:
+        return float(s)
+    except ValueError:
+        return np.nan
+
+
+def normalize_lot_key(qd, lt):
+    def norm(v):
+        return str(v or '').strip().lstrip('0') or '0'
+    return f"{norm(qd)}/{norm(lt)}"
+
+
+class LotSnapshot:
+    """Column arrays for one obra plus a scaled feature matrix for nearest-neighbour queries."""
+
+    def __init__(self, codigo, items):
+        self.codigo = str(codigo)
+        self.items = [it for it in (items or []) if isinstance(it, dict)]
+        n = len(self.items)
+
+        self.keys = {}
+        for i, it in enumerate(self.items):
+            self.keys.setdefault(normalize_lot_key(it.get('QD'), it.get('LT')), i)
+
+        raw = np.empty((n, len(FEATURE_NAMES)), dtype=np.float64)
+        for j, name in enumerate(FEATURE_NAMES):
+            raw[:, j] = [parse_br_number(it.get(name)) for it in self.items]
+        self.columns = {name: raw[:, j] for j, name in enumerate(FEATURE_NAMES)}
+
+        self.available = np.array(
+            [str(it.get('Status_Terreno') or '').strip().startswith(STATUS_DISPONIVEL) for it in self.items],
+            dtype=bool
+        )
+
+        # Impute gaps with the column median so a missing Chanfro doesn't push a lot to infinity
+        features = raw.copy()
+        features[:, 5] = np.nan_to_num(features[:, 5], nan=0.0)
+        with warnings.catch_warnings():
+            # Columns that are entirely empty just fall back to 0
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians = np.nanmedian(features, axis=0) if n else np.zeros(len(FEATURE_NAMES))
+        medians = np.nan_to_num(medians, nan=0.0)
+        gaps = np.isnan(features)
+        if gaps.any():
+            features[gaps] = np.take(medians, np.nonzero(gaps)[1])
+        # Area and price are compared on a log scale (10% bigger matters the same at any size)
+        features[:, 0] = np.log1p(np.maximum(features[:, 0], 0))
+        features[:, 6] = np.log1p(np.maximum(features[:, 6], 0))
+        self.features = features
+
+        scale = features.std(axis=0) if n else np.ones(len(FEATURE_NAMES))
+        scale[scale == 0] = 1.0
+        self.scale = scale
+
+        self.corner = np.nan_to_num(self.columns['Chanfro'], nan=0.0) > 0
+        self.metrics = dict(self.columns)
+        self.metrics.update(self._derive_metrics())
+
+    def _derive_metrics(self):
+        c = self.columns
+        chanfro = np.nan_to_num(c['Chanfro'], nan=0.0)
+        perimetro = c['M_Frente'] + c['M_Fundo'] + c['M_Lado_Direito'] + c['M_Lado_Esquerdo'] + chanfro
+        profundidade = (c['M_Lado_Direito'] + c['M_Lado_Esquerdo']) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics = {
+                'preco_m2': c['Valor_Terreno'] / c['M2'],
+                'perimetro': perimetro,
+                'profundidade_media': profundidade,
+                'razao_profundidade_frente': profundidade / c['M_Frente'],
+                # 1.0 for a circle; ~0.785 for a square, lower for long narrow lots
+                'compacidade': 4 * np.pi * c['M2'] / (perimetro ** 2),
+            }
+        for name, values in metrics.items():
+            values[~np.isfinite(values)] = np.nan
+        return metrics
+
+    def lot_metrics(self, row):
+        out = {}
+        for name in METRIC_NAMES:
+            v = self.metrics[name][row]
+            out[name] = None if np.isnan(v) else round(float(v), 4)
+        out['esquina'] = bool(self.corner[row])
+        return out
+
+    def __len__(self):
+        return len(self.items)
+
+    def find(self, qd, lt):
+        return self.keys.get(normalize_lot_key(qd, lt))
+
+
+def nearest_lots(target, index, candidates, k=5):
+    """k nearest available lots to target.items[index] across the candidate snapshots.
+
+    Uses target's feature scale for every candidate so distances are comparable across obras.
+    Returns a list of (snapshot, row, distance) sorted by distance.
+    """
+    query = target.features[index]
+    weights = FEATURE_WEIGHTS / target.scale
+
+    pool_snaps, pool_rows, pool_dist = [], [], []
+    for snap in candidates:
+        if not len(snap):
+            continue
+        rows = np.nonzero(snap.available)[0]
+        if snap is target:
+            rows = rows[rows != index]
+        if not rows.size:
+            continue
+        diff = (snap.features[rows] - query) * weights
+        pool_dist.append(np.sqrt(np.einsum('ij,ij->i', diff, diff)))
+        pool_rows.append(rows)
+        pool_snaps.extend([snap] * rows.size)
+
+    if not pool_dist:
+        return []
+    dist = np.concatenate(pool_dist)
+    rows = np.concatenate(pool_rows)
+    k = max(1, min(int(k), dist.size))
+    # Partial selection: only the k best are ordered
+    best = np.argpartition(dist, k - 1)[:k]
+    best = best[np.argsort(dist[best])]
+    return [(pool_snaps[i], int(rows[i]), float(dist[i])) for i in best]
+
+
+def percentile_rank(population, values):
+    """Mid-rank percentile (0-100) of each value within population, ignoring nan. No sort needed."""
+    population = population[~np.isnan(population)]
+    values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+    if not population.size:
+        return np.full(values.shape, np.nan)
+    below = (population[None, :] < values[:, None]).sum(axis=1)
+    equal = (population[None, :] == values[:, None]).sum(axis=1)
+    pct = (below + 0.5 * equal) * 100.0 / population.size
+    pct[np.isnan(values)] = np.nan
+    return pct
+
+
+def top_lots(snapshots, metric, n=10, ascending=True, available_only=True, corner_only=False):
+    """Top-n lots by metric across snapshots using partial selection.
+
+    Returns (ranked, population): ranked is a list of (snapshot, row, value) in rank order and
+    population is the array of metric values the ranking was drawn from (for percentiles).
+    """
+    pool_snaps, pool_rows, pool_vals = [], [], []
+    for snap in snapshots:
+        if not len(snap):
+            continue
+        values = snap.metrics[metric]
+        mask = ~np.isnan(values)
+        if available_only:
+            mask &= snap.available
+        if corner_only:
+            mask &= snap.corner
+        rows = np.nonzero(mask)[0]
+        if not rows.size:
+            continue
+        pool_rows.append(rows)
+        pool_vals.append(values[rows])
+        pool_snaps.extend([snap] * rows.size)
+
+    if not pool_vals:
+        return [], np.empty(0)
+    vals = np.concatenate(pool_vals)
+    rows = np.concatenate(pool_rows)
+    n = max(1, min(int(n), vals.size))
+    keyed = vals if ascending else -vals
+    best = np.argpartition(keyed, n - 1)[:n]
+    best = best[np.argsort(keyed[best], kind='stable')]
+    return [(pool_snaps[i], int(rows[i]), float(vals[i])) for i in best], vals
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def set_snapshot(codigo, items):
+    snap = LotSnapshot(codigo, items)
+    with _lock:
+        _snapshots[str(codigo)] = snap
+    return snap
+
+
+def get_snapshot(codigo):
+    with _lock:
+        return _snapshots.get(str(codigo))
@@ -0,0 +1,25 @@
+from ttl_cache import TTLCache
+
+# In-process cache of users.permissions keyed by user id.
+# Non-admin client routes check permissions on every request; against Supabase that was a full
+# REST round trip before the real query. Entries are dropped whenever an admin edits a user (see
+# user_ops in index.py) and otherwise expire after `ttl` seconds (ttl_cache.py).
+
+
+class PermissionCache:
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self._cache = TTLCache(ttl, max_entries)
+
+    def get(self, user_id, loader):
+        """Cached value for user_id, calling loader(user_id) on a miss or after expiry."""
+        return self._cache.get(str(user_id), lambda key: loader(user_id))
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry, or every entry when user_id is None."""
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(keys=[str(user_id)])
+
+    def stats(self):
+        return self._cache.stats()
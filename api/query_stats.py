@@ -0,0 +1,229 @@
+import re
+import datetime
+import threading
+from collections import Counter, deque
+from urllib.parse import urlsplit, parse_qsl
+
+from supabase_http import LatencyTracker
+
+# Per-request accounting of database work.
+# Every SQLite statement (query_sqlite, the single writer) and every Supabase REST call
+# (ResilientClient) reports to record(); while a Flask request is active on the calling thread
+# the query is attributed to it. At the end of the request the count, total DB time and the
+# fingerprints that ran more than once are reported (X-DB-* headers and a [QUERIES] log line),
+# which makes N+1 patterns such as one COUNT per user visible. Queries outside a request
+# (replica sync, snapshot writer, migrations) are not counted there.
+# Independently of requests, every call feeds a rolling latency summary per fingerprint, and calls
+# slower than slow_ms go to the slow query log (fingerprint, backend, duration, rows, route).
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+# PostgREST filter values: eq.5 -> eq.?, not.is.null -> not.is.?, in.(1,2) -> in.?
+_REST_VALUE = re.compile(r"^((?:not\.)?[a-z]+\.).*$", re.DOTALL)
+_REST_KEEP = ('select', 'order', 'on_conflict', 'columns')
+
+
+def sql_fingerprint(sql):
+    """SQL with literals replaced by ? and IN lists collapsed, so repeats of a statement match."""
+    text = _SQL_STRING.sub('?', sql)
+    text = _SQL_NUMBER.sub('?', text)
+    text = _SQL_IN_LIST.sub('(...)', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def rest_fingerprint(method, url):
+    """METHOD table?params with filter values dropped (select/order/on_conflict kept)."""
+    parts = urlsplit(url)
+    path = parts.path.split('/rest/v1/', 1)[-1]
+    params = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if key not in _REST_KEEP:
+            value = _REST_VALUE.sub(r'\1?', value) if _REST_VALUE.match(value) else '?'
+        params.append(f"{key}={value}")
+    return f"{method} {path}" + (f"?{'&'.join(params)}" if params else "")
+
+
+def rest_row_count(response):
+    """Rows in a PostgREST response from its Content-Range ("0-49/*", "*/0"), or None."""
+    if response is None:
+        return None
+    content_range, _, total = (response.headers.get('Content-Range') or '').partition('/')
+    if content_range.strip() == '*':
+        return 0 if total.strip() == '0' else None
+    start, _, end = content_range.strip().partition('-')
+    if start.isdigit() and end.isdigit():
+        return int(end) - int(start) + 1
+    return None
+
+
+class RequestQueries:
+    def __init__(self, route):
+        self.route = route
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.backends = Counter()
+
+    def repeated(self, minimum=2):
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= minimum]
+
+
+class FingerprintTotals:
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow = 0
+        self.rows = 0
+        self.counted = 0
+        self.last_route = None
+
+
+class QueryStats:
+    def __init__(self, budget=20, repeat_limit=5, debug=False, slow_ms=200.0, slow_log_size=200,
+                 max_fingerprints=500):
+        self.budget = budget
+        self.repeat_limit = repeat_limit
+        self.debug = debug
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.over_budget = 0
+        self.repeat_warnings = 0
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.latency = LatencyTracker(window=256, min_samples=1)
+        self._totals = {}
+        self.untracked = 0
+
+    def begin(self, route):
+        self._local.current = RequestQueries(route)
+
+    def current(self):
+        return getattr(self._local, 'current', None)
+
+    def record(self, backend, fingerprint, seconds, rows=None):
+        """Account one query: fingerprint summary, slow log, and the request running on this thread."""
+        current = self.current()
+        route = current.route if current is not None else None
+        slow = seconds * 1000 >= self.slow_ms
+        with self._lock:
+            totals = self._totals.get(fingerprint)
+            if totals is None and len(self._totals) < self.max_fingerprints:
+                totals = self._totals[fingerprint] = FingerprintTotals(backend)
+            if totals is None:
+                self.untracked += 1
+            else:
+                totals.calls += 1
+                totals.seconds += seconds
+                totals.max_seconds = max(totals.max_seconds, seconds)
+                if rows is not None:
+                    totals.rows += rows
+                    totals.counted += 1
+                totals.slow += 1 if slow else 0
+                totals.last_route = route or totals.last_route
+            if slow:
+                self.slow_log.append({
+                    "at": datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                    "backend": backend,
+                    "fingerprint": fingerprint,
+                    "ms": round(seconds * 1000, 1),
+                    "rows": rows,
+                    "route": route,
+                })
+        if totals is not None:
+            self.latency.record(fingerprint, seconds)
+        if slow:
+            print(f"[SLOW QUERY] {seconds * 1000:.0f}ms {backend} rows={rows} route={route or '-'} {fingerprint}")
+        if current is None:
+            return
+        current.count += 1
+        current.seconds += seconds
+        current.fingerprints[fingerprint] += 1
+        current.backends[backend] += 1
+
+    def record_sql(self, sql, seconds, rows=None):
+        self.record('sqlite', sql_fingerprint(sql), seconds, rows)
+
+    def record_rest(self, method, url, seconds, response=None):
+        self.record('supabase', rest_fingerprint(method, url), seconds, rest_row_count(response))
+
+    def finish(self):
+        """End the request on this thread: log it and return its RequestQueries (None if none began)."""
+        current = self.current()
+        self._local.current = None
+        if current is None:
+            return None
+        repeated = current.repeated()
+        warnings = []
+        if current.count > self.budget:
+            warnings.append(f"{current.count} queries (budget {self.budget})")
+        worst = repeated[0] if repeated else None
+        if worst and worst[1] >= self.repeat_limit:
+            warnings.append(f"same query {worst[1]}x: {worst[0]}")
+        with self._lock:
+            self.requests += 1
+            if current.count > self.budget:
+                self.over_budget += 1
+            if worst and worst[1] >= self.repeat_limit:
+                self.repeat_warnings += 1
+        if self.debug or repeated:
+            backends = ', '.join(f"{b}={n}" for b, n in sorted(current.backends.items()))
+            print(f"[QUERIES] {current.route}: {current.count} queries ({backends}), {current.seconds * 1000:.1f}ms in DB"
+                  + ''.join(f"\n[QUERIES]   {n}x {fp}" for fp, n in repeated))
+        if self.debug:
+            for warning in warnings:
+                print(f"[QUERIES WARN] {current.route}: {warning}")
+        return current
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "over_budget": self.over_budget,
+                "repeat_warnings": self.repeat_warnings,
+                "budget": self.budget,
+                "repeat_limit": self.repeat_limit,
+                "debug": self.debug,
+                "slow_ms": self.slow_ms,
+                "slow_logged": len(self.slow_log),
+            }
+
+    def summary(self, limit=50, sort='total'):
+        """Per-fingerprint latency (percentiles over the last 256 calls), heaviest first."""
+        with self._lock:
+            items = [(fp, vars(t).copy()) for fp, t in self._totals.items()]
+            untracked = self.untracked
+        keys = {'total': lambda t: t['seconds'], 'calls': lambda t: t['calls'],
+                'max': lambda t: t['max_seconds'], 'slow': lambda t: t['slow']}
+        items.sort(key=lambda item: keys.get(sort, keys['total'])(item[1]), reverse=True)
+        fingerprints = []
+        for fp, t in items[:limit]:
+            p50, p95, p99 = (self.latency.percentile(fp, q) for q in (50, 95, 99))
+            fingerprints.append({
+                "fingerprint": fp,
+                "backend": t['backend'],
+                "calls": t['calls'],
+                "total_ms": round(t['seconds'] * 1000, 1),
+                "avg_ms": round(t['seconds'] * 1000 / t['calls'], 2),
+                "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "p99_ms": None if p99 is None else round(p99 * 1000, 1),
+                "max_ms": round(t['max_seconds'] * 1000, 1),
+                "slow": t['slow'],
+                "avg_rows": round(t['rows'] / t['counted'], 1) if t['counted'] else None,
+                "last_route": t['last_route'],
+            })
+        with self._lock:
+            slow = list(self.slow_log)
+        return {
+            "slow_ms": self.slow_ms,
+            "fingerprints": fingerprints,
+            "fingerprints_tracked": len(items),
+            "untracked_calls": untracked,
+            "slow_queries": slow[::-1],
+        }
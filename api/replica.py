@@ -0,0 +1,339 @@
+import json
+import time
+import datetime
+import threading
+from urllib.parse import quote
+
+import requests
+
+# Local SQLite read replica of the Supabase tables.
+# Supabase stays the source of truth for writes; reads are served from SQLite while the replica
+# is fresh. Each table is pulled incrementally by (updated_at, id) keyset (needs the updated_at
+# triggers from DEPLOY.md 2.4), deletes are caught by a periodic id reconciliation, and the app's
+# own writes are applied locally as soon as Supabase confirms them (see the repositories in repositories.py).
+
+STATE_TABLE = 'replica_state'
+
+# Local unique constraints; a row arriving from Supabase replaces whatever stale local row holds its key
+UNIQUE_KEYS = {
+    'clients': "tipo_pessoa = ? AND cpf_digits = ? AND cpf_digits != ''",
+    'users': "username = ?",
+}
+UNIQUE_KEY_COLUMNS = {
+    'clients': ('tipo_pessoa', 'cpf_digits'),
+    'users': ('username',),
+}
+
+
+def _parse_timestamp(value):
+    try:
+        ts = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    # SQLite-style naive timestamps are UTC
+    return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+
+def _newer(ts, than):
+    """PostgREST trims trailing zeros from fractions, so compare parsed values, not strings."""
+    if than is None:
+        return True
+    a, b = _parse_timestamp(ts), _parse_timestamp(than)
+    return a > b if a and b else str(ts) > str(than)
+
+
+def _shift_timestamp(value, seconds):
+    """ISO timestamp moved back by `seconds`; unparseable values are returned as-is."""
+    ts = _parse_timestamp(value)
+    return value if ts is None else (ts - datetime.timedelta(seconds=seconds)).isoformat()
+
+
+def _pg_quote(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _local_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def upsert_rows(conn, table, rows, local_columns):
+    """Batched upsert by id of Supabase rows into a local table (caller commits).
+
+    Columns the local table doesn't have are ignored; a stale local row holding the same
+    unique key under another id is removed first.
+    """
+    rows = [r for r in (rows or []) if isinstance(r, dict) and r.get('id') is not None]
+    if not rows:
+        return 0
+    cols = [c for c in local_columns if c in rows[0]]
+    if 'id' not in cols:
+        return 0
+    key_cols = UNIQUE_KEY_COLUMNS.get(table)
+    if key_cols and all(c in cols for c in key_cols):
+        conn.executemany(
+            f"DELETE FROM {table} WHERE {UNIQUE_KEYS[table]} AND id != ?",
+            [tuple(r.get(c) for c in key_cols) + (r['id'],) for r in rows]
+        )
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != 'id')
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+        f"ON CONFLICT(id) DO UPDATE SET {updates}",
+        [tuple(_local_value(r.get(c)) for c in cols) for r in rows]
+    )
+    return len(rows)
+
+
+class SupabaseReplica:
+    def __init__(self, supabase_url, supabase_key, connection_factory, tables=('clients', 'users'),
+                 interval=15.0, max_lag=60.0, reconcile_interval=300.0, overlap=10.0,
+                 batch_size=1000, timeout=10, writer=None):
+        self.url = supabase_url.rstrip('/')
+        self.key = supabase_key
+        self.connection = connection_factory
+        self.tables = tuple(tables)
+        self.interval = interval
+        self.max_lag = max_lag
+        self.reconcile_interval = reconcile_interval
+        # Rows whose transaction committed after a later updated_at was already seen are
+        # re-read by starting each pull `overlap` seconds before the watermark
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # SQLiteWriter shared with the app, so replica writes join its group commits
+        self.writer = writer
+        self._sync_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._errors = {}
+        self._last_pull = {}
+        self._columns = {}
+        self._ensure_state_table()
+
+    # --- local state -------------------------------------------------------------------
+
+    def _ensure_state_table(self):
+        conn = self.connection()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                table_name TEXT PRIMARY KEY,
+                watermark TEXT,
+                watermark_id INTEGER DEFAULT 0,
+                synced_at REAL,
+                reconciled_at REAL,
+                rows_pulled INTEGER DEFAULT 0
+            )
+        """)
+        conn.commit()
+
+    def _state(self, table):
+        row = self.connection().execute(
+            f"SELECT watermark, watermark_id, synced_at, reconciled_at, rows_pulled FROM {STATE_TABLE} WHERE table_name = ?",
+            (table,)
+        ).fetchone()
+        if not row:
+            return {'watermark': None, 'watermark_id': 0, 'synced_at': None, 'reconciled_at': None, 'rows_pulled': 0}
+        return dict(zip(('watermark', 'watermark_id', 'synced_at', 'reconciled_at', 'rows_pulled'), tuple(row)))
+
+    def _save_state(self, conn, table, **fields):
+        state = self._state(table)
+        state.update(fields)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} (table_name, watermark, watermark_id, synced_at, reconciled_at, rows_pulled) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (table, state['watermark'], state['watermark_id'], state['synced_at'], state['reconciled_at'], state['rows_pulled'])
+        )
+
+    def _write(self, fn):
+        if self.writer is not None:
+            return self.writer.call(fn)
+        conn = self.connection()
+        result = fn(conn)
+        conn.commit()
+        return result
+
+    def _local_columns(self, table):
+        if table not in self._columns:
+            rows = self.connection().execute(f"PRAGMA table_info({table})").fetchall()
+            self._columns[table] = [row[1] for row in rows]
+        return self._columns[table]
+
+    # --- Supabase ----------------------------------------------------------------------
+
+    def _fetch(self, table, params):
+        url = f"{self.url}/rest/v1/{table}?{params}"
+        headers = {"apikey": self.key, "Authorization": f"Bearer {self.key}"}
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code in (200, 206):
+            return response.json()
+        if response.status_code == 416:
+            return []
+        raise RuntimeError(f"{table}: HTTP {response.status_code}: {response.text[:200]}")
+
+    # --- applying rows -----------------------------------------------------------------
+
+    def apply_rows(self, table, rows, conn=None):
+        """Upsert Supabase rows into the local table (by id). Returns the number applied."""
+        rows = [r for r in (rows or []) if isinstance(r, dict) and r.get('id') is not None]
+        if not rows:
+            return 0
+        if conn is None:
+            return self._write(lambda c: self.apply_rows(table, rows, conn=c))
+        return upsert_rows(conn, table, rows, self._local_columns(table))
+
+    # --- sync --------------------------------------------------------------------------
+
+    def pull(self, table):
+        """Incremental pull of one table; returns the number of rows applied."""
+        started = time.time()
+        t0 = time.perf_counter()
+        state = self._state(table)
+        applied = 0
+        full = state['watermark'] is None
+        watermark, watermark_id = state['watermark'], state['watermark_id'] or 0
+        if full:
+            # First sync: walk the whole table by id, remembering the newest updated_at
+            last_id = 0
+            while True:
+                batch = self._fetch(table, f"select=*&id=gt.{last_id}&order=id.asc&limit={self.batch_size}")
+                if not batch:
+                    break
+                applied += self.apply_rows(table, batch)
+                last_id = batch[-1]['id']
+                for row in batch:
+                    ts = row.get('updated_at')
+                    if ts and _newer(ts, watermark):
+                        watermark, watermark_id = ts, row['id']
+        else:
+            ts, last_id = _shift_timestamp(watermark, self.overlap), 0
+            while True:
+                keyset = quote(f"(updated_at.gt.{_pg_quote(ts)},and(updated_at.eq.{_pg_quote(ts)},id.gt.{last_id}))")
+                batch = self._fetch(
+                    table,
+                    f"select=*&or={keyset}&order=updated_at.asc,id.asc&limit={self.batch_size}"
+                )
+                if not batch:
+                    break
+                applied += self.apply_rows(table, batch)
+                ts, last_id = batch[-1].get('updated_at') or ts, batch[-1]['id']
+                if _newer(ts, watermark):
+                    watermark, watermark_id = ts, last_id
+        self._write(lambda conn: self._save_state(
+            conn, table, watermark=watermark, watermark_id=watermark_id,
+            synced_at=started, rows_pulled=(state['rows_pulled'] or 0) + applied
+        ))
+        self._last_pull[table] = {
+            'rows': applied,
+            'ms': round((time.perf_counter() - t0) * 1000, 1),
+            'full': full,
+        }
+        # The overlap window re-reads the newest rows every cycle; only log real progress
+        if full or watermark != state['watermark']:
+            print(f"[REPLICA] {table}: {applied} rows pulled ({'full' if full else 'incremental'})")
+        if full:
+            self.reconcile(table)
+        return applied
+
+    def reconcile(self, table):
+        """Delete local rows whose id no longer exists in Supabase (deletes are invisible to pull)."""
+        remote_ids, last_id = set(), 0
+        while True:
+            batch = self._fetch(table, f"select=id&id=gt.{last_id}&order=id.asc&limit={self.batch_size}")
+            if not batch:
+                break
+            remote_ids.update(int(r['id']) for r in batch)
+            last_id = batch[-1]['id']
+
+        def delete_stale(conn):
+            local_ids = {row[0] for row in conn.execute(f"SELECT id FROM {table}").fetchall()}
+            stale = local_ids - remote_ids
+            if stale:
+                conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(i,) for i in stale])
+            self._save_state(conn, table, reconciled_at=time.time())
+            return len(stale)
+
+        removed = self._write(delete_stale)
+        if removed:
+            print(f"[REPLICA] {table}: removed {removed} rows deleted upstream")
+        return removed
+
+    def sync_once(self, wait=True):
+        """Pull every table. With wait=False, returns immediately if a sync is already running."""
+        if not self._sync_lock.acquire(blocking=wait):
+            return False
+        try:
+            for table in self.tables:
+                try:
+                    self.pull(table)
+                    state = self._state(table)
+                    if not state['reconciled_at'] or time.time() - state['reconciled_at'] > self.reconcile_interval:
+                        self.reconcile(table)
+                    self._errors.pop(table, None)
+                except Exception as e:
+                    self._errors[table] = str(e)
+                    print(f"[REPLICA ERROR] {table}: {e}")
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def kick(self):
+        """Start a background sync unless one is running (serverless: no long-lived thread)."""
+        if self._sync_lock.locked():
+            return
+        threading.Thread(target=self.sync_once, kwargs={'wait': False}, daemon=True).start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                self.sync_once()
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=loop, name='supabase-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- routing -----------------------------------------------------------------------
+
+    def lag(self, table):
+        """Seconds since the start of the last successful pull (None before the first one)."""
+        synced_at = self._state(table)['synced_at']
+        return None if synced_at is None else max(0.0, time.time() - synced_at)
+
+    def serves(self, table):
+        """True when reads of `table` may be answered locally; otherwise they go to Supabase."""
+        if table not in self.tables:
+            return False
+        lag = self.lag(table)
+        if lag is None or lag > self.interval:
+            self.kick()
+        return lag is not None and lag <= self.max_lag
+
+    def status(self):
+        tables = {}
+        for table in self.tables:
+            state = self._state(table)
+            lag = self.lag(table)
+            tables[table] = {
+                'lag_seconds': None if lag is None else round(lag, 1),
+                'serving': 'local' if lag is not None and lag <= self.max_lag else 'supabase',
+                'watermark': state['watermark'],
+                'rows_pulled': state['rows_pulled'],
+                'reconciled_at': state['reconciled_at'],
+                'last_pull': self._last_pull.get(table),
+                'error': self._errors.get(table),
+            }
+        return {
+            'interval_seconds': self.interval,
+            'max_lag_seconds': self.max_lag,
+            'syncing': self._sync_lock.locked(),
+            'tables': tables,
+        }
@@ -0,0 +1,525 @@
+import json
+import sqlite3
+import datetime
+from urllib.parse import quote
+
+# Data access for the clients and users tables.
+# Each repository method has two native implementations: PostgREST (projection with select=,
+# eq./in. filters, HEAD counts with Prefer: count=, return=representation writes, merge-duplicates
+# upserts) when Supabase is configured, and SQL on the local SQLite database otherwise or while the read replica serves
+# the table. Nothing here parses SQL text; a call either maps to one explicit request/statement
+# or raises RepoError.
+
+# The SQLite writes use INSERT/UPDATE/DELETE ... RETURNING, so the API needs SQLite 3.35+ (this is
+# its only minimum; index.py warns at startup on an older build).
+SQLITE_MIN_VERSION = (3, 35, 0)
+
+
+class RepoError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP status of the failed PostgREST request, when there was one
+        self.status = status
+
+
+def pg_quote(value):
+    """Double-quote a value for PostgREST logical filters (or=/and=)."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _content_range_total(response):
+    """'0-0/1234' or '*/1234' -> 1234; None when the total is unknown ('*/*')."""
+    total = (response.headers.get('Content-Range') or '').rsplit('/', 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+
+class PostgREST:
+    """Minimal PostgREST client on top of the shared ResilientClient (supabase_http.py)."""
+
+    def __init__(self, url, key, http, count_mode='exact'):
+        self.base = f"{url.rstrip('/')}/rest/v1"
+        self.key = key
+        self.http = http
+        self.count_mode = count_mode
+
+    def _headers(self, prefer=None, extra=None):
+        headers = {
+            "apikey": self.key,
+            "Authorization": f"Bearer {self.key}",
+            "Content-Type": "application/json",
+        }
+        if prefer:
+            headers["Prefer"] = prefer
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def _send(self, method, table, params='', headers=None, body=None):
+        url = f"{self.base}/{table}" + (f"?{params}" if params else "")
+        response = self.http.request(method, url, f"{method} {table}", headers=headers or self._headers(), json=body)
+        print(f"[Supabase REST] {method} {url} -> {response.status_code}")
+        return response
+
+    def select(self, table, params):
+        response = self._send('GET', table, params)
+        if response.status_code not in (200, 206):
+            raise RepoError(f"GET {table}: HTTP {response.status_code} {response.text}", response.status_code)
+        return response.json()
+
+    def select_counted(self, table, params, mode=None):
+        """(rows, total) from one GET; total comes from Content-Range (Prefer: count=)."""
+        headers = self._headers(prefer=f"count={mode or self.count_mode}")
+        response = self._send('GET', table, params, headers=headers)
+        if response.status_code not in (200, 206):
+            raise RepoError(f"GET {table}: HTTP {response.status_code} {response.text}", response.status_code)
+        return response.json(), _content_range_total(response)
+
+    def count(self, table, params='', mode=None):
+        headers = self._headers(prefer=f"count={mode or self.count_mode}", extra={"Range-Unit": "items", "Range": "0-0"})
+        response = self._send('HEAD', table, params, headers=headers)
+        if response.status_code == 416:
+            return 0
+        if response.status_code not in (200, 206):
+            raise RepoError(f"HEAD {table}: HTTP {response.status_code}", response.status_code)
+        total = _content_range_total(response)
+        if total is None:
+            raise RepoError(f"HEAD {table}: no count in Content-Range")
+        return total
+
+    def write(self, method, table, params='', body=None, prefer="return=representation"):
+        response = self._send(method, table, params, headers=self._headers(prefer=prefer), body=body)
+        if response.status_code == 409:
+            raise sqlite3.IntegrityError(f"{method} {table}: {response.text}")
+        if response.status_code not in (200, 201, 204):
+            raise RepoError(f"{method} {table}: HTTP {response.status_code} {response.text}", response.status_code)
+        return response.json() if response.text else []
+
+    def rpc(self, function, args):
+        """Result of a Postgres function (POST /rpc/<function>); 404 means it isn't installed."""
+        response = self._send('POST', f"rpc/{function}", body=args)
+        if response.status_code != 200:
+            raise RepoError(f"rpc/{function}: HTTP {response.status_code} {response.text}", response.status_code)
+        return response.json()
+
+
+class Repo:
+    """Routing shared by the repositories.
+
+    rest: PostgREST or None (SQLite only). read(sql, params, one) and write(fn, label) run SQL on
+    the local database (write goes through the single writer). local_reads(table) says whether the
+    read replica may answer; mirror(table, rows) / mirror_delete(table, ids) keep it in step with
+    writes Supabase confirmed.
+    """
+
+    table = None
+    # Columns of a deleted row handed back by delete()
+    delete_returning = ('id',)
+
+    def __init__(self, rest, read, write, local_reads=None, mirror=None, mirror_delete=None):
+        self.rest = rest
+        self.read = read
+        self.write = write
+        self.local_reads = local_reads or (lambda table: False)
+        self.mirror = mirror or (lambda table, rows: None)
+        self.mirror_delete = mirror_delete or (lambda table, ids: None)
+
+    def _remote_reads(self):
+        return self.rest is not None and not self.local_reads(self.table)
+
+    def _get_by_id(self, row_id, columns):
+        if self._remote_reads():
+            rows = self.rest.select(self.table, f"select={','.join(columns)}&id=eq.{int(row_id)}&limit=1")
+            return rows[0] if rows else None
+        return self.read(f"SELECT {', '.join(columns)} FROM {self.table} WHERE id = ?", (row_id,), one=True)
+
+    def _count(self):
+        if self._remote_reads():
+            return self.rest.count(self.table)
+        row = self.read(f"SELECT COUNT(*) AS count FROM {self.table}", (), one=True)
+        return row['count'] if row else 0
+
+    def _insert(self, record):
+        if self.rest is not None:
+            rows = self.rest.write('POST', self.table, body=record)
+            self.mirror(self.table, rows)
+            return rows[0] if rows else None
+        cols = list(record)
+
+        def insert(conn):
+            cur = conn.execute(sql, [record[c] for c in cols])
+            row = cur.fetchone()
+            return dict(zip([d[0] for d in cur.description], row)) if row else None
+        sql = f"INSERT INTO {self.table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) RETURNING *"
+        return self.write(insert, label=sql)
+
+    def _update(self, row_id, fields, owner=None, touch=True):
+        """Updated row, or None when no row matched (missing id or, with owner, someone else's)."""
+        if self.rest is not None:
+            params = f"id=eq.{int(row_id)}" + (f"&created_by=eq.{quote(str(owner))}" if owner is not None else "")
+            body = dict(fields, updated_at=datetime.datetime.utcnow().isoformat()) if touch else fields
+            rows = self.rest.write('PATCH', self.table, params, body=body)
+            self.mirror(self.table, rows)
+            return rows[0] if rows else None
+        assignments = [f"{c} = ?" for c in fields] + (["updated_at = CURRENT_TIMESTAMP"] if touch else [])
+        args = list(fields.values()) + [row_id]
+        where = "id = ?"
+        if owner is not None:
+            where += " AND created_by = ?"
+            args.append(str(owner))
+
+        def update(conn):
+            cur = conn.execute(sql, args)
+            row = cur.fetchone()
+            return dict(zip([d[0] for d in cur.description], row)) if row else None
+        sql = f"UPDATE {self.table} SET {', '.join(assignments)} WHERE {where} RETURNING *"
+        return self.write(update, label=sql)
+
+    def _delete(self, row_id, owner=None):
+        """The deleted row (delete_returning columns), or None when no row matched."""
+        columns = self.delete_returning
+        if self.rest is not None:
+            params = f"id=eq.{int(row_id)}" + (f"&created_by=eq.{quote(str(owner))}" if owner is not None else "")
+            rows = self.rest.write('DELETE', self.table, params + f"&select={','.join(columns)}")
+            if rows:
+                self.mirror_delete(self.table, [r['id'] for r in rows])
+            return rows[0] if rows else None
+        where, args = "id = ?", [row_id]
+        if owner is not None:
+            where += " AND created_by = ?"
+            args.append(str(owner))
+        sql = f"DELETE FROM {self.table} WHERE {where} RETURNING {', '.join(columns)}"
+
+        def delete(conn):
+            row = conn.execute(sql, args).fetchone()
+            return dict(zip(columns, row)) if row else None
+        return self.write(delete, label=sql)
+
+    def _owner_scope(self, owner):
+        """(PostgREST filter, SQL condition, args) limiting a write to owner's rows; empty for None."""
+        if owner is None:
+            return "", "", []
+        return f"&created_by=eq.{quote(str(owner))}", " AND created_by = ?", [str(owner)]
+
+    def _update_many(self, ids, fields, owner=None):
+        """Ids of the rows updated, in one id-list statement/request."""
+        ids = [int(i) for i in ids]
+        rest_scope, sql_scope, scope_args = self._owner_scope(owner)
+        if self.rest is not None:
+            body = dict(fields, updated_at=datetime.datetime.utcnow().isoformat())
+            rows = self.rest.write('PATCH', self.table, f"id=in.({','.join(map(str, ids))}){rest_scope}", body=body)
+            self.mirror(self.table, rows)
+            return [r['id'] for r in rows]
+        assignments = ", ".join(f"{c} = ?" for c in fields)
+        sql = (f"UPDATE {self.table} SET {assignments}, updated_at = CURRENT_TIMESTAMP "
+               f"WHERE id IN ({', '.join('?' for _ in ids)}){sql_scope} RETURNING id")
+        args = [*fields.values(), *ids, *scope_args]
+        return self.write(lambda conn: [r[0] for r in conn.execute(sql, args).fetchall()], label=sql)
+
+    def _delete_many(self, ids, owner=None):
+        """Ids of the rows deleted, in one id-list statement/request."""
+        ids = [int(i) for i in ids]
+        rest_scope, sql_scope, scope_args = self._owner_scope(owner)
+        if self.rest is not None:
+            rows = self.rest.write('DELETE', self.table, f"id=in.({','.join(map(str, ids))}){rest_scope}&select=id")
+            deleted = [r['id'] for r in rows]
+            self.mirror_delete(self.table, deleted)
+            return deleted
+        sql = f"DELETE FROM {self.table} WHERE id IN ({', '.join('?' for _ in ids)}){sql_scope} RETURNING id"
+        args = [*ids, *scope_args]
+        return self.write(lambda conn: [r[0] for r in conn.execute(sql, args).fetchall()], label=sql)
+
+    def _existing_ids(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return set()
+        if self._remote_reads():
+            return {r['id'] for r in self.rest.select(self.table, f"select=id&id=in.({','.join(map(str, ids))})")}
+        rows = self.read(f"SELECT id FROM {self.table} WHERE id IN ({', '.join('?' for _ in ids)})", tuple(ids))
+        return {r['id'] for r in rows}
+
+    def _upsert_many(self, records, on_conflict=None):
+        """Written rows for a list of records with the same keys, in one request / writer unit.
+
+        Without on_conflict every record is inserted; with it (e.g. 'id') a record matching an
+        existing row updates that row instead (PostgREST merge-duplicates, SQLite ON CONFLICT
+        DO UPDATE, which also bumps updated_at). A constraint violation rejects the whole batch.
+        """
+        if not records:
+            return []
+        if self.rest is not None:
+            params, prefer = "", "return=representation"
+            if on_conflict:
+                params, prefer = f"on_conflict={on_conflict}", "resolution=merge-duplicates," + prefer
+            rows = self.rest.write('POST', self.table, params, body=records, prefer=prefer)
+            self.mirror(self.table, rows)
+            return rows
+        # updated_at is SQLite's CURRENT_TIMESTAMP, not the ISO string a caller may send to Supabase
+        cols = [c for c in records[0] if c != 'updated_at']
+        sql = f"INSERT INTO {self.table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})"
+        if on_conflict:
+            updates = [f"{c} = excluded.{c}" for c in cols if c != on_conflict] + ["updated_at = CURRENT_TIMESTAMP"]
+            sql += f" ON CONFLICT ({on_conflict}) DO UPDATE SET {', '.join(updates)}"
+        sql += " RETURNING *"
+
+        def upsert(conn):
+            rows = []
+            for record in records:
+                cur = conn.execute(sql, [record[c] for c in cols])
+                rows.append(dict(zip([d[0] for d in cur.description], cur.fetchone())))
+            return rows
+        return self.write(upsert, label=sql)
+
+
+class ClientsRepo(Repo):
+    table = 'clients'
+    delete_returning = ('id', 'tipo_pessoa', 'created_by')
+    LOOKUP_COLUMNS = ('id', 'nome', 'created_by')
+
+    def get(self, client_id, columns=('*',)):
+        return self._get_by_id(client_id, columns)
+
+    def find_by_cpf(self, tipo_pessoa, cpf_digits, exclude_id=None, columns=LOOKUP_COLUMNS):
+        """Client holding this normalized CPF/CNPJ (one probe on the unique index) or None."""
+        if not cpf_digits:
+            return None
+        if self._remote_reads():
+            params = (f"select={','.join(columns)}&tipo_pessoa=eq.{quote(tipo_pessoa)}"
+                      f"&cpf_digits=eq.{quote(cpf_digits)}&limit=1")
+            if exclude_id:
+                params += f"&id=neq.{int(exclude_id)}"
+            rows = self.rest.select(self.table, params)
+            return rows[0] if rows else None
+        sql = f"SELECT {', '.join(columns)} FROM clients WHERE tipo_pessoa = ? AND cpf_digits = ? AND cpf_digits != ''"
+        args = [tipo_pessoa, cpf_digits]
+        if exclude_id:
+            sql += " AND id != ?"
+            args.append(exclude_id)
+        return self.read(sql, tuple(args), one=True)
+
+    def count(self):
+        return self._count()
+
+    def latest(self, limit=5, columns=('id', 'nome', 'created_at', 'created_by')):
+        if self._remote_reads():
+            return self.rest.select(self.table, f"select={','.join(columns)}&order=id.desc&limit={int(limit)}")
+        return self.read(f"SELECT {', '.join(columns)} FROM clients ORDER BY id DESC LIMIT ?", (limit,))
+
+    def count_by_owner(self, owners):
+        """{created_by: number of clients} for the given owners (user ids); owners without clients are 0.
+
+        One grouped request with PostgREST aggregates (select=created_by,count(), needs
+        db_aggregates_enabled); when they are off, one exact HEAD count per owner, i.e. N sequential
+        requests for N owners (see DEPLOY.md 2.3). Never a scan of the created_by column, which
+        max-rows would silently truncate.
+        """
+        owners = [str(o) for o in dict.fromkeys(owners)]
+        counts = dict.fromkeys(owners, 0)
+        if not owners:
+            return counts
+        if self._remote_reads():
+            in_list = ','.join(quote(f'"{o}"') for o in owners)
+            try:
+                rows = self.rest.select(self.table, f"select=created_by,count:count()&created_by=in.({in_list})")
+            except RepoError:
+                rows = None
+            if rows is not None and (not rows or 'count' in rows[0]):
+                counts.update({str(row.get('created_by')): int(row.get('count') or 0) for row in rows})
+                return counts
+            for owner in owners:
+                counts[owner] = self.rest.count(self.table, f"created_by=eq.{quote(owner)}", mode='exact')
+            return counts
+        rows = self.read(f"SELECT created_by, COUNT(*) AS count FROM clients WHERE created_by IN ({', '.join('?' for _ in owners)}) "
+                         "GROUP BY created_by", tuple(owners))
+        counts.update({str(row['created_by']): row['count'] for row in rows})
+        return counts
+
+    def find_by_cpf_batch(self, tipo_pessoa, cpf_digits, columns=('id', 'nome', 'tipo_pessoa', 'cpf_digits', 'created_by')):
+        """Clients of one type holding any of these normalized CPF/CNPJs, in one IN lookup."""
+        cpf_digits = [d for d in cpf_digits if d]
+        if not cpf_digits:
+            return []
+        if self._remote_reads():
+            return self.rest.select(self.table, f"select={','.join(columns)}&tipo_pessoa=eq.{quote(tipo_pessoa)}"
+                                                f"&cpf_digits=in.({','.join(quote(d) for d in cpf_digits)})")
+        return self.read(
+            f"SELECT {', '.join(columns)} FROM clients "
+            f"WHERE tipo_pessoa = ? AND cpf_digits IN ({', '.join('?' for _ in cpf_digits)}) AND cpf_digits != ''",
+            (tipo_pessoa, *cpf_digits)
+        )
+
+    def page(self, tipo_pessoa, owner=None, search='', cursor=None, limit=50, with_count=False, fields=None,
+             sort='created_at', descending=True, columns=None, data_keys=None):
+        """(rows, total) of the client list ordered by (sort, id), continuing after cursor=(value, id).
+
+        Returns up to limit + 1 rows, so the caller can tell whether another page exists; total is
+        None unless with_count. Superseded legacy rows (cpf_digits NULL) are left out. fields maps
+        generated column -> exact value; sort and the field names must be trusted column names.
+        With columns, rows hold just those plus sort_key and, for the data_keys {name: key inside
+        data}, `data` itself (PostgREST can't project into the TEXT column) or the extracted values
+        (SQLite json_extract; NULL for legacy rows with invalid JSON).
+        """
+        search = (search or '').strip()
+        search_digits = ''.join(ch for ch in search if ch.isdigit())
+        fields = fields or {}
+        direction = 'desc' if descending else 'asc'
+        if self._remote_reads():
+            filters = [f"tipo_pessoa=eq.{quote(tipo_pessoa)}", "cpf_digits=not.is.null"]
+            if owner:
+                filters.append(f"created_by=eq.{quote(str(owner))}")
+            filters += [f"{field}=eq.{quote(value)}" for field, value in fields.items()]
+            if search:
+                terms = [f"nome.ilike.{pg_quote('*' + search + '*')}"]
+                if search_digits:
+                    terms.append(f"cpf_digits.like.{pg_quote('*' + search_digits + '*')}")
+                filters.append("or=" + quote(f"({','.join(terms)})"))
+            count_filters = "&".join(filters)
+            if cursor:
+                value, last_id = cursor
+                op = 'lt' if descending else 'gt'
+                filters.append("and=" + quote(f"(or({sort}.{op}.{pg_quote(value)},and({sort}.eq.{pg_quote(value)},id.{op}.{int(last_id)})))"))
+            select = ",".join(list(columns) + (['data'] if data_keys else []) + [f'sort_key:{sort}']) if columns else "*"
+            params = "&".join(filters) + f"&select={select}&order={sort}.{direction},id.{direction}&limit={int(limit) + 1}"
+            if with_count and not cursor:
+                return self.rest.select_counted(self.table, params)
+            rows = self.rest.select(self.table, params)
+            return rows, (self.rest.count(self.table, count_filters) if with_count else None)
+
+        where = ["tipo_pessoa = ?", "cpf_digits IS NOT NULL"]
+        args = [tipo_pessoa]
+        if owner:
+            where.append("created_by = ?")
+            args.append(str(owner))
+        if search:
+            if search_digits:
+                where.append("(nome LIKE ? OR cpf_digits LIKE ?)")
+                args.extend([f"%{search}%", f"%{search_digits}%"])
+            else:
+                where.append("nome LIKE ?")
+                args.append(f"%{search}%")
+        for field, value in fields.items():
+            where.append(f"clients.{field} = ?")
+            args.append(value)
+        total = None
+        if with_count:
+            row = self.read(f"SELECT COUNT(*) as count FROM clients WHERE {' AND '.join(where)}", tuple(args), one=True)
+            total = row['count'] if row else 0
+        if cursor:
+            where.append(f"(clients.{sort}, id) {'<' if descending else '>'} (?, ?)")
+            args.extend(cursor)
+        if columns:
+            select = ", ".join(list(columns) + [
+                f"CASE WHEN json_valid(data) THEN json_extract(data, '$.{key}') END AS {name}"
+                for name, key in (data_keys or {}).items()
+            ] + [f"clients.{sort} AS sort_key"])
+        else:
+            select = "*"
+        rows = self.read(
+            f"SELECT {select} FROM clients WHERE {' AND '.join(where)} ORDER BY clients.{sort} {direction}, id {direction} LIMIT ?",
+            tuple(args) + (int(limit) + 1,)
+        )
+        return rows, total
+
+    def ids_matching(self, tipo_pessoa=None, owner=None, fields=None, limit=1000):
+        """Ids (ascending) of the listed clients matching all the given filters, at most `limit`."""
+        fields = fields or {}
+        if self._remote_reads():
+            base = ["select=id", "cpf_digits=not.is.null", "order=id.asc"]
+            if tipo_pessoa:
+                base.append(f"tipo_pessoa=eq.{quote(tipo_pessoa)}")
+            if owner:
+                base.append(f"created_by=eq.{quote(str(owner))}")
+            base += [f"{field}=eq.{quote(value)}" for field, value in fields.items()]
+            ids, last = [], 0
+            # Keyset by id: Supabase caps each response at its max-rows setting
+            while len(ids) < limit:
+                size = min(1000, limit - len(ids))
+                rows = self.rest.select(self.table, "&".join(base + [f"id=gt.{last}", f"limit={size}"]))
+                ids.extend(r['id'] for r in rows)
+                if len(rows) < size:
+                    break
+                last = rows[-1]['id']
+            return ids
+        where, args = ["cpf_digits IS NOT NULL"], []
+        if tipo_pessoa:
+            where.append("tipo_pessoa = ?")
+            args.append(tipo_pessoa)
+        if owner:
+            where.append("created_by = ?")
+            args.append(str(owner))
+        for field, value in fields.items():
+            where.append(f"{field} = ?")
+            args.append(value)
+        rows = self.read(f"SELECT id FROM clients WHERE {' AND '.join(where)} ORDER BY id LIMIT ?", tuple(args) + (int(limit),))
+        return [r['id'] for r in rows]
+
+    def existing_ids(self, ids):
+        """The subset of ids that exist (whoever owns them)."""
+        return self._existing_ids(ids)
+
+    def insert(self, record):
+        """Inserted row; raises sqlite3.IntegrityError on a duplicate CPF/CNPJ (either backend)."""
+        return self._insert(record)
+
+    def upsert_many(self, records, on_conflict=None):
+        """Written rows; raises sqlite3.IntegrityError if any record hits a unique CPF/CNPJ (nothing is written)."""
+        return self._upsert_many(records, on_conflict=on_conflict)
+
+    def update(self, client_id, fields, owner=None):
+        return self._update(client_id, fields, owner=owner)
+
+    def delete(self, client_id, owner=None):
+        return self._delete(client_id, owner=owner)
+
+    def update_many(self, client_ids, fields, owner=None):
+        """Ids updated (owner limits it to that user's clients); sqlite3.IntegrityError rejects the whole list."""
+        return self._update_many(client_ids, fields, owner=owner)
+
+    def delete_many(self, client_ids, owner=None):
+        return self._delete_many(client_ids, owner=owner)
+
+
+class UsersRepo(Repo):
+    table = 'users'
+
+    def _to_row(self, record):
+        # permissions is JSON in Supabase and TEXT in SQLite
+        if self.rest is None and isinstance(record.get('permissions'), (dict, list)):
+            return dict(record, permissions=json.dumps(record['permissions']))
+        return record
+
+    def get(self, user_id, columns=('*',)):
+        return self._get_by_id(user_id, columns)
+
+    def find_by_username(self, username, active=True, columns=('*',)):
+        """User with this username (only an active one unless active=None) or None."""
+        if self._remote_reads():
+            params = f"select={','.join(columns)}&username=eq.{quote(username)}&limit=1"
+            if active is not None:
+                params += f"&active=eq.{'true' if active else 'false'}"
+            rows = self.rest.select(self.table, params)
+            return rows[0] if rows else None
+        sql, args = f"SELECT {', '.join(columns)} FROM users WHERE username = ?", [username]
+        if active is not None:
+            sql += " AND active = ?"
+            args.append(bool(active))
+        return self.read(sql, tuple(args), one=True)
+
+    def list(self, columns=('id', 'username', 'nome', 'role', 'permissions', 'active')):
+        if self._remote_reads():
+            return self.rest.select(self.table, f"select={','.join(columns)}&order=id.asc")
+        return self.read(f"SELECT {', '.join(columns)} FROM users ORDER BY id", ())
+
+    def count(self):
+        return self._count()
+
+    def create(self, record):
+        return self._insert(self._to_row(record))
+
+    def update(self, user_id, fields):
+        # Supabase sets users.updated_at with the trigger from DEPLOY.md 2.4
+        if self.rest is not None:
+            return self._update(user_id, fields, touch=False)
+        return self._update(user_id, self._to_row(fields))
+
+    def delete(self, user_id):
+        return self._delete(user_id)
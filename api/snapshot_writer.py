@@ -0,0 +1,85 @@
+import os
+import json
+import atexit
+import hashlib
+import threading
+
+# Write-through persistence of the last good upstream consulta response.
+# Writes happen on a timer thread (never on the request thread), are debounced per obra
+# and replace fallback_<codigo>.json atomically, so a restart starts from the latest data.
+
+
+def fallback_path(directory, codigo):
+    return os.path.join(directory, f'fallback_{codigo}.json')
+
+
+def write_json_atomic(path, payload):
+    """Serialize to a temp file in the same directory and rename over the target."""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return body
+
+
+class DebouncedSnapshotWriter:
+    """Coalesces bursts of fresh payloads into at most one write per obra per `delay` seconds."""
+
+    def __init__(self, directory, delay=5.0):
+        self.directory = directory
+        self.delay = delay
+        self._pending = {}
+        self._timers = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+        atexit.register(self.flush_all)
+
+    def schedule(self, codigo, payload):
+        codigo = str(codigo)
+        with self._lock:
+            self._pending[codigo] = payload
+            if codigo in self._timers:
+                return
+            timer = threading.Timer(self.delay, self._flush, args=(codigo,))
+            timer.daemon = True
+            self._timers[codigo] = timer
+        timer.start()
+
+    def _flush(self, codigo):
+        with self._lock:
+            payload = self._pending.pop(codigo, None)
+            self._timers.pop(codigo, None)
+        if payload is None:
+            return
+        try:
+            self.write_now(codigo, payload)
+        except Exception as e:
+            print(f"[SNAPSHOT ERROR] {codigo}: {e}")
+
+    def write_now(self, codigo, payload):
+        """Synchronous atomic write; skipped when the content equals the last one written."""
+        codigo = str(codigo)
+        digest = hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        if self._digests.get(codigo) == digest:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        body = write_json_atomic(fallback_path(self.directory, codigo), payload)
+        self._digests[codigo] = digest
+        print(f"[SNAPSHOT] fallback_{codigo}.json updated ({len(body)} bytes)")
+        return True
+
+    def flush_all(self):
+        with self._lock:
+            codes = list(self._pending.keys())
+            timers = [self._timers.pop(c) for c in codes if c in self._timers]
+        for timer in timers:
+            timer.cancel()
+        for codigo in codes:
+            self._flush(codigo)
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+
+# Per-thread persistent SQLite connections.
+# Opening a connection (and re-reading the schema) used to dominate small queries; now each
+# gunicorn thread keeps one connection in WAL mode so readers no longer block on writers.
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # NORMAL is durable in WAL mode except for the last commits on power loss
+    'synchronous': 'NORMAL',
+    'cache_size': '-16000',        # ~16 MB page cache per connection
+    'mmap_size': '134217728',      # 128 MB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
+
+class ManagedConnection(sqlite3.Connection):
+    """Connection whose close() only ends the current transaction, so callers can keep closing it."""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        super().close()
+
+
+class SQLitePool:
+    def __init__(self, path, pragmas=None, cached_statements=256, busy_timeout_ms=5000):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            factory=ManagedConnection,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A forked worker must not reuse the parent's connection
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.dispose()
+            except Exception:
+                pass
+        self._local = threading.local()
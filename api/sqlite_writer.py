@@ -0,0 +1,177 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Single writer thread for every SQLite mutation.
+# Concurrent saves used to each commit on their own connection, fighting over the database
+# lock ("database is locked") and paying one fsync per row. Callers now queue a unit of work
+# and block on its result; the writer runs whatever is queued (up to max_batch, waiting at most
+# max_wait_ms for stragglers) inside one transaction, each unit in its own savepoint, and
+# commits once for the whole group.
+
+
+class _RecordingConnection:
+    """The writer connection as a unit sees it: times every execute/executemany for the observer."""
+
+    def __init__(self, conn, statements):
+        self._conn = conn
+        self._statements = statements
+
+    def _timed(self, method, sql, params):
+        started = time.perf_counter()
+        entry = [sql, 0.0, None]
+        try:
+            entry[2] = method(sql, params)
+            return entry[2]
+        finally:
+            entry[1] = time.perf_counter() - started
+            self._statements.append(entry)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._conn.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(self._conn.executemany, sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SQLiteWriter:
+    def __init__(self, connection_factory, max_batch=64, max_wait_ms=2.0, timeout=30.0):
+        self.connection = connection_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.units = 0
+        self.largest_batch = 0
+        self.failed_commits = 0
+        # observer(sql, seconds, rows): once per statement a unit ran, with its own execution time
+        # and rowcount (None when unknown). The unit's queue and commit wait is added to its last
+        # statement, so the request totals still show what the caller waited for.
+        self.observer = None
+
+    def _ensure_thread(self):
+        # A forked worker inherits the queue but not the thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def call(self, fn, label=None):
+        """Run fn(conn) on the writer connection inside a group transaction and return its result.
+
+        fn must not commit or roll back; if it raises, only its own statements are undone and
+        the exception is re-raised here (e.g. sqlite3.IntegrityError). Each statement fn runs is
+        reported to the observer; label names the unit only if it ran none through conn.
+        """
+        if threading.current_thread() is self._thread:
+            # Re-entrant call from inside a unit: already in the writer's transaction
+            return fn(self.connection())
+        self._ensure_thread()
+        started = time.perf_counter()
+        future = Future()
+        statements = []
+        self._queue.put((fn, future, statements))
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            if self.observer is not None:
+                self._report(statements, label or getattr(fn, '__qualname__', 'write'), time.perf_counter() - started)
+
+    def _report(self, statements, label, elapsed):
+        statements = list(statements) or [(label, 0.0, None)]
+        wait = max(0.0, elapsed - sum(seconds for _, seconds, _ in statements))
+        for i, (sql, seconds, rows) in enumerate(statements):
+            rows = rows if isinstance(rows, int) else None
+            self.observer(sql, seconds + (wait if i == len(statements) - 1 else 0.0), rows)
+
+    def execute(self, sql, params=()):
+        """Returns the statement's rowcount once committed."""
+        return self.call(lambda conn: conn.execute(sql, params).rowcount, label=sql)
+
+    def executemany(self, sql, seq_of_params):
+        return self.call(lambda conn: conn.executemany(sql, seq_of_params).rowcount, label=sql)
+
+    def _run(self):
+        conn = self.connection()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future, statements in batch:
+                conn.execute("SAVEPOINT write_unit")
+                try:
+                    value = fn(_RecordingConnection(conn, statements))
+                except Exception as e:
+                    self._settle(statements)
+                    conn.execute("ROLLBACK TO write_unit")
+                    conn.execute("RELEASE write_unit")
+                    outcomes.append((future, None, e))
+                    continue
+                self._settle(statements)
+                conn.execute("RELEASE write_unit")
+                outcomes.append((future, value, None))
+            conn.commit()
+        except Exception as e:
+            # Nothing in this group was written; every caller gets the error
+            self.failed_commits += 1
+            print(f"[SQLITE WRITER] group commit of {len(batch)} failed: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.units += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, value, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    @staticmethod
+    def _settle(statements):
+        # Swap each cursor for its rowcount while still on the writer thread (after fn fetched)
+        for entry in statements:
+            if entry[2] is not None and not isinstance(entry[2], int):
+                rowcount = entry[2].rowcount
+                entry[2] = rowcount if rowcount >= 0 else None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "units": self.units,
+            "avg_batch": round(self.units / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "failed_commits": self.failed_commits,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,181 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+# HTTP layer for the Supabase REST calls in index.py.
+# Read timeouts (GET/HEAD) follow the observed latency of each (method, table) instead of a fixed
+# 5s; writes keep a fixed, longer timeout, since cutting off a slow write only leaves its outcome
+# unknown. Reads are retried with jittered backoff on transient failures, and a read that is
+# slower than the usual p95 gets one hedged duplicate; whichever answers first wins. Hedges are
+# capped to a fraction of traffic so an overloaded Supabase never sees doubled load.
+
+RETRY_STATUS = {429, 502, 503, 504}
+IDEMPOTENT = {'GET', 'HEAD'}
+
+
+class LatencyTracker:
+    """Rolling window of request latencies per key."""
+
+    def __init__(self, window=256, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, q):
+        """q-th percentile in seconds, or None until min_samples requests were seen."""
+        with self._lock:
+            samples = list(self._samples.get(key) or ())
+        if len(samples) < self.min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100.0))]
+
+    def keys(self):
+        with self._lock:
+            return list(self._samples)
+
+
+class ResilientClient:
+    def __init__(self, default_timeout=5.0, write_timeout=15.0, min_timeout=1.5, max_timeout=10.0, max_retries=2,
+                 backoff_base=0.1, backoff_cap=1.0, hedge=True, hedge_ratio=0.1, min_hedge_delay=0.05):
+        self.tracker = LatencyTracker()
+        self.default_timeout = default_timeout
+        self.write_timeout = write_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self.min_hedge_delay = min_hedge_delay
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='supabase-http')
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # observer(method, url, seconds, response) is called once per request() call, after its
+        # retries and hedges, with the total time and the final response (None when it raised);
+        # the individual attempts are only reflected in the retries/hedges counters
+        self.observer = None
+
+    def timeout_for(self, key, method='GET'):
+        """Adaptive timeout for reads; writes always get the fixed write_timeout."""
+        if method not in IDEMPOTENT:
+            return self.write_timeout
+        p99 = self.tracker.percentile(key, 99)
+        if p99 is None:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * 3))
+
+    def hedge_delay(self, key):
+        p95 = self.tracker.percentile(key, 95)
+        return None if p95 is None else max(self.min_hedge_delay, p95)
+
+    def _hedge_allowed(self):
+        with self._lock:
+            if self.hedges + 1 > self.requests * self.hedge_ratio:
+                return False
+            self.hedges += 1
+            return True
+
+    def _send(self, method, url, key, timeout, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = requests.request(method, url, timeout=timeout, **kwargs)
+        except requests.Timeout:
+            # Timeouts count at full length so the adaptive timeout can grow back
+            self.tracker.record(key, timeout)
+            raise
+        self.tracker.record(key, time.perf_counter() - started)
+        return response
+
+    def _hedged(self, method, url, key, timeout, **kwargs):
+        first = self._pool.submit(self._send, method, url, key, timeout, **kwargs)
+        delay = self.hedge_delay(key) if self.hedge else None
+        if delay is None:
+            return first.result()
+        done, _ = wait([first], timeout=delay)
+        if done or not self._hedge_allowed():
+            return first.result()
+        second = self._pool.submit(self._send, method, url, key, timeout, **kwargs)
+        print(f"[Supabase REST] hedging {key} after {delay * 1000:.0f}ms")
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            winner = pending.pop()
+        if winner is second and winner.exception() is None:
+            with self._lock:
+                self.hedge_wins += 1
+        return winner.result()
+
+    def request(self, method, url, key, **kwargs):
+        """requests.Response for method/url; raises the last requests exception when all attempts fail."""
+        method = method.upper()
+        if self.observer is None:
+            return self._request(method, url, key, **kwargs)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self._request(method, url, key, **kwargs)
+            return response
+        finally:
+            self.observer(method, url, time.perf_counter() - started, response)
+
+    def _request(self, method, url, key, **kwargs):
+        with self._lock:
+            self.requests += 1
+        timeout = self.timeout_for(key, method)
+        if method not in IDEMPOTENT:
+            return self._send(method, url, key, timeout, **kwargs)
+
+        attempt = 0
+        while True:
+            try:
+                response = self._hedged(method, url, key, timeout, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                reason = type(e).__name__
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            # Full jitter: spreads retries from concurrent requests instead of synchronizing them
+            sleep = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+            print(f"[Supabase REST] retry {attempt}/{self.max_retries} for {key} ({reason}) in {sleep * 1000:.0f}ms")
+            time.sleep(sleep)
+
+    def stats(self):
+        latency = {}
+        for key in self.tracker.keys():
+            p50, p95, p99 = (self.tracker.percentile(key, q) for q in (50, 95, 99))
+            latency[key] = {
+                "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "p99_ms": None if p99 is None else round(p99 * 1000, 1),
+                "timeout_s": round(self.timeout_for(key, key.split(' ', 1)[0]), 2),
+            }
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "latency": latency,
+            }
@@ -0,0 +1,127 @@
+import time
+import threading
+
+# Shared core of the in-process caches (permission_cache, duplicate_cache, list_cache).
+# Entries expire after `ttl` seconds, which bounds staleness across worker processes (each has
+# its own cache). Writes invalidate explicitly; every invalidation bumps a generation counter and
+# put() refuses a value whose load started before the latest invalidation, since the loader may
+# have read the pre-write row. Entries can carry tags (e.g. a client id) so a write can drop
+# everything derived from it. When max_size is exceeded the whole cache is dropped instead of
+# tracking recency.
+
+
+class TTLCache:
+    def __init__(self, ttl, max_size, size_of=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        # size_of(value) is what counts toward max_size (default: one per entry)
+        self._size_of = size_of or (lambda value: 1)
+        self._entries = {}
+        self._keys_by_tag = {}
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self):
+        """Take before loading and pass to put(): a value loaded across an invalidation is not stored."""
+        with self._lock:
+            return self._generation
+
+    def lookup(self, key):
+        """(True, value) for a live entry, else (False, None); counts the hit or miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation, tags=()):
+        """Store value under key unless an invalidation happened since generation; True if stored."""
+        size = self._size_of(value)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._drop(key)
+            if self._size + size > self.max_size:
+                self._reset()
+            self._entries[key] = (time.monotonic() + self.ttl, value, size, tuple(tags))
+            self._size += size
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            return True
+
+    def get(self, key, loader):
+        """Cached value for key, calling loader(key) on a miss or after expiry."""
+        hit, value = self.lookup(key)
+        if hit:
+            return value
+        # Load outside the lock; a concurrent miss for the same key just loads twice
+        generation = self.generation()
+        value = loader(key)
+        self.put(key, value, generation)
+        return value
+
+    def invalidate(self, keys=(), tags=()):
+        """Drop the given keys and every entry carrying one of the given tags."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._drop(key)
+            for key in keys:
+                self._drop(key)
+
+    def invalidate_where(self, match):
+        """Drop every entry whose key satisfies match(key)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in [key for key in self._entries if match(key)]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._reset()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry[2]
+        for tag in entry[3]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def _reset(self):
+        self._entries.clear()
+        self._keys_by_tag.clear()
+        self._size = 0
@@ -10,49 +10,143 @@ export async function onRequestOptions() {
   });
 }
 
+const jsonError = (status, error) => new Response(JSON.stringify({ success: false, data: [], error }), {
+  status,
+  headers: {
+    "Content-Type": "application/json; charset=utf-8",
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "no-store",
+  },
+});
+
+const base64UrlDecode = (value) => {
+  const b64 = value.replace(/-/g, "+").replace(/_/g, "/").padEnd(Math.ceil(value.length / 4) * 4, "=");
+  return Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
+};
+
+// Mesmo token HS256 emitido pela API (SECRET_KEY); devolve o payload ou null
+async function verifyToken(token, secret) {
+  const parts = token.split(".");
+  if (parts.length !== 3 || !secret) return null;
+  try {
+    const header = JSON.parse(new TextDecoder().decode(base64UrlDecode(parts[0])));
+    if (header.alg !== "HS256") return null;
+    const key = await crypto.subtle.importKey(
+      "raw", new TextEncoder().encode(secret), { name: "HMAC", hash: "SHA-256" }, false, ["verify"]
+    );
+    const valid = await crypto.subtle.verify(
+      "HMAC", key, base64UrlDecode(parts[2]), new TextEncoder().encode(`${parts[0]}.${parts[1]}`)
+    );
+    if (!valid) return null;
+    const payload = JSON.parse(new TextDecoder().decode(base64UrlDecode(parts[1])));
+    if (typeof payload.exp !== "number" || payload.exp * 1000 <= Date.now()) return null;
+    return payload;
+  } catch (e) {
+    return null;
+  }
+}
+
+// Obras permitidas (null = todas, admin). Com SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY no Pages,
+// lê as permissões atuais do usuário, como a API; sem elas, usa o claim 'obras' do token
+// (uma obra revogada continua visível até o token expirar, em até 12h).
+async function allowedObras(payload, env) {
+  if (payload.role === "admin") return null;
+  const supabaseUrl = (env?.SUPABASE_URL || "").replace(/\/$/, "");
+  const serviceKey = env?.SUPABASE_SERVICE_ROLE_KEY || "";
+  if (!supabaseUrl || !serviceKey) {
+    return Array.isArray(payload.obras) ? payload.obras.map(String) : [];
+  }
+  const resp = await fetch(
+    `${supabaseUrl}/rest/v1/users?select=permissions&id=eq.${encodeURIComponent(payload.user_id)}`,
+    { headers: { apikey: serviceKey, Authorization: `Bearer ${serviceKey}`, Accept: "application/json" } }
+  );
+  if (!resp.ok) throw new Error(`Supabase users: HTTP ${resp.status}`);
+  const rows = await resp.json();
+  let perms = rows[0]?.permissions || {};
+  if (typeof perms === "string") {
+    try { perms = JSON.parse(perms); } catch (e) { perms = {}; }
+  }
+  return (perms.obrasPermitidas || []).map(String);
+}
+
+// Snapshot publicado (public/consulta, lido via ASSETS: /consulta/* não é servido diretamente)
+async function readSnapshot(request, env, codigo) {
+  if (!env?.ASSETS) return null;
+  const manifestResp = await env.ASSETS.fetch(new URL("/consulta/manifest.json", request.url));
+  if (!manifestResp.ok) return null;
+  const entry = (await manifestResp.json())?.obras?.[codigo];
+  if (!entry?.file) return null;
+  const fileResp = await env.ASSETS.fetch(new URL(`/consulta/${entry.file}`, request.url));
+  return fileResp.ok ? fileResp.text() : null;
+}
+
+// A borda valida o token e as obras do usuário e serve o snapshot da obra; só obras sem snapshot
+// (fora de CONSULTA_PUBLISH_OBRAS) seguem para a API em API_BASE, que repete a checagem.
 export async function onRequestGet({ request, params, env }) {
   const url = new URL(request.url);
-  const codigo = params.codigo;
-  const t = url.searchParams.get("t") || String(Date.now());
+  const codigo = String(params.codigo);
+  const authorization = request.headers.get("Authorization") || "";
+  if (!authorization.startsWith("Bearer ")) {
+    return jsonError(401, "Token missing");
+  }
+  if (!env?.SECRET_KEY) {
+    return jsonError(500, "SECRET_KEY não configurada nas variáveis do Pages.");
+  }
+  const payload = await verifyToken(authorization.slice(7).trim(), env.SECRET_KEY);
+  if (!payload) {
+    return jsonError(401, "Invalid token");
+  }
 
-  const upstreamBase = (env?.CONSULTA_UPSTREAM_BASE || "https://consulta-proxy.vercel.app").replace(/\/$/, "");
-  const upstream = new URL(`${upstreamBase}/api/consulta/${encodeURIComponent(codigo)}/`);
-  upstream.searchParams.set("t", t);
+  let obras;
+  try {
+    obras = await allowedObras(payload, env);
+  } catch (e) {
+    return jsonError(503, `Não foi possível verificar as obras permitidas: ${e}`);
+  }
+  if (obras !== null && !obras.includes(codigo)) {
+    return jsonError(403, "Obra não permitida para este usuário.");
+  }
 
-  const allowedPorts = new Set(["", "80", "443", "8080", "8443", "2052", "2053", "2082", "2083", "2086", "2087", "2095", "2096"]);
-  if (!allowedPorts.has(upstream.port)) {
-    return new Response(JSON.stringify({
-      success: false,
-      data: [],
-      error: `Porta upstream não suportada no Cloudflare Pages Functions: ${upstream.port || "(vazia)"}`
-    }), {
-      status: 500,
+  let snapshot = null;
+  try {
+    snapshot = await readSnapshot(request, env, codigo);
+  } catch (e) {
+    console.warn(`[CONSULTA] snapshot ${codigo} ilegível: ${e}`);
+  }
+  if (snapshot !== null) {
+    return new Response(snapshot, {
+      status: 200,
       headers: {
         "Content-Type": "application/json; charset=utf-8",
         "Access-Control-Allow-Origin": "*",
-        "Cache-Control": "no-store",
+        "Cache-Control": "private, no-store",
       },
     });
   }
 
+  const apiBase = (env?.API_BASE || "").replace(/\/$/, "");
+  if (!apiBase) {
+    return jsonError(500, "API_BASE não configurada nas variáveis do Pages (URL da API, ex.: https://sua-api.onrender.com).");
+  }
+  const upstream = new URL(`${apiBase}/api/consulta/${encodeURIComponent(codigo)}`);
+  upstream.search = url.search;
+
+  const allowedPorts = new Set(["", "80", "443", "8080", "8443", "2052", "2053", "2082", "2083", "2086", "2087", "2095", "2096"]);
+  if (!allowedPorts.has(upstream.port)) {
+    return jsonError(500, `Porta da API não suportada no Cloudflare Pages Functions: ${upstream.port || "(vazia)"}`);
+  }
+
   let resp;
   try {
     resp = await fetch(upstream.toString(), {
       method: "GET",
       headers: {
         "Accept": "application/json, text/plain, */*",
-        "User-Agent":
-          "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Authorization": authorization,
       },
     });
   } catch (e) {
-    return new Response(JSON.stringify({ success: false, data: [], error: String(e) }), {
-      status: 503,
-      headers: {
-        "Content-Type": "application/json; charset=utf-8",
-        "Access-Control-Allow-Origin": "*",
-      },
-    });
+    return jsonError(503, String(e));
   }
 
   const body = await resp.text();
@@ -0,0 +1,8 @@
+// Os snapshots em public/consulta só saem por /api/consulta/<obra>, que confere token e obras;
+// o acesso direto aos arquivos estáticos é bloqueado aqui.
+export async function onRequest() {
+  return new Response("Not found", {
+    status: 404,
+    headers: { "Cache-Control": "no-store" },
+  });
+}
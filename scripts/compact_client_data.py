@@ -0,0 +1,76 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+import client_codec
+
+# Re-encodes clients.data in Supabase with client_codec (the SQLite database is migrated on
+# startup). Rows are read by id keyset and written back with one PATCH per changed row, which also
+# bumps updated_at so the read replica and reconcile_db.py pick the repacked rows up; rows that
+# are already packed or whose data is not valid JSON are left untouched.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compact clients.data in Supabase")
+    parser.add_argument("--supabase-url", default=os.environ.get("SUPABASE_URL", ""))
+    parser.add_argument("--supabase-key", default=os.environ.get("SUPABASE_SERVICE_ROLE_KEY", ""))
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--apply", action="store_true", help="Write the compacted payloads (default: report only)")
+    parser.add_argument("--timeout", type=float, default=15)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.supabase_url or not args.supabase_key:
+        print("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY (env or flags).", file=sys.stderr)
+        return 2
+
+    base = f"{args.supabase_url.rstrip('/')}/rest/v1/clients"
+    headers = {"apikey": args.supabase_key, "Authorization": f"Bearer {args.supabase_key}",
+               "Content-Type": "application/json", "Prefer": "return=minimal"}
+    report = {"scanned": 0, "changed": 0, "bytes_before": 0, "bytes_after": 0, "failed": 0}
+    last_id = 0
+    while True:
+        resp = requests.get(f"{base}?select=id,data&id=gt.{last_id}&order=id.asc&limit={args.batch}",
+                            headers=headers, timeout=args.timeout)
+        resp.raise_for_status()
+        rows = resp.json()
+        if not rows:
+            break
+        for row in rows:
+            raw = row.get("data")
+            report["scanned"] += 1
+            if not raw or client_codec.is_packed(raw):
+                continue
+            decoded = client_codec.decode(raw)
+            if not decoded:
+                continue
+            encoded = client_codec.encode(decoded)
+            if encoded == raw:
+                continue
+            report["changed"] += 1
+            report["bytes_before"] += len(raw.encode("utf-8"))
+            report["bytes_after"] += len(encoded.encode("utf-8"))
+            if args.apply:
+                patch = requests.patch(f"{base}?id=eq.{row['id']}", headers=headers,
+                                       json={"data": encoded, "updated_at": datetime.datetime.utcnow().isoformat()},
+                                       timeout=args.timeout)
+                if patch.status_code not in (200, 204):
+                    report["failed"] += 1
+                    print(f"[{row['id']}] PATCH failed: {patch.status_code} {patch.text}", file=sys.stderr)
+        last_id = rows[-1]["id"]
+        print(f"... {report['scanned']} rows scanned", file=sys.stderr)
+
+    report["applied"] = args.apply
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
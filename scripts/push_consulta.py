@@ -5,6 +5,9 @@ import time
 import json
 import requests
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from consulta_publish import publish_snapshot, enrich_consulta_payload
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -13,6 +16,11 @@ def parse_args():
     parser.add_argument("--codes", default=os.environ.get("CONSULTA_CODES", "600"))
     parser.add_argument("--source", default=os.environ.get("CONSULTA_SOURCE", "http://177.221.240.85:8000"))
     parser.add_argument("--timeout", type=float, default=float(os.environ.get("CONSULTA_TIMEOUT", "20")))
+    parser.add_argument("--publish-dir", default=os.environ.get("CONSULTA_PUBLISH_DIR", ""),
+                        help="Also write static snapshots + manifest here (e.g. public/consulta)")
+    parser.add_argument("--publish-obras", default=os.environ.get("CONSULTA_PUBLISH_OBRAS", ""),
+                        help="Obras allowed into the static snapshots (comma-separated); others are not published")
+    parser.add_argument("--skip-push", action="store_true", help="Only publish static snapshots")
     return parser.parse_args()
 
 
@@ -35,7 +43,7 @@ def push_backend(backend_base, code, payload, push_key, timeout):
 
 def main():
     args = parse_args()
-    if not args.push_key:
+    if not args.push_key and not args.skip_push:
         print("Missing CONSULTA_PUSH_KEY (env or --push-key).", file=sys.stderr)
         return 2
 
@@ -44,10 +52,20 @@ def main():
         print("No codes provided.", file=sys.stderr)
         return 2
 
+    publish_obras = {c.strip() for c in str(args.publish_obras).split(",") if c.strip()}
     ok = True
     for code in codes:
         try:
-            payload = fetch_source(args.source, code, args.timeout)
+            # Same shape the API serves (Data_Atualizacao at the root and on every lot)
+            payload = enrich_consulta_payload(fetch_source(args.source, code, args.timeout))
+            if args.publish_dir:
+                entry = publish_snapshot(args.publish_dir, code, payload, allowed=publish_obras)
+                if code not in publish_obras:
+                    print(f"{code}: NOT PUBLISHED (not in --publish-obras)")
+                else:
+                    print(f"{code}: PUBLISHED {entry['file']}" if entry else f"{code}: UNCHANGED")
+            if args.skip_push:
+                continue
             status, text = push_backend(args.backend, code, payload, args.push_key, args.timeout)
             if status >= 200 and status < 300:
                 print(f"{code}: OK ({status})")
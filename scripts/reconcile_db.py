@@ -0,0 +1,288 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from bisect import bisect_left, bisect_right
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from replica import upsert_rows
+
+# Finds and repairs drift between a local SQLite database and Supabase.
+# Both sides hash (id, updated_at) over id ranges; only ranges whose hashes differ are split
+# further (Merkle-style), so a large table with a few drifted rows costs a handful of RPC calls.
+# The Supabase side needs the range_hashes() function from DEPLOY.md 2.5; without it the tool
+# falls back to downloading id/updated_at for the whole table.
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reconcile a local SQLite database with Supabase")
+    parser.add_argument("--sqlite", default=os.environ.get("RECONCILE_SQLITE", "/tmp/clients.db"),
+                        help="Local database (e.g. backend/clients.db or /tmp/clients.db)")
+    parser.add_argument("--supabase-url", default=os.environ.get("SUPABASE_URL", ""))
+    parser.add_argument("--supabase-key", default=os.environ.get("SUPABASE_SERVICE_ROLE_KEY", ""))
+    parser.add_argument("--tables", default="clients,users")
+    parser.add_argument("--fanout", type=int, default=16, help="Sub-ranges per differing range")
+    parser.add_argument("--leaf-size", type=int, default=256, help="Id span compared row by row")
+    parser.add_argument("--direction", choices=["pull", "push", "newest"], default="pull",
+                        help="pull: Supabase wins; push: SQLite wins; newest: greater updated_at wins")
+    parser.add_argument("--delete", action="store_true",
+                        help="Also delete rows missing on the winning side (pull/push only)")
+    parser.add_argument("--apply", action="store_true", help="Write the repairs (default: report only)")
+    parser.add_argument("--timeout", type=float, default=15)
+    return parser.parse_args()
+
+
+def updated_ms(value):
+    """updated_at as integer epoch milliseconds (naive SQLite timestamps are UTC); None stays None."""
+    if value in (None, ""):
+        return None
+    try:
+        ts = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return (ts - EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def digest(pairs):
+    """Same text as range_hashes(): md5 of 'id:ms' joined by ',' in id order."""
+    text = ",".join(f"{i}:{'' if ms is None else ms}" for i, ms in pairs)
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def bucket_bounds(lo, hi, buckets, b):
+    """Id range covered by bucket b of [lo, hi] (bucket = (id - lo) * buckets // size)."""
+    size = hi - lo + 1
+    start = lo + -(-b * size // buckets)
+    end = lo + -(-(b + 1) * size // buckets) - 1
+    return start, min(end, hi)
+
+
+class Remote:
+    def __init__(self, url, key, timeout):
+        self.base = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {"apikey": key, "Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+        self.timeout = timeout
+        self.requests = 0
+        self.rpc_available = True
+
+    def _get(self, path):
+        self.requests += 1
+        resp = requests.get(f"{self.base}/{path}", headers=self.headers, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def max_id(self, table):
+        rows = self._get(f"{table}?select=id&order=id.desc&limit=1")
+        return rows[0]["id"] if rows else 0
+
+    def range_hashes(self, table, lo, hi, buckets):
+        """{bucket: (count, digest)} from the range_hashes() RPC, or None if it isn't installed."""
+        if not self.rpc_available:
+            return None
+        self.requests += 1
+        resp = requests.post(f"{self.base}/rpc/range_hashes", headers=self.headers, timeout=self.timeout,
+                             json={"tbl": table, "lo": lo, "hi": hi, "buckets": buckets})
+        if resp.status_code == 404:
+            print("range_hashes() not found in Supabase; falling back to a full id/updated_at scan", file=sys.stderr)
+            self.rpc_available = False
+            return None
+        resp.raise_for_status()
+        return {r["bucket"]: (r["row_count"], r["digest"]) for r in resp.json()}
+
+    def pairs(self, table, lo, hi, batch=1000):
+        out, last = [], lo - 1
+        while True:
+            rows = self._get(f"{table}?select=id,updated_at&id=gt.{last}&id=lte.{hi}&order=id.asc&limit={batch}")
+            if not rows:
+                return out
+            out.extend((r["id"], updated_ms(r.get("updated_at"))) for r in rows)
+            last = rows[-1]["id"]
+
+    def rows(self, table, ids):
+        out = []
+        ids = sorted(ids)
+        for i in range(0, len(ids), 200):
+            chunk = ",".join(str(x) for x in ids[i:i + 200])
+            out.extend(self._get(f"{table}?select=*&id=in.({chunk})"))
+        return out
+
+    def upsert(self, table, rows, chunk=500):
+        headers = dict(self.headers, Prefer="resolution=merge-duplicates,return=minimal")
+        for i in range(0, len(rows), chunk):
+            self.requests += 1
+            resp = requests.post(f"{self.base}/{table}?on_conflict=id", headers=headers,
+                                 json=rows[i:i + chunk], timeout=self.timeout)
+            resp.raise_for_status()
+
+    def delete(self, table, ids):
+        ids = sorted(ids)
+        for i in range(0, len(ids), 200):
+            self.requests += 1
+            chunk = ",".join(str(x) for x in ids[i:i + 200])
+            resp = requests.delete(f"{self.base}/{table}?id=in.({chunk})", headers=self.headers, timeout=self.timeout)
+            resp.raise_for_status()
+
+
+class Local:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self._pairs = {}
+
+    def columns(self, table):
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def load(self, table):
+        # The whole (id, updated_at) index is read once; every range is then a bisect away
+        cols = self.columns(table)
+        ts_col = "updated_at" if "updated_at" in cols else "NULL"
+        rows = self.conn.execute(f"SELECT id, {ts_col} FROM {table} ORDER BY id").fetchall()
+        pairs = [(r[0], updated_ms(r[1])) for r in rows]
+        self._pairs[table] = (pairs, [p[0] for p in pairs])
+
+    def max_id(self, table):
+        pairs, _ = self._pairs[table]
+        return pairs[-1][0] if pairs else 0
+
+    def pairs(self, table, lo, hi):
+        pairs, ids = self._pairs[table]
+        return pairs[bisect_left(ids, lo):bisect_right(ids, hi)]
+
+    def range_hashes(self, table, lo, hi, buckets):
+        size = hi - lo + 1
+        grouped = {}
+        for pair in self.pairs(table, lo, hi):
+            grouped.setdefault((pair[0] - lo) * buckets // size, []).append(pair)
+        return {b: (len(p), digest(p)) for b, p in grouped.items()}
+
+    def rows(self, table, ids):
+        out = []
+        ids = sorted(ids)
+        # Stored columns only: SELECT * would also return the generated ones, which Supabase rejects on insert
+        columns = ", ".join(self.columns(table))
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            out.extend(dict(r) for r in self.conn.execute(
+                f"SELECT {columns} FROM {table} WHERE id IN ({','.join('?' for _ in chunk)})", chunk))
+        return out
+
+
+def diff_pairs(local_pairs, remote_pairs):
+    local, remote = dict(local_pairs), dict(remote_pairs)
+    missing_local = sorted(set(remote) - set(local))
+    missing_remote = sorted(set(local) - set(remote))
+    changed = sorted(i for i in set(local) & set(remote) if local[i] != remote[i])
+    return missing_local, missing_remote, changed, local, remote
+
+
+def find_drift(table, local, remote, fanout, leaf_size):
+    """Walk differing ranges top-down; returns (missing_local, missing_remote, changed, local_ms, remote_ms)."""
+    hi = max(local.max_id(table), remote.max_id(table))
+    if hi == 0:
+        return [], [], [], {}, {}
+    pending, leaves, compared = [(1, hi)], [], 0
+    while pending:
+        lo, hi = pending.pop()
+        if hi - lo + 1 <= leaf_size:
+            leaves.append((lo, hi))
+            continue
+        remote_buckets = remote.range_hashes(table, lo, hi, fanout)
+        if remote_buckets is None:
+            leaves.append((lo, hi))
+            continue
+        compared += 1
+        local_buckets = local.range_hashes(table, lo, hi, fanout)
+        for b in set(remote_buckets) | set(local_buckets):
+            if remote_buckets.get(b) != local_buckets.get(b):
+                pending.append(bucket_bounds(lo, hi, fanout, b))
+    missing_local, missing_remote, changed, local_ms, remote_ms = [], [], [], {}, {}
+    for lo, hi in leaves:
+        ml, mr, ch, lm, rm = diff_pairs(local.pairs(table, lo, hi), remote.pairs(table, lo, hi))
+        missing_local += ml
+        missing_remote += mr
+        changed += ch
+        local_ms.update(lm)
+        remote_ms.update(rm)
+    print(f"[{table}] {compared} ranges hashed, {len(leaves)} leaf ranges compared row by row")
+    return missing_local, missing_remote, changed, local_ms, remote_ms
+
+
+def repair(table, local, remote, drift, direction, delete):
+    missing_local, missing_remote, changed, local_ms, remote_ms = drift
+    if direction == "newest":
+        pull_ids = missing_local + [i for i in changed if (remote_ms[i] or 0) >= (local_ms[i] or 0)]
+        push_ids = missing_remote + [i for i in changed if (local_ms[i] or 0) > (remote_ms[i] or 0)]
+        drop_local, drop_remote = [], []
+    elif direction == "pull":
+        pull_ids, push_ids = missing_local + changed, []
+        drop_local, drop_remote = (missing_remote if delete else []), []
+    else:
+        pull_ids, push_ids = [], missing_remote + changed
+        drop_local, drop_remote = [], (missing_local if delete else [])
+
+    if pull_ids or drop_local:
+        rows = remote.rows(table, pull_ids) if pull_ids else []
+        columns = local.columns(table)
+        with local.conn:
+            upsert_rows(local.conn, table, rows, columns)
+            if drop_local:
+                local.conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(i,) for i in drop_local])
+    if push_ids:
+        rows = local.rows(table, push_ids)
+        for row in rows:
+            # permissions is JSON in Supabase, TEXT locally
+            if table == "users" and isinstance(row.get("permissions"), str):
+                try:
+                    row["permissions"] = json.loads(row["permissions"])
+                except ValueError:
+                    pass
+        remote.upsert(table, rows)
+    if drop_remote:
+        remote.delete(table, drop_remote)
+    return {"pulled": len(pull_ids), "pushed": len(push_ids),
+            "deleted_local": len(drop_local), "deleted_remote": len(drop_remote)}
+
+
+def main():
+    args = parse_args()
+    if not args.supabase_url or not args.supabase_key:
+        print("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY (env or flags).", file=sys.stderr)
+        return 2
+    if not os.path.exists(args.sqlite):
+        print(f"SQLite database not found: {args.sqlite}", file=sys.stderr)
+        return 2
+
+    local = Local(args.sqlite)
+    remote = Remote(args.supabase_url, args.supabase_key, args.timeout)
+    report = {}
+    for table in [t.strip() for t in args.tables.split(",") if t.strip()]:
+        local.load(table)
+        drift = find_drift(table, local, remote, args.fanout, args.leaf_size)
+        missing_local, missing_remote, changed = drift[:3]
+        entry = {
+            "missing_local": len(missing_local),
+            "missing_remote": len(missing_remote),
+            "changed": len(changed),
+            "sample_ids": sorted(missing_local + missing_remote + changed)[:20],
+        }
+        if args.apply and any(drift[:3]):
+            entry["repair"] = repair(table, local, remote, drift, args.direction, args.delete)
+        report[table] = entry
+
+    report["supabase_requests"] = remote.requests
+    report["applied"] = args.apply
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,8 @@
-import React, { useState, useEffect, useMemo, useCallback } from 'react';
+import React, { useState, useEffect, useMemo, useCallback, useRef } from 'react';
 import { debounce } from 'lodash';
 import ClientSelectionModal from './ClientSelectionModal';
 import { X, FileText, CheckCircle, Building2, User, Users, MapPin, Contact, Briefcase, ChevronRight, ChevronLeft, Trash2, Search, AlertCircle } from 'lucide-react';
-import { deleteClient, checkDuplicate } from '../services/api';
+import { deleteClient, checkDuplicates } from '../services/api';
 import { useToast } from '../context/toastContextValue';
 import { maskCPF, maskCNPJ, maskCEP, maskDDD, maskPhoneNumber, unmask } from '../utils/masks';
 import { validateCNPJ, validateEmail } from '../utils/validators';
@@ -240,42 +240,56 @@ const ClientFormModal = ({ onClose, onConfirm, onDelete, initialData = null, cli
             .map(domain => `${localPart}@${domain}`);
     };
 
-    // Verificação de duplicatas (debounced)
-    const checkDuplicateCPF = useMemo(() => debounce(async (cpfCnpj, fieldName, personType) => {
+    // Verificação de duplicatas (debounced): titular e segundo alterados juntos vão numa só chamada
+    const pendingDuplicateChecks = useRef({});
+    const flushDuplicateChecks = useMemo(() => debounce(async () => {
+            const checks = Object.values(pendingDuplicateChecks.current);
+            pendingDuplicateChecks.current = {};
+            if (checks.length === 0) return;
             try {
-                // checkDuplicate(cpf, tipo, clientId) - ordem correta dos parâmetros
-                const result = await checkDuplicate(cpfCnpj, personType, clientId);
-                if (result.exists) {
-                    setDuplicateWarning({
-                        show: true,
-                        clientName: result.client_name || result.client?.nome_proponente || 'Cliente existente',
-                        clientId: result.client_id || result.client?.id,
-                        field: fieldName
-                    });
-                    setFieldErrors(prev => ({
-                        ...prev,
-                        [fieldName]: `CPF/CNPJ já cadastrado: ${result.client_name || 'outro cliente'}`
-                    }));
-                } else {
-                    setDuplicateWarning({ show: false, clientName: '', clientId: null, field: null });
-                    setFieldErrors(prev => {
-                        const newErrors = { ...prev };
-                        if (newErrors[fieldName]?.includes('já cadastrado')) {
-                            delete newErrors[fieldName];
-                        }
-                        return newErrors;
-                    });
-                }
+                const results = await checkDuplicates(checks, clientId);
+                results.forEach((result) => {
+                    const fieldName = result.field;
+                    if (!fieldName) return;
+                    if (result.exists) {
+                        setDuplicateWarning({
+                            show: true,
+                            clientName: result.client_name || 'Cliente existente',
+                            clientId: result.client_id,
+                            field: fieldName
+                        });
+                        setFieldErrors(prev => ({
+                            ...prev,
+                            [fieldName]: `CPF/CNPJ já cadastrado: ${result.client_name || 'outro cliente'}`
+                        }));
+                    } else {
+                        setDuplicateWarning(prev => (prev.field === fieldName
+                            ? { show: false, clientName: '', clientId: null, field: null }
+                            : prev));
+                        setFieldErrors(prev => {
+                            const newErrors = { ...prev };
+                            if (newErrors[fieldName]?.includes('já cadastrado')) {
+                                delete newErrors[fieldName];
+                            }
+                            return newErrors;
+                        });
+                    }
+                });
             } catch (error) {
                 console.error('Error checking duplicate:', error);
             }
         }, 800), [clientId]);
 
+    const checkDuplicateCPF = useCallback((cpfCnpj, fieldName, personType) => {
+        pendingDuplicateChecks.current[fieldName] = { cpf_cnpj: cpfCnpj, tipo_pessoa: personType, field: fieldName };
+        flushDuplicateChecks();
+    }, [flushDuplicateChecks]);
+
     useEffect(() => {
         return () => {
-            checkDuplicateCPF.cancel?.();
+            flushDuplicateChecks.cancel?.();
         };
-    }, [checkDuplicateCPF]);
+    }, [flushDuplicateChecks]);
 
     // Handler para CPF/CNPJ com máscara e validação
     const handleCPFCNPJChange = (e, fieldName, tipo) => {
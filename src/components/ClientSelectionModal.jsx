@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { X, Search, UserPlus, Users, Edit2, Trash2, User, Building2, ChevronLeft } from 'lucide-react';
-import { getClients, deleteClient } from '../services/api';
+import { getClients, getClient, deleteClient } from '../services/api';
 import Loader from './Loader';
 import './ClientSelectionModal.css';
 
@@ -10,7 +10,7 @@ const ClientSelectionModal = ({ onSelectClient, onNewClient, onClose, onBack })
     const [loadingMore, setLoadingMore] = useState(false);
     const [searchTerm, setSearchTerm] = useState('');
     const [debouncedSearch, setDebouncedSearch] = useState('');
-    const [page, setPage] = useState(1);
+    const [nextCursor, setNextCursor] = useState(null);
     const [hasMore, setHasMore] = useState(false);
     const [error, setError] = useState(null);
     const [clientTab, setClientTab] = useState('pf'); // 'pf' or 'pj'
@@ -22,19 +22,20 @@ const ClientSelectionModal = ({ onSelectClient, onNewClient, onClose, onBack })
         };
     }, []);
 
-    const loadClients = useCallback(async (search = '', pageNum = 1, append = false) => {
-        if (pageNum === 1) setLoading(true);
+    const loadClients = useCallback(async (search = '', cursor = null, append = false) => {
+        if (!cursor) setLoading(true);
         else setLoadingMore(true);
 
         try {
-            const result = await getClients({ search, page: pageNum, limit: 50, type: clientTab });
+            const result = await getClients({ search, cursor, limit: 50, type: clientTab });
             if (result.success) {
                 if (append) {
                     setClients(prev => [...prev, ...result.clients]);
                 } else {
                     setClients(result.clients);
                 }
-                setHasMore(result.clients.length === 50 && (pageNum * 50) < result.total_count);
+                setNextCursor(result.next_cursor || null);
+                setHasMore(Boolean(result.has_more));
             } else {
                 setError('Erro ao carregar clientes');
             }
@@ -56,24 +57,35 @@ const ClientSelectionModal = ({ onSelectClient, onNewClient, onClose, onBack })
 
     // Reload on search change or tab change
     useEffect(() => {
-        setPage(1);
-        loadClients(debouncedSearch, 1, false);
+        loadClients(debouncedSearch, null, false);
     }, [debouncedSearch, clientTab, loadClients]);
 
     const handleLoadMore = (e) => {
         e.stopPropagation();
-        const nextPage = page + 1;
-        setPage(nextPage);
-        loadClients(debouncedSearch, nextPage, true);
+        loadClients(debouncedSearch, nextCursor, true);
+    };
+
+    // A listagem traz só o resumo; o cadastro completo é carregado ao abrir o cliente
+    const openClient = async (client) => {
+        try {
+            const fullClient = await getClient(client.id);
+            if (!fullClient) {
+                alert('Cliente não encontrado.');
+                return;
+            }
+            onSelectClient(fullClient);
+        } catch {
+            alert('Erro ao carregar cliente.');
+        }
     };
 
     const handleSelectClient = (client) => {
-        onSelectClient(client);
+        openClient(client);
     };
 
     const handleEditClient = (e, client) => {
         e.stopPropagation();
-        onSelectClient(client); // Opens form with client data for editing
+        openClient(client); // Opens form with client data for editing
     };
 
     const handleDeleteClient = async (e, clientId) => {
@@ -87,8 +99,7 @@ const ClientSelectionModal = ({ onSelectClient, onNewClient, onClose, onBack })
             const result = await deleteClient(clientId);
             if (result.success) {
                 // Reload current list
-                loadClients(debouncedSearch, 1, false);
-                setPage(1);
+                loadClients(debouncedSearch, null, false);
                 alert('Cliente excluído com sucesso!');
             } else {
                 alert('Erro ao excluir cliente: ' + (result.error || 'Erro desconhecido'));
@@ -224,10 +235,10 @@ const ClientSelectionModal = ({ onSelectClient, onNewClient, onClose, onBack })
                                                 </div>
                                             </td>
                                             <td className="cpf-cell">{formatCpfCnpj(client.cpf_cnpj)}</td>
-                                            <td>{formatPhone(client.data.fone1_ddd_proponente, client.data.fone1_numero_proponente)}</td>
+                                            <td>{formatPhone(client.fone_ddd, client.fone_numero)}</td>
                                             <td>
-                                                {client.data.cidade_proponente && client.data.uf_endereco_proponente
-                                                    ? `${client.data.cidade_proponente} - ${client.data.uf_endereco_proponente}`
+                                                {client.cidade && client.uf
+                                                    ? `${client.cidade} - ${client.uf}`
                                                     : '-'}
                                             </td>
                                             <td className="date-cell">
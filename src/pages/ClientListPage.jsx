@@ -5,7 +5,7 @@ import {
     ArrowLeft, Loader2, AlertCircle, FileText,
     Calendar, Mail, Phone, MapPin, Building2, User
 } from 'lucide-react';
-import { getClients, deleteClient, saveClient } from '../services/api';
+import { getClients, getClient, deleteClient, saveClient } from '../services/api';
 import { useAuth } from '../context/authContextValue';
 import ClientFormModal from '../components/ClientFormModal';
 import Loader from '../components/Loader';
@@ -21,15 +21,15 @@ function ClientListPage() {
     const [error, setError] = useState(null);
     const [searchTerm, setSearchTerm] = useState('');
     const [debouncedSearch, setDebouncedSearch] = useState('');
-    const [page, setPage] = useState(1);
+    const [nextCursor, setNextCursor] = useState(null);
     const [hasMore, setHasMore] = useState(false);
     const [editingClient, setEditingClient] = useState(null);
     const [deleteConfirm, setDeleteConfirm] = useState(null);
     const [showForm, setShowForm] = useState(false);
     const [clientTab, setClientTab] = useState('pf');
 
-    const loadClients = useCallback(async (search = '', pageNum = 1, append = false) => {
-        if (pageNum === 1) setLoading(true);
+    const loadClients = useCallback(async (search = '', cursor = null, append = false) => {
+        if (!cursor) setLoading(true);
         else setLoadingMore(true);
 
         try {
@@ -40,7 +40,7 @@ function ClientListPage() {
 
             const result = await getClients({
                 search,
-                page: pageNum,
+                cursor,
                 limit: 50,
                 type: clientTab,
                 created_by: filterBy
@@ -52,7 +52,8 @@ function ClientListPage() {
                 } else {
                     setClients(result.clients);
                 }
-                setHasMore(result.clients.length === 50 && (pageNum * 50) < result.total_count);
+                setNextCursor(result.next_cursor || null);
+                setHasMore(Boolean(result.has_more));
             } else {
                 setError(result.error);
             }
@@ -76,15 +77,12 @@ function ClientListPage() {
     // Reload when debounced search changes
     useEffect(() => {
         if (currentUser) {
-            setPage(1);
-            loadClients(debouncedSearch, 1, false);
+            loadClients(debouncedSearch, null, false);
         }
     }, [debouncedSearch, clientTab, currentUser, loadClients]);
 
     const handleLoadMore = () => {
-        const nextPage = page + 1;
-        setPage(nextPage);
-        loadClients(debouncedSearch, nextPage, true);
+        loadClients(debouncedSearch, nextCursor, true);
     };
 
     const handleDelete = async (id) => {
@@ -99,9 +97,19 @@ function ClientListPage() {
         }
     };
 
-    const handleEdit = (client) => {
-        setEditingClient(client);
-        setShowForm(true);
+    const handleEdit = async (client) => {
+        // A listagem traz só o resumo; o formulário precisa do cadastro completo
+        try {
+            const fullClient = await getClient(client.id);
+            if (!fullClient) {
+                alert('Cliente não encontrado.');
+                return;
+            }
+            setEditingClient(fullClient);
+            setShowForm(true);
+        } catch {
+            alert('Erro ao carregar cliente.');
+        }
     };
 
     const handleNewClient = () => {
@@ -131,8 +139,7 @@ function ClientListPage() {
                 setShowForm(false);
                 setEditingClient(null);
                 // Reload current state
-                loadClients(debouncedSearch, 1, false);
-                setPage(1);
+                loadClients(debouncedSearch, null, false);
             } else {
                 alert('Erro ao salvar cliente: ' + (result.error || 'Erro desconhecido'));
             }
@@ -153,8 +160,7 @@ function ClientListPage() {
             await deleteClient(clientId);
             setShowForm(false);
             setEditingClient(null);
-            loadClients(debouncedSearch, 1, false);
-            setPage(1);
+            loadClients(debouncedSearch, null, false);
         } catch {
             alert('Erro ao excluir cliente.');
         }
@@ -280,10 +286,10 @@ function ClientListPage() {
                                             </div>
                                         </td>
                                         <td className="cpf-cell">{formatCpfCnpj(client.cpf_cnpj)}</td>
-                                        <td>{formatPhone(client.data?.fone1_ddd_proponente, client.data?.fone1_numero_proponente)}</td>
+                                        <td>{formatPhone(client.fone_ddd, client.fone_numero)}</td>
                                         <td>
-                                            {client.data?.cidade_proponente && client.data?.uf_endereco_proponente
-                                                ? `${client.data.cidade_proponente} - ${client.data.uf_endereco_proponente}`
+                                            {client.cidade && client.uf
+                                                ? `${client.cidade} - ${client.uf}`
                                                 : '-'}
                                         </td>
                                         <td className="date-cell">
@@ -48,6 +48,11 @@ const requestWithRetry = async (fn, { retries = 2, baseDelay = 800 } = {}) => {
 // Request interceptor: em *.pages.dev usar URL absoluta para o Render (garante que a requisição vá ao backend)
 const RENDER_API = 'https://valleprimev2.onrender.com';
 api.interceptors.request.use(config => {
+  // Token também nas consultas: a API só devolve as obras permitidas ao usuário
+  const token = localStorage.getItem('valle_token');
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
   if (typeof window !== 'undefined' && config.url?.startsWith?.('/api/consulta')) {
     config.url = window.location.origin + config.url;
     config.baseURL = '';
@@ -57,10 +62,6 @@ api.interceptors.request.use(config => {
     config.url = RENDER_API + config.url; // URL absoluta → axios ignora baseURL
     config.baseURL = '';
   }
-  const token = localStorage.getItem('valle_token');
-  if (token) {
-    config.headers.Authorization = `Bearer ${token}`;
-  }
   return config;
 }, error => {
   return Promise.reject(error);
@@ -132,6 +133,7 @@ export const changeMyPassword = async (old_password, new_password) => {
 
 export const fetchAvailability = async (obraCode = '624') => {
   try {
+    // A Function do Pages confere token e obras e serve o snapshot da obra, ou repassa para a API
     const response = await requestWithRetry(() => api.get(`${API_BASE}/${obraCode}`, {
       params: { t: Date.now() },
       timeout: 60000
@@ -161,13 +163,23 @@ export const fetchAvailability = async (obraCode = '624') => {
   }
 };
 
-export const getClients = async ({ search = '', page = 1, limit = 50, type = '', created_by = '' } = {}) => {
+// Paginação por cursor: passe o next_cursor da resposta anterior para carregar a próxima página
+// view 'summary' (padrão) traz só as colunas da listagem; o cadastro completo vem de getClient(id)
+export const getClients = async ({ search = '', cursor = '', limit = 50, type = '', created_by = '', withCount = false, view = 'summary', filters = {}, sort = '', order = '' } = {}) => {
   try {
     const params = new URLSearchParams();
+    if (view) params.append('view', view);
     if (search) params.append('q', search);
     if (type) params.append('type', type);
     if (created_by) params.append('created_by', created_by);
-    params.append('page', page);
+    // Indexed fields: email, cidade, uf, estado_civil, telefone
+    Object.entries(filters).forEach(([field, value]) => {
+      if (value) params.append(field, value);
+    });
+    if (sort) params.append('sort', sort);
+    if (order) params.append('order', order);
+    if (cursor) params.append('cursor', cursor);
+    if (withCount) params.append('count', '1');
     params.append('limit', limit);
 
     const response = await api.get(`${CLIENT_BASE}?${params.toString()}`);
@@ -200,6 +212,17 @@ export const getClients = async ({ search = '', page = 1, limit = 50, type = '',
   }
 };
 
+// Cadastro completo (com `data` já decodificado), carregado ao abrir um cliente da lista
+export const getClient = async (id) => {
+  try {
+    const response = await api.get(`${CLIENT_BASE}/${id}`);
+    return response.data?.client || null;
+  } catch (error) {
+    console.error('Error fetching client:', error);
+    throw error;
+  }
+};
+
 export const saveClient = async (clientData) => {
   try {
     const clientId = clientData?.client_id || clientData?.id || null;
@@ -228,14 +251,24 @@ export const deleteClient = async (id) => {
   }
 };
 
-export const checkDuplicate = async (cpf, tipo = 'PF', clientId = null) => {
+// action: 'delete' | 'reassign' (created_by) | 'retype' (tipo_pessoa); pass ids or a filter
+export const bulkClients = async (action, { ids, filter, created_by, tipo_pessoa } = {}) => {
+  try {
+    const response = await api.post(`${CLIENT_BASE}/bulk`, { action, ids, filter, created_by, tipo_pessoa });
+    return response.data;
+  } catch (error) {
+    console.error('Error in bulk client operation:', error);
+    throw error;
+  }
+};
+
+// Vários CPFs/CNPJs numa chamada (ex.: titular e segundo): checks = [{ cpf_cnpj, tipo_pessoa, field }]
+export const checkDuplicates = async (checks, clientId = null) => {
   try {
-    let url = `${CLIENT_BASE}/check-duplicate?cpf_cnpj=${encodeURIComponent(cpf)}&tipo_pessoa=${tipo}`;
-    if (clientId) url += `&client_id=${clientId}`;
-    const response = await api.get(url);
-    return response.data; //{ exists: bool }
+    const response = await api.post(`${CLIENT_BASE}/check-duplicates`, { checks, client_id: clientId });
+    return response.data.results || []; // [{ exists, client_name, client_id, field }]
   } catch (e) {
     console.error("Duplicate check error", e);
-    return { exists: false };
+    return checks.map(check => ({ exists: false, field: check.field }));
   }
 }